@@ -113,7 +113,7 @@ class MediaUpload(APIView):
     
     def _log_media_upload(self, asset):
         """Ручное логирование загрузки медиа"""
-        from audits.models import AuditLog
+        from audits import sink
         
         context = get_audit_context()
         metadata = {
@@ -133,7 +133,7 @@ class MediaUpload(APIView):
                 pass
 
          # ⚡ СОЗДАЕМ ЛОГ
-        AuditLog.objects.create(
+        sink.log(
             actor_type=context.get('actor_type', 'system'),
             actor_id=context.get('actor_id'),
             action='upload_media',
@@ -224,7 +224,7 @@ class MediaDelete(APIView):
 
     def _log_media_delete(self, asset):
         """Ручное логирование удаления медиа"""
-        from audits.models import AuditLog
+        from audits import sink
         
         context = get_audit_context()
         metadata = {
@@ -242,7 +242,7 @@ class MediaDelete(APIView):
             except FamilyInvite.DoesNotExist:
                 pass
         
-        AuditLog.objects.create(
+        sink.log(
             actor_type=context.get('actor_type', 'system'),
             actor_id=context.get('actor_id'),
             action='delete_media',
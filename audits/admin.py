@@ -1,8 +1,50 @@
-from django.contrib import admin
-from .models import AuditLog
-from django.db.models import Q
+from datetime import datetime, timedelta
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from .models import AuditLog, AuditArchiveSegment, resolve_actor_displays
+from .archive import hot_cutoff
+from .export import export_lines, parse_export_filters
 from django.utils.translation import gettext_lazy as _
 
+
+def _partner_scope(request):
+    """
+    None - пользователь видит все записи (суперпользователь), иначе id партнёра
+    пользователя; False - пользователь не партнёр и записей не видит.
+    """
+    if request.user.is_superuser:
+        return None
+    from partners.models import PartnerUser
+    try:
+        return PartnerUser.objects.get(email=request.user.email).partner_id
+    except PartnerUser.DoesNotExist:
+        return False
+
+
+def _hierarchy_range(params):
+    """Диапазон [since, until) выбранного в date_hierarchy года/месяца/дня или None."""
+    try:
+        year = int(params['created_at__year'])
+        month = int(params.get('created_at__month', 0))
+        day = int(params.get('created_at__day', 0))
+    except (KeyError, ValueError):
+        return None
+    try:
+        if not month:
+            return timezone.make_aware(datetime(year, 1, 1)), timezone.make_aware(datetime(year + 1, 1, 1))
+        since = timezone.make_aware(datetime(year, month, day or 1))
+        if day:
+            return since, since + timedelta(days=1)
+        next_month = datetime(year + month // 12, month % 12 + 1, 1)
+    except (ValueError, OverflowError):
+        # Несуществующая дата (месяц 13, 30 февраля): changelist сам перенаправит на ?e=1
+        return None
+    return since, timezone.make_aware(next_month)
+
 # Регистрация модели аудита в админке
 @admin.register(AuditLog)
 class AuditLogAdmin(admin.ModelAdmin):
@@ -14,70 +56,84 @@ class AuditLogAdmin(admin.ModelAdmin):
     def actor_display(self, obj):
         return obj.get_actor_display()
     actor_display.short_description = 'Actor'
+
+    def get_changelist_instance(self, request):
+        # Акторы всей страницы - один запрос к User и один к PartnerUser
+        changelist = super().get_changelist_instance(request)
+        resolve_actor_displays(changelist.result_list)
+        return changelist
+
+    def get_urls(self):
+        return [
+            path('archive/', self.admin_site.admin_view(self.archive_view), name='audits_auditlog_archive'),
+        ] + super().get_urls()
+
+    def changelist_view(self, request, extra_context=None):
+        # Записи старше горячего окна уже в архиве: changelist их не покажет
+        selected = _hierarchy_range(request.GET)
+        if selected and selected[0] < hot_cutoff():
+            since, until = selected
+            url = (f"{reverse('admin:audits_auditlog_archive')}"
+                   f"?since={since:%Y-%m-%d}&until={until - timedelta(days=1):%Y-%m-%d}")
+            messages.info(request, format_html(
+                'Entries before {} are moved to the archive. <a href="{}">Download this range including '
+                'archived entries (JSONL)</a>', f"{hot_cutoff():%Y-%m-%d}", url,
+            ))
+        return super().changelist_view(request, extra_context)
+
+    def archive_view(self, request):
+        """JSONL с записями дней since..until (YYYY-MM-DD) из таблицы и архива."""
+        partner_id = _partner_scope(request)
+        if partner_id is False:
+            raise PermissionDenied
+        try:
+            since, until, _filters = parse_export_filters({'since': request.GET.get('since'), 'until': request.GET.get('until')})
+        except ValueError:
+            return HttpResponseBadRequest('since and until must be YYYY-MM-DD')
+        filters = {} if partner_id is None else {'partner_id': partner_id}
+
+        response = StreamingHttpResponse(
+            export_lines('jsonl', since=since, until=until, **filters), content_type='application/x-ndjson'
+        )
+        response['Content-Disposition'] = 'attachment; filename="audit-log.jsonl"'
+        return response
     
     def get_queryset(self, request):
         """Filters logs so that a partner can only see their own objects."""
         qs = super().get_queryset(request)
         
-        # Superuser видит всё
-        if request.user.is_superuser:
+        partner_id = _partner_scope(request)
+        if partner_id is None:
+            # Superuser видит всё
             return qs
-        
-        # Пытаемся получить объект партнёра для текущего пользователя
-        try:
-            from partners.models import PartnerUser
-            partner_user = PartnerUser.objects.get(email=request.user.email)
-        except PartnerUser.DoesNotExist:
+        if partner_id is False:
             # Если пользователь не партнёр, не показываем ему логи
             return qs.none()
-        
-        partner = partner_user.partner
-        
-        # ДЛЯ ОТЛАДКИ: выводим в консоль информацию о партнёре
-        #print(f"\n=== DEBUG: AuditLogAdmin.get_queryset ===")
-        #print(f"Partner: {partner.name} (ID: {partner.id})")
-        
-        # Импортируем модели (делаем это здесь, чтобы избежать циклических импортов)
-        from memorials.models import Memorial
-        from assets.models import MediaAsset
-        from tributes.models import Tribute
-        
-        # Получаем ID всех мемориалов этого партнёра
-        partner_memorial_ids = list(Memorial.objects.filter(
-            partner=partner
-        ).values_list('id', flat=True))
-        
-        # Получаем ID всех медиафайлов этого партнёра
-        partner_media_ids = list(MediaAsset.objects.filter(
-            memorial__partner=partner
-        ).values_list('id', flat=True))
-        
-        # Получаем ID всех трибутов этого партнёра
-        partner_tribute_ids = list(Tribute.objects.filter(
-            memorial__partner=partner
-        ).values_list('id', flat=True))
-        
-        # ДЛЯ ОТЛАДКИ: выводим списки ID
-        #print(f"Memorial IDs: {partner_memorial_ids}")
-        #print(f"Media IDs: {partner_media_ids}")
-        #print(f"Tribute IDs: {partner_tribute_ids}")
-        
-        # Строим комбинированный фильтр, но только для непустых списков
-        q_objects = Q()
-        
-        if partner_memorial_ids:
-            q_objects |= Q(target_type='memorial', target_id__in=partner_memorial_ids)
-        
-        if partner_media_ids:
-            q_objects |= Q(target_type='media', target_id__in=partner_media_ids)
-        
-        if partner_tribute_ids:
-            q_objects |= Q(target_type='tribute', target_id__in=partner_tribute_ids)
-        
-        # Если ни одного условия не добавлено, значит у партнёра нет объектов
-        if q_objects == Q():
-            #print("DEBUG: Partner has no objects, returning empty queryset")
+
+        # partner_id заполняется при записи (старые записи - manage.py backfill_audit_scope):
+        # один диапазон по индексу (partner_id, created_at) вместо списков ID объектов партнёра
+        return qs.filter(partner_id=partner_id)
+
+
+@admin.register(AuditArchiveSegment)
+class AuditArchiveSegmentAdmin(admin.ModelAdmin):
+    list_display = ('month', 'partner_id', 'entry_count', 'first_created_at', 'last_created_at', 'size_bytes')
+    list_filter = ('month',)
+    search_fields = ('partner_id', 'path')
+    date_hierarchy = 'month'
+    readonly_fields = [field.name for field in AuditArchiveSegment._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        partner_id = _partner_scope(request)
+        if partner_id is None:
+            return qs
+        if partner_id is False:
             return qs.none()
-        
-        #print(f"DEBUG: Applying filter: {q_objects}")
-        return qs.filter(q_objects)
\ No newline at end of file
+        return qs.filter(partner_id=partner_id)
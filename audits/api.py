@@ -0,0 +1,42 @@
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from everest.permissions import get_partner_user
+from .export import EXPORT_FORMATS, export_lines, parse_export_filters
+
+
+class AuditExport(APIView):
+    """
+    Потоковая выгрузка аудита: GET /api/audit/export/?output=csv|jsonl
+    &since=&until=&partner=&memorial=&actor_type=&action=
+    Партнёр получает только свои записи, суперпользователь - любые.
+    """
+
+    def get(self, request):
+        params = request.query_params
+        output = params.get('output', 'jsonl')
+        if output not in EXPORT_FORMATS:
+            return Response({'error': f"output must be one of {', '.join(EXPORT_FORMATS)}"}, status=400)
+
+        try:
+            since, until, filters = parse_export_filters(params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        if not request.user.is_superuser:
+            partner_user = get_partner_user(request)
+            if not partner_user:
+                return Response({'error': 'Not authorized'}, status=403)
+            if filters.get('partner_id', partner_user.partner_id) != partner_user.partner_id:
+                return Response({'error': 'Not authorized'}, status=403)
+            filters['partner_id'] = partner_user.partner_id
+
+        _, content_type, extension = EXPORT_FORMATS[output]
+        response = StreamingHttpResponse(
+            export_lines(output, since=since, until=until, **filters), content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="audit-log-{timezone.now():%Y%m%d-%H%M%S}.{extension}"'
+        )
+        return response
@@ -0,0 +1,212 @@
+import gzip
+import io
+import json
+import hashlib
+import heapq
+import logging
+from collections import defaultdict
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import AuditLog, AuditArchiveSegment
+
+logger = logging.getLogger(__name__)
+
+# Горячие записи аудита - в таблице AuditLog, записи старше hot_days - в сжатых
+# JSONL-сегментах на хранилище (один сегмент - месяц и партнёр, до batch_size
+# записей), AuditArchiveSegment - их индекс. Чтение диапазона дат
+# (iter_audit_entries) берёт сегменты, только если диапазон уходит за горячее окно.
+#
+# Порядок переноса: файл сегмента записывается до транзакции, в которой
+# создаётся AuditArchiveSegment и удаляются строки. При сбое между ними
+# остаётся файл без записи в индексе; строки остаются в таблице и попадут
+# в новый сегмент при следующем запуске - дублей при чтении нет.
+
+ARCHIVE_FIELDS = (
+    'id', 'actor_type', 'actor_id', 'action', 'target_type', 'target_id', 'metadata',
+    'partner_id', 'memorial_id', 'created_at',
+)
+
+
+def archive_settings():
+    return getattr(settings, 'AUDIT_ARCHIVE', {})
+
+
+def archive_storage():
+    return storages[archive_settings().get('storage', 'default')]
+
+
+def hot_cutoff(now=None):
+    """Записи с created_at раньше этого момента подлежат архивации."""
+    return (now or timezone.now()) - timedelta(days=archive_settings().get('hot_days', 180))
+
+
+def month_start(moment):
+    moment = timezone.localtime(moment) if timezone.is_aware(moment) else moment
+    return date(moment.year, moment.month, 1)
+
+
+def _segment_name(month, partner_id, rows):
+    prefix = archive_settings().get('prefix', 'audit_archive').strip('/')
+    partner = f"partner-{partner_id}" if partner_id is not None else 'no-partner'
+    return f"{prefix}/{month:%Y/%m}/{partner}/{rows[0]['id']}-{rows[-1]['id']}.jsonl.gz"
+
+
+def _write_segment(month, partner_id, rows):
+    """Сжимает строки в файл хранилища; возвращает несохранённый AuditArchiveSegment."""
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb', mtime=0) as gz:
+        for row in rows:
+            # isoformat, а не DjangoJSONEncoder: он обрезает время до миллисекунд
+            row = dict(row, created_at=row['created_at'].isoformat())
+            gz.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False).encode('utf-8'))
+            gz.write(b'\n')
+    data = buffer.getvalue()
+    path = archive_storage().save(_segment_name(month, partner_id, rows), ContentFile(data))
+    return AuditArchiveSegment(
+        month=month,
+        partner_id=partner_id,
+        path=path,
+        entry_count=len(rows),
+        first_created_at=rows[0]['created_at'],
+        last_created_at=rows[-1]['created_at'],
+        first_id=rows[0]['id'],
+        last_id=rows[-1]['id'],
+        size_bytes=len(data),
+        sha256=hashlib.sha256(data).hexdigest(),
+    )
+
+
+def archive_batch(cutoff, batch_size):
+    """
+    Переносит до batch_size самых старых записей до cutoff в сегменты.
+    Возвращает число перенесённых записей (0 - архивировать нечего).
+    """
+    rows = list(
+        AuditLog.objects.filter(created_at__lt=cutoff)
+        .order_by('created_at', 'id')
+        .values(*ARCHIVE_FIELDS)[:batch_size]
+    )
+    if not rows:
+        return 0
+
+    groups = defaultdict(list)
+    for row in rows:
+        groups[(month_start(row['created_at']), row['partner_id'])].append(row)
+
+    segments = [_write_segment(month, partner_id, group) for (month, partner_id), group in groups.items()]
+    ids = [row['id'] for row in rows]
+    with transaction.atomic():
+        AuditArchiveSegment.objects.bulk_create(segments)
+        for start in range(0, len(ids), 500):
+            AuditLog.objects.filter(id__in=ids[start:start + 500]).delete()
+    return len(rows)
+
+
+def archive_old_entries(max_batches=None):
+    """Архивирует записи старше горячего окна; возвращает их число."""
+    options = archive_settings()
+    cutoff = hot_cutoff()
+    batch_size = options.get('batch_size', 5000)
+    max_batches = max_batches or options.get('max_batches_per_run', 20)
+    archived = 0
+    for _ in range(max_batches):
+        moved = archive_batch(cutoff, batch_size)
+        archived += moved
+        if moved < batch_size:
+            break
+    return archived
+
+
+# ===== ЧТЕНИЕ =====
+
+def _read_segment(segment):
+    with archive_storage().open(segment.path, 'rb') as f:
+        with gzip.GzipFile(fileobj=f, mode='rb') as gz:
+            for line in gz:
+                if line.strip():
+                    data = json.loads(line)
+                    data['created_at'] = parse_datetime(data['created_at'])
+                    yield AuditLog(**data)
+
+
+def _entry_key(entry):
+    return entry.created_at, entry.id
+
+
+def _matches(entry, since, until, filters):
+    if since is not None and entry.created_at < since:
+        return False
+    if until is not None and entry.created_at >= until:
+        return False
+    return all(getattr(entry, field) == value for field, value in filters.items())
+
+
+def iter_archived_entries(since=None, until=None, **filters):
+    """
+    Записи из сегментов архива с since <= created_at < until в порядке
+    (created_at, id); filters - равенство полей AuditLog (partner_id,
+    memorial_id, actor_type, action...). Одновременно открыты только
+    сегменты одного месяца, память не зависит от объёма архива.
+    """
+    segments = AuditArchiveSegment.objects.order_by('month', 'first_created_at', 'first_id')
+    if since is not None:
+        segments = segments.filter(last_created_at__gte=since)
+    if until is not None:
+        segments = segments.filter(first_created_at__lt=until)
+    if 'partner_id' in filters:
+        segments = segments.filter(partner_id=filters['partner_id'])
+
+    by_month = defaultdict(list)
+    for segment in segments:
+        by_month[segment.month].append(segment)
+
+    for month in sorted(by_month):
+        # Сегменты месяца (по партнёрам и пачкам) отсортированы каждый; слияние сохраняет порядок
+        merged = heapq.merge(*(_read_segment(segment) for segment in by_month[month]), key=_entry_key)
+        for entry in merged:
+            if _matches(entry, since, until, filters):
+                yield entry
+
+
+def iter_hot_entries(queryset, chunk_size=2000):
+    """
+    Записи queryset в порядке (created_at, id) страницами по chunk_size:
+    каждая страница - отдельный запрос "после последней (created_at, id)"
+    по индексу, без OFFSET и без курсора, открытого на весь экспорт.
+    """
+    queryset = queryset.order_by('created_at', 'id')
+    last = None
+    while True:
+        page = queryset
+        if last is not None:
+            page = page.filter(Q(created_at__gt=last.created_at) | Q(created_at=last.created_at, id__gt=last.id))
+        count = 0
+        for entry in page[:chunk_size].iterator(chunk_size=chunk_size):
+            count += 1
+            last = entry
+            yield entry
+        if count < chunk_size:
+            return
+
+
+def iter_audit_entries(since=None, until=None, chunk_size=2000, **filters):
+    """
+    Записи аудита за диапазон дат из архива и таблицы в порядке (created_at, id).
+    Архив читается, только если since раньше горячего окна (или не задан).
+    """
+    if since is None or since < hot_cutoff():
+        yield from iter_archived_entries(since=since, until=until, **filters)
+
+    queryset = AuditLog.objects.filter(**filters)
+    if since is not None:
+        queryset = queryset.filter(created_at__gte=since)
+    if until is not None:
+        queryset = queryset.filter(created_at__lt=until)
+    yield from iter_hot_entries(queryset, chunk_size=chunk_size)
@@ -0,0 +1,129 @@
+import csv
+import json
+from datetime import datetime, time, timedelta
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .archive import ARCHIVE_FIELDS, iter_audit_entries
+from .models import resolve_actor_displays
+
+# Выгрузка аудита (API /api/audit/export/, manage.py export_audit_log, админка):
+# записи читаются страницами по (created_at, id) и сразу пишутся в ответ,
+# память не зависит от числа записей
+
+EXPORT_FIELDS = ARCHIVE_FIELDS + ('actor_display',)
+
+# Записей на один запрос акторов и предел кэша строк акторов за выгрузку
+ACTOR_BATCH = 500
+ACTOR_CACHE_SIZE = 10000
+
+# Фильтр выгрузки -> поле AuditLog
+FILTER_FIELDS = {
+    'partner': 'partner_id',
+    'memorial': 'memorial_id',
+    'actor_type': 'actor_type',
+    'action': 'action',
+}
+INTEGER_FILTERS = {'partner', 'memorial'}
+
+
+def parse_moment(value, end=False):
+    """
+    Дата (YYYY-MM-DD) или дата-время ISO 8601. Дата в until означает
+    конец этого дня (until включает его целиком).
+    """
+    if not value:
+        return None
+    # Сначала дата: parse_datetime принимает и 'YYYY-MM-DD' как полночь
+    day = parse_date(value)
+    if day is not None:
+        moment = datetime.combine(day, time.min)
+        if end:
+            moment += timedelta(days=1)
+    else:
+        moment = parse_datetime(value)
+        if moment is None:
+            raise ValueError(f"Invalid date: {value}")
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def parse_export_filters(params):
+    """
+    since/until и фильтры выгрузки из GET-параметров или опций команды.
+    Возвращает (since, until, filters) для iter_audit_entries; ValueError
+    при неверном значении.
+    """
+    filters = {}
+    for name, field in FILTER_FIELDS.items():
+        value = params.get(name)
+        if value in (None, ''):
+            continue
+        if name in INTEGER_FILTERS:
+            try:
+                value = int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{name} must be an integer")
+        filters[field] = value
+    since = parse_moment(params.get('since'))
+    until = parse_moment(params.get('until'), end=True)
+    return since, until, filters
+
+
+def with_actor_displays(entries, batch_size=ACTOR_BATCH):
+    """Записи с проставленной строкой актора, по пачкам batch_size."""
+    cache = {}
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            yield from resolve_actor_displays(batch, cache)
+            batch = []
+            if len(cache) > ACTOR_CACHE_SIZE:
+                cache.clear()
+    if batch:
+        yield from resolve_actor_displays(batch, cache)
+
+
+def _row(entry):
+    row = {field: getattr(entry, field) for field in ARCHIVE_FIELDS}
+    row['actor_display'] = entry.get_actor_display()
+    return row
+
+
+def render_jsonl(entries):
+    for entry in entries:
+        row = _row(entry)
+        row['created_at'] = row['created_at'].isoformat()
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class _Echo:
+    """Файл для csv.writer, который возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def render_csv(entries):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for entry in entries:
+        row = _row(entry)
+        row['created_at'] = row['created_at'].isoformat()
+        row['metadata'] = json.dumps(row['metadata'], cls=DjangoJSONEncoder, ensure_ascii=False)
+        yield writer.writerow([row[field] for field in EXPORT_FIELDS])
+
+
+# формат -> (генератор строк, Content-Type, расширение файла)
+EXPORT_FORMATS = {
+    'jsonl': (render_jsonl, 'application/x-ndjson', 'jsonl'),
+    'csv': (render_csv, 'text/csv; charset=utf-8', 'csv'),
+}
+
+
+def export_lines(output='jsonl', since=None, until=None, chunk_size=2000, **filters):
+    """Строки выгрузки в формате output, включая записи из архива."""
+    render = EXPORT_FORMATS[output][0]
+    return render(with_actor_displays(iter_audit_entries(since=since, until=until, chunk_size=chunk_size, **filters)))
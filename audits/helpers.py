@@ -1,4 +1,4 @@
-from .models import AuditLog
+from . import sink
 from .decorators import get_web_audit_context
 
 def log_web_action(action, target_type, target_id, **metadata):
@@ -11,7 +11,7 @@ def log_web_action(action, target_type, target_id, **metadata):
             metadata['family_invite_id'] = context['family_invite_id']
             metadata['family_email'] = context['family_email']
     
-    return AuditLog.objects.create(
+    return sink.log(
         actor_type=context.get('actor_type', 'system'),
         actor_id=context.get('actor_id'),
         action=action,
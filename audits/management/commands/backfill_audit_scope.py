@@ -0,0 +1,48 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from audits.models import AuditLog
+from audits.sink import fill_scope
+
+
+class Command(BaseCommand):
+    help = ('Fill AuditLog.partner_id and memorial_id for entries written before the columns existed, '
+            'in id-ordered chunks')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Entries per chunk and transaction')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Pause between chunks, seconds')
+        parser.add_argument('--dry-run', action='store_true', help='Count what would be filled without saving')
+
+    def handle(self, *args, **options):
+        queryset = AuditLog.objects.filter(partner_id__isnull=True).order_by('id')
+        batch_size = options['batch_size']
+        last_id = 0
+        scanned = filled = 0
+
+        # Курсор по id: записи, для которых объект уже удалён, остаются пустыми
+        # и не выбираются повторно
+        while True:
+            chunk = list(queryset.filter(id__gt=last_id).only(
+                'id', 'target_type', 'target_id', 'metadata', 'partner_id', 'memorial_id'
+            )[:batch_size])
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+            scanned += len(chunk)
+
+            fill_scope(chunk)
+            resolved = [entry for entry in chunk if entry.partner_id is not None or entry.memorial_id is not None]
+            filled += sum(entry.partner_id is not None for entry in resolved)
+            if resolved and not options['dry_run']:
+                with transaction.atomic():
+                    AuditLog.objects.bulk_update(resolved, ['partner_id', 'memorial_id'])
+
+            self.stdout.write(f"  up to id {last_id}: scanned {scanned}, partner found for {filled}")
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        verb = 'Would fill' if options['dry_run'] else 'Filled'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} partner_id for {filled} of {scanned} entries; {scanned - filled} have no resolvable target"
+        ))
@@ -0,0 +1,92 @@
+import os
+import random
+import time
+import tracemalloc
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from audits.export import EXPORT_FORMATS, export_lines
+from audits.models import AuditLog
+
+BENCH_ACTION = 'bench_audit_export'
+
+
+class Command(BaseCommand):
+    help = ('Seed AuditLog rows and measure export throughput and peak Python memory (tracemalloc) '
+            'at growing export sizes: peak memory should stay flat')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000, help='Rows to seed, e.g. 3000000')
+        parser.add_argument('--steps', type=int, default=3, help='Export 1/steps, 2/steps ... of the rows')
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows after the run')
+        parser.add_argument('--force', action='store_true', help='Allow running with DEBUG=False')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError("Refusing to seed benchmark audit rows with DEBUG=False (use --force)")
+
+        # Строки, оставленные прошлым запуском с --keep, используются повторно;
+        # всё засеянное (в том числе при прерванном засеве) удаляется в finally
+        try:
+            existing = AuditLog.objects.filter(action=BENCH_ACTION).count()
+            if existing < options['rows']:
+                self._seed(options['rows'] - existing)
+
+            for step in range(1, options['steps'] + 1):
+                limit = options['rows'] * step // options['steps']
+                self._measure(limit, options)
+        finally:
+            if not options['keep']:
+                self._cleanup()
+
+    def _seed(self, count):
+        rnd = random.Random(count)
+        started = timezone.now() - timedelta(days=30)
+        batch = 10000
+        for start in range(0, count, batch):
+            AuditLog.objects.bulk_create([
+                AuditLog(
+                    actor_type=rnd.choice(('family', 'guest', 'partner_user', 'system')),
+                    actor_id=rnd.randint(1, 500),
+                    action=BENCH_ACTION,
+                    target_type='tribute',
+                    target_id=number,
+                    metadata={'memorial_id': number % 1000, 'token_preview': 'abcdefgh...', 'gdpr_relevant': True},
+                    partner_id=number % 20,
+                    memorial_id=number % 1000,
+                    created_at=started + timedelta(seconds=number),
+                )
+                for number in range(start, min(start + batch, count))
+            ])
+            self.stderr.write(f"  seeded {min(start + batch, count)}/{count}")
+
+    def _measure(self, limit, options):
+        first = AuditLog.objects.filter(action=BENCH_ACTION).order_by('created_at', 'id').values_list('created_at', flat=True)
+        since = first.first()
+        until = first[limit - 1] + timedelta(microseconds=1)
+
+        tracemalloc.start()
+        started = time.monotonic()
+        rows = 0
+        with open(os.devnull, 'w', encoding='utf-8') as devnull:
+            for line in export_lines(options['format'], since=since, until=until,
+                                     chunk_size=options['chunk_size'], action=BENCH_ACTION):
+                devnull.write(line)
+                rows += 1
+        elapsed = time.monotonic() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        if options['format'] == 'csv':
+            rows -= 1
+        self.stdout.write(
+            f"{rows} rows ({options['format']}) in {elapsed:.1f}s ({rows / elapsed:.0f} rows/s), "
+            f"peak Python memory {peak / 1024 / 1024:.1f} MiB"
+        )
+
+    def _cleanup(self):
+        # Без сигналов и связей delete() - один DELETE
+        AuditLog.objects.filter(action=BENCH_ACTION).delete()
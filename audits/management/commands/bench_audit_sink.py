@@ -0,0 +1,98 @@
+import math
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+from audits import sink
+from audits.models import AuditLog
+from memorials.models import FamilyInvite, Memorial
+from partners.models import Partner
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = ('Request the family page repeatedly in each AUDIT_SINK mode and compare requests/sec, '
+            'latency and the number of audit rows written')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Requests per mode')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--mode', choices=sink.MODES, action='append',
+                            help='Mode to measure, repeatable (default: all)')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded partner and audit rows')
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        partner = Partner.objects.create(
+            name=f'Audit bench {run_id}',
+            legal_name=f'Audit bench {run_id}',
+            billing_email=f'audit-bench-{run_id}@example.invalid',
+        )
+        memorial = Memorial.objects.create(
+            partner=partner,
+            first_name='Hans',
+            last_name='Müller',
+            slug=f'audit-bench-{run_id}',
+            short_code=f'ab{run_id}',
+            family_contact_email='family@example.invalid',
+            status='active',
+        )
+        invite = FamilyInvite.objects.create(
+            memorial=memorial, email='family@example.invalid', expires_at=timezone.now() + timedelta(days=1),
+        )
+        url = f'/memorials/{memorial.short_code}/family/?token={invite.token}'
+
+        try:
+            for mode in options['mode'] or sink.MODES:
+                with tempfile.TemporaryDirectory() as spool_dir:
+                    self._run(mode, spool_dir, url, memorial, options)
+        finally:
+            if not options['keep']:
+                AuditLog.objects.filter(target_type='memorial', target_id=memorial.id).delete()
+                partner.delete()
+
+    def _run(self, mode, spool_dir, url, memorial, options):
+        audit_settings = dict(sink.sink_settings(), mode=mode, spool_dir=spool_dir)
+        before = AuditLog.objects.filter(target_id=memorial.id, action='access_family_interface').count()
+        latencies = []
+
+        def get(number):
+            client = Client()
+            started = time.monotonic()
+            response = client.get(url)
+            latencies.append((time.monotonic() - started) * 1000)
+            close_old_connections()
+            return response.status_code
+
+        with override_settings(AUDIT_SINK=audit_settings):
+            # Новый фоновый поток на прогон: интервал и spool_dir из настроек режима
+            sink._writer = None
+            Client().get(url)  # прогрев шаблонов и соединения, в замер не входит
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                statuses = list(executor.map(get, range(options['requests'])))
+            elapsed = time.monotonic() - started
+            if mode == 'async':
+                sink.get_writer().stop()
+                sink._writer = None
+
+        written = AuditLog.objects.filter(target_id=memorial.id, action='access_family_interface').count() - before
+        latencies.sort()
+        errors = sum(status != 200 for status in statuses)
+        self.stdout.write(
+            f"{mode}: {options['requests'] / elapsed:.1f} req/s, p50 {_percentile(latencies, 50):.1f} ms, "
+            f"p95 {_percentile(latencies, 95):.1f} ms, errors {errors}, "
+            f"audit rows {written} (expected {options['requests'] + 1})"
+        )
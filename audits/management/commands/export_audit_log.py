@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from audits.export import EXPORT_FORMATS, export_lines, parse_export_filters
+
+
+class Command(BaseCommand):
+    help = 'Stream AuditLog entries (including archived ones) as CSV or JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='jsonl')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+        parser.add_argument('--since', help='YYYY-MM-DD or ISO 8601 date-time, inclusive')
+        parser.add_argument('--until', help='YYYY-MM-DD (whole day included) or ISO 8601 date-time, exclusive')
+        parser.add_argument('--partner', type=int)
+        parser.add_argument('--memorial', type=int)
+        parser.add_argument('--actor-type')
+        parser.add_argument('--action')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows per keyset page')
+
+    def handle(self, *args, **options):
+        try:
+            since, until, filters = parse_export_filters(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        lines = export_lines(options['format'], since=since, until=until, chunk_size=options['chunk_size'], **filters)
+        if not options['output']:
+            for line in lines:
+                self.stdout.write(line, ending='')
+            return
+
+        count = 0
+        with open(options['output'], 'w', encoding='utf-8', newline='') as f:
+            for line in lines:
+                f.write(line)
+                count += 1
+        if options['format'] == 'csv':
+            count -= 1  # заголовок
+        self.stderr.write(f"Exported {count} entries to {options['output']}")
@@ -1,4 +1,4 @@
-from .models import AuditLog
+from . import sink
 import threading
 
 class AuditManager:
@@ -33,7 +33,7 @@ class AuditManager:
                     actor_type = 'superuser'
                     actor_id = request.user.id
         
-        return AuditLog.objects.create(
+        return sink.log(
             actor_type=actor_type,
             actor_id=actor_id,
             action=action,
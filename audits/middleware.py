@@ -3,6 +3,7 @@ from django.utils.deprecation import MiddlewareMixin
 from memorials.models import FamilyInvite
 from django.utils import timezone
 from django.contrib.auth.middleware import get_user 
+from . import sink
 
 # Хранилище для текущего запроса (thread-safe)
 _request_local = threading.local()
@@ -11,6 +12,8 @@ class AuditMiddleware(MiddlewareMixin):
     """Middleware для определения контекста запроса и аудита"""
     
     def process_request(self, request):
+        # Записи аудита запроса пишутся одной пачкой в process_response
+        sink.begin()
 
         current_user = get_user(request)
         # Сохраняем пользователя и запрос
@@ -106,6 +109,7 @@ class AuditMiddleware(MiddlewareMixin):
         for attr in ['user', 'request', 'context']:
             if hasattr(_request_local, attr):
                 delattr(_request_local, attr)
+        sink.end()
         return response
 
 
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from partners.models import PartnerUser 
 from django.contrib.auth.models import User 
 from django.utils.translation import gettext_lazy as _
@@ -18,7 +19,12 @@ class AuditLog(models.Model):
     target_type = models.CharField(max_length=24)
     target_id = models.BigIntegerField()
     metadata = models.JSONField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Партнёр и мемориал объекта действия (заполняет audits.sink при записи,
+    # старые записи - backfill_audit_scope): выборка партнёра без списков target_id
+    partner_id = models.BigIntegerField(null=True, blank=True)
+    memorial_id = models.BigIntegerField(null=True, blank=True)
+    # Время действия, а не INSERT: audits.sink пишет записи пачками после запроса
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
 
     class Meta:
         verbose_name = _('Audit Log')
@@ -26,9 +32,18 @@ class AuditLog(models.Model):
         indexes = [
             models.Index(fields=['created_at']),
             models.Index(fields=['actor_type', 'actor_id']),
+            models.Index(fields=['partner_id', 'created_at']),
+            models.Index(fields=['target_type', 'target_id']),
         ]
     # Метод для отображения актора в админке
     def get_actor_display(self):
+        # Строку заранее проставляет resolve_actor_displays для страницы записей
+        if not hasattr(self, '_actor_display'):
+            resolve_actor_displays([self])
+        return self._actor_display
+
+    def _format_actor(self, users, partner_users):
+        """Строка актора по заранее загруженным User и PartnerUser (словари id -> объект)."""
         if self.actor_type == 'family':
             token = self.metadata.get('token_preview', 'unknown')
             email = self.metadata.get('family_email', '')
@@ -38,32 +53,19 @@ class AuditLog(models.Model):
             return "Guest"
 
         elif self.actor_type == 'user' and self.actor_id:
-            try:
-                from django.contrib.auth import get_user_model
-                User = get_user_model()
-                user = User.objects.get(id=self.actor_id)
-                return f"{user.email}"  # Просто email, без ID
-            except User.DoesNotExist:
-                return f"User ID: {self.actor_id}"  
+            user = users.get(self.actor_id)
+            return f"{user.email}" if user else f"User ID: {self.actor_id}"  # Просто email, без ID
 
         elif self.actor_type == 'partner_user' and self.actor_id:
-            try:
-                pu = PartnerUser.objects.get(id=self.actor_id)
-                return f"{pu.email} (Partner)"
-            except PartnerUser.DoesNotExist:
-                return f"PartnerUser ID: {self.actor_id}"
+            pu = partner_users.get(self.actor_id)
+            return f"{pu.email} (Partner)" if pu else f"PartnerUser ID: {self.actor_id}"
 
         elif self.actor_type == 'system':
             return "System"
 
         elif self.actor_type == 'superuser':
-            try:
-                from django.contrib.auth import get_user_model
-                User = get_user_model()
-                user = User.objects.get(id=self.actor_id)
-                return f"{user.email} (Superuser)"
-            except User.DoesNotExist:
-                return f"Superuser ID: {self.actor_id}"
+            user = users.get(self.actor_id)
+            return f"{user.email} (Superuser)" if user else f"Superuser ID: {self.actor_id}"
 
         elif self.actor_id:
             return f"{self.actor_type} ID: {self.actor_id}"
@@ -71,4 +73,70 @@ class AuditLog(models.Model):
         return self.actor_type
 
     def __str__(self):
-        return f"{self.action} by {self.get_actor_display()} on {self.target_type}#{self.target_id}"
\ No newline at end of file
+        return f"{self.action} by {self.get_actor_display()} on {self.target_type}#{self.target_id}"
+
+
+# Типы актора, для которых строка берётся из User / PartnerUser по actor_id
+_USER_ACTORS = ('user', 'superuser')
+_PARTNER_USER_ACTORS = ('partner_user',)
+
+
+def resolve_actor_displays(entries, cache=None):
+    """
+    Проставляет строку актора всем записям страницы: User и PartnerUser
+    загружаются одним запросом на модель, а не запросом на запись.
+    cache - словарь (actor_type, actor_id) -> строка, общий для нескольких
+    страниц (выгрузка); строки family зависят от metadata и не кэшируются.
+    Возвращает entries.
+    """
+    from django.contrib.auth import get_user_model
+
+    cache = {} if cache is None else cache
+    entries = list(entries) if not isinstance(entries, (list, tuple)) else entries
+    user_ids, partner_user_ids = set(), set()
+    for entry in entries:
+        if (entry.actor_type, entry.actor_id) in cache or not entry.actor_id:
+            continue
+        if entry.actor_type in _USER_ACTORS:
+            user_ids.add(entry.actor_id)
+        elif entry.actor_type in _PARTNER_USER_ACTORS:
+            partner_user_ids.add(entry.actor_id)
+
+    users = get_user_model().objects.in_bulk(user_ids) if user_ids else {}
+    partner_users = PartnerUser.objects.in_bulk(partner_user_ids) if partner_user_ids else {}
+
+    for entry in entries:
+        key = (entry.actor_type, entry.actor_id)
+        if key in cache:
+            entry._actor_display = cache[key]
+            continue
+        entry._actor_display = entry._format_actor(users, partner_users)
+        if entry.actor_type != 'family':
+            cache[key] = entry._actor_display
+    return entries
+
+# Сегмент архива аудита: записи одного месяца и партнёра, перенесённые
+# из AuditLog в сжатый JSONL на хранилище (audits.archive)
+class AuditArchiveSegment(models.Model):
+    month = models.DateField()                                   # первое число месяца created_at записей
+    partner_id = models.BigIntegerField(null=True, blank=True)
+    path = models.CharField(max_length=255, unique=True)          # имя файла в хранилище
+    entry_count = models.PositiveIntegerField()
+    first_created_at = models.DateTimeField()
+    last_created_at = models.DateTimeField()
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    size_bytes = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = _('Audit Archive Segment')
+        verbose_name_plural = _('Audit Archive Segments')
+        indexes = [
+            models.Index(fields=['month', 'partner_id']),
+            models.Index(fields=['partner_id', 'month']),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} partner {self.partner_id}: {self.entry_count} entries"
@@ -2,6 +2,7 @@ from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.contenttypes.models import ContentType
 from .models import AuditLog
+from . import sink
 from memorials.models import Memorial, FamilyInvite
 from tributes.models import Tribute
 from assets.models import MediaAsset
@@ -78,70 +79,82 @@ def log_tribute_moderation(sender, instance, created, **kwargs):
             actor_type, actor_id = _get_actor_info()
             metadata['access_type'] = 'partner_admin'
         
-        AuditLog.objects.create(
+        sink.log(
             actor_type=actor_type,
             actor_id=actor_id,
             action='create_tribute',
             target_type='tribute',
             target_id=instance.id,
-            metadata=metadata
+            metadata=metadata,
+            partner_id=instance.memorial.partner_id,
+            memorial_id=instance.memorial_id,
         )
         return
     
     # ЛОГИРОВАНИЕ МОДЕРАЦИИ
     if hasattr(instance, 'tracker') and instance.tracker.has_changed('status'):
-        old_status = instance.tracker.previous('status')
-        new_status = instance.status
-        
+        sink.record(tribute_status_audit_log(
+            instance, instance.tracker.previous('status'), instance.status
+        ))
+
+
+def tribute_status_audit_log(instance, old_status, new_status):
+    """
+    Несохранённая запись 'moderate_tribute' о смене статуса трибьюта.
+    Используется сигналом и пакетным Tribute.apply_ai_verdicts (bulk_update не шлёт post_save).
+    """
+    context = get_request_context()
+    actor_type, actor_id = _get_actor_info()
+    metadata = {
+        'memorial_id': instance.memorial.id,
+        'memorial_code': instance.memorial.short_code,
+        'old_status': old_status,
+        'new_status': new_status,
+        'gdpr_relevant': True
+    }
+    
+    if context.get('is_family_invite'):
+        # Семья получила приглашение (например, через API)
         actor_type, actor_id = _get_actor_info()
-        metadata = {
-            'memorial_id': instance.memorial.id,
-            'memorial_code': instance.memorial.short_code,
-            'old_status': old_status,
-            'new_status': new_status,
-            'gdpr_relevant': True
-        }
+        metadata['access_type'] = 'family_invite'
         
-        if context.get('is_family_invite'):
-            # Семья получила приглашение (например, через API)
-            actor_type, actor_id = _get_actor_info()
-            metadata['access_type'] = 'family_invite'
-            
-            family_token = get_family_token()
-            
-            if family_token:
-                # Безопасно логируем (обрезанный токен)
-                safe_token = family_token[:8] + '...' if len(family_token) > 8 else '***'
-                
-                # Пытаемся найти FamilyInvite для деталей
-                try:
-                    invite = FamilyInvite.objects.get(token=family_token)
-                    metadata.update({
-                        'family_invite_id': invite.id,
-                        'family_email': invite.email,
-                        'token_preview': safe_token,
-                    })
-                except FamilyInvite.DoesNotExist:
-                    metadata['token_preview'] = safe_token
-            
-        elif context.get('is_partner_access'):
-            # ПАРТНЕР одобрил через админку
-            actor_type, actor_id = _get_actor_info()
-            metadata['access_type'] = 'partner_admin'
+        family_token = get_family_token()
+        
+        if family_token:
+            # Безопасно логируем (обрезанный токен)
+            safe_token = family_token[:8] + '...' if len(family_token) > 8 else '***'
             
-        elif instance.moderated_by_user:
-            # Партнер через API или другую систему
-            actor_type, actor_id = _get_actor_info()
-            metadata['access_type'] = 'api_or_system'
+            # Пытаемся найти FamilyInvite для деталей
+            try:
+                invite = FamilyInvite.objects.get(token=family_token)
+                metadata.update({
+                    'family_invite_id': invite.id,
+                    'family_email': invite.email,
+                    'token_preview': safe_token,
+                })
+            except FamilyInvite.DoesNotExist:
+                metadata['token_preview'] = safe_token
         
-        AuditLog.objects.create(
-            actor_type=actor_type,
-            actor_id=actor_id,
-            action='moderate_tribute',
-            target_type='tribute',
-            target_id=instance.id,
-            metadata=metadata
-        )
+    elif context.get('is_partner_access'):
+        # ПАРТНЕР одобрил через админку
+        actor_type, actor_id = _get_actor_info()
+        metadata['access_type'] = 'partner_admin'
+        
+    elif instance.moderated_by_user_id:
+        # Партнер через API или другую систему
+        actor_type, actor_id = _get_actor_info()
+        metadata['access_type'] = 'api_or_system'
+    
+    return AuditLog(
+        actor_type=actor_type,
+        actor_id=actor_id,
+        action='moderate_tribute',
+        target_type='tribute',
+        target_id=instance.id,
+        metadata=metadata,
+        partner_id=instance.memorial.partner_id,
+        memorial_id=instance.memorial_id,
+    )
 
 
 @receiver(post_save, sender=Memorial)
@@ -161,13 +174,15 @@ def log_memorial_change(sender, instance, created, **kwargs):
         actor_type, actor_id = _get_actor_info()
         metadata['access_type'] = 'partner_admin'
     
-    AuditLog.objects.create(
+    sink.log(
         actor_type=actor_type,
         actor_id=actor_id,
         action=action,
         target_type='memorial',
         target_id=instance.id,
-        metadata=metadata
+        metadata=metadata,
+        partner_id=instance.partner_id,
+        memorial_id=instance.id,
     )
 
 
@@ -205,11 +220,13 @@ def log_media_access(sender, instance, created, **kwargs):
     elif context.get('is_partner_access'):
         actor_type, actor_id = _get_actor_info()
     
-    AuditLog.objects.create(
+    sink.log(
         actor_type=actor_type,
         actor_id=actor_id,
         action='upload_media',
         target_type='media',
         target_id=instance.id,
-        metadata=metadata
+        metadata=metadata,
+        partner_id=instance.memorial.partner_id,
+        memorial_id=instance.memorial_id,
     )
\ No newline at end of file
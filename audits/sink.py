@@ -0,0 +1,368 @@
+import os
+import json
+import time
+import uuid
+import atexit
+import logging
+import threading
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, transaction
+from django.utils.dateparse import parse_datetime
+from .models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+# Запись аудита без отдельного INSERT на каждое действие.
+#
+# immediate - как раньше: save() сразу (для сравнения и отката);
+# on_commit - записи копятся в буфере запроса или задачи (begin/end, см.
+#             AuditMiddleware и сигналы Celery) и пишутся одним bulk_create
+#             после коммита транзакции, в которой были созданы;
+# async     - пачка записей сохраняется в файл в spool_dir, фоновый поток
+#             процесса переносит файлы в БД одним bulk_create на много запросов.
+#
+# Запись из откатившейся транзакции не сохраняется. Если БД недоступна,
+# записи остаются в spool_dir и переносятся позже (drain_audit_spool):
+# гарантия at-least-once, при сбое между INSERT и удалением файла
+# записи могут повториться.
+
+MODES = ('immediate', 'on_commit', 'async')
+_FIELDS = ('actor_type', 'actor_id', 'action', 'target_type', 'target_id', 'metadata', 'partner_id', 'memorial_id')
+
+_local = threading.local()
+
+
+def sink_settings():
+    return getattr(settings, 'AUDIT_SINK', {})
+
+
+def _mode():
+    mode = sink_settings().get('mode', 'on_commit')
+    if mode not in MODES:
+        raise ValueError(f"Unknown AUDIT_SINK mode: {mode}")
+    return mode
+
+
+def log(**fields):
+    """Создаёт запись AuditLog через буфер; аргументы - поля AuditLog."""
+    return record(AuditLog(**fields))
+
+
+def record(entry):
+    """
+    Ставит несохранённую запись AuditLog на запись. Внутри транзакции запись
+    попадает в буфер только после её коммита. Возвращает ту же запись
+    (id появляется после записи, в режиме async - не появляется).
+    """
+    if _mode() == 'immediate':
+        fill_scope([entry])
+        entry.save()
+        return entry
+
+    _defer([entry])
+    return entry
+
+
+def record_many(entries):
+    """
+    Пакетный вариант record для списка несохранённых записей: в режиме
+    immediate - один bulk_create, иначе записи идут в буфер вместе.
+    """
+    entries = list(entries)
+    if not entries:
+        return entries
+    if _mode() == 'immediate':
+        AuditLog.objects.bulk_create(fill_scope(entries))
+        return entries
+
+    _defer(entries)
+    return entries
+
+
+def _defer(entries):
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(lambda: _accept(entries))
+    else:
+        _accept(entries)
+
+
+def _accept(entries):
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is not None:
+        buffer.extend(entries)
+    else:
+        _write(entries)
+
+
+def begin():
+    """Открывает буфер потока; вложенные begin/end присоединяются к внешнему."""
+    _local.depth = getattr(_local, 'depth', 0) + 1
+    if _local.depth == 1:
+        _local.buffer = []
+
+
+def end():
+    """Закрывает буфер; внешний end пишет накопленные записи."""
+    depth = getattr(_local, 'depth', 0)
+    if depth == 0:
+        return
+    _local.depth = depth - 1
+    if _local.depth == 0:
+        entries, _local.buffer = _local.buffer, None
+        if entries:
+            _write(entries)
+
+
+@contextmanager
+def buffered():
+    """with buffered(): ... - все записи блока одним bulk_create в конце."""
+    begin()
+    try:
+        yield
+    finally:
+        end()
+
+
+def _write(entries):
+    if _mode() == 'async':
+        # partner_id/memorial_id заполнит фоновый поток (drain_spool)
+        get_writer().submit(entries)
+        return
+    try:
+        AuditLog.objects.bulk_create(fill_scope(entries))
+    except Exception:
+        # Запрос не должен падать из-за аудита: записи дождутся drain_audit_spool
+        logger.exception("Audit write of %s entries failed, spooling to disk", len(entries))
+        spool(entries)
+
+
+# ===== ПАРТНЁР И МЕМОРИАЛ ЗАПИСИ =====
+
+def _memorial_of_targets():
+    from memorials.models import FamilyInvite
+    from tributes.models import Tribute
+    from assets.models import MediaAsset
+
+    return {'tribute': Tribute, 'media': MediaAsset, 'family_invite': FamilyInvite}
+
+
+def fill_scope(entries):
+    """
+    Заполняет memorial_id и partner_id записей, где их не передали: по объекту
+    действия или metadata['memorial_id']. Не больше одного запроса на тип
+    объекта и одного к Memorial на пачку; если объект уже удалён, поля
+    остаются пустыми.
+    """
+    from memorials.models import Memorial
+
+    targets = _memorial_of_targets()
+    pending = [entry for entry in entries if entry.partner_id is None or entry.memorial_id is None]
+    if not pending:
+        return entries
+
+    lookups = {}
+    for entry in pending:
+        if entry.memorial_id is not None:
+            continue
+        metadata = entry.metadata if isinstance(entry.metadata, dict) else {}
+        if entry.target_type == 'memorial':
+            entry.memorial_id = entry.target_id
+        elif metadata.get('memorial_id'):
+            entry.memorial_id = metadata['memorial_id']
+        elif entry.target_type in targets:
+            lookups.setdefault(entry.target_type, set()).add(entry.target_id)
+
+    memorial_by_target = {}
+    for target_type, ids in lookups.items():
+        rows = targets[target_type].objects.filter(id__in=ids).values_list('id', 'memorial_id')
+        memorial_by_target.update({(target_type, pk): memorial_id for pk, memorial_id in rows})
+
+    memorial_ids = set()
+    for entry in pending:
+        if entry.memorial_id is None:
+            entry.memorial_id = memorial_by_target.get((entry.target_type, entry.target_id))
+        if entry.partner_id is None and entry.memorial_id is not None:
+            memorial_ids.add(entry.memorial_id)
+
+    if memorial_ids:
+        partners = dict(Memorial.objects.filter(id__in=memorial_ids).values_list('id', 'partner_id'))
+        for entry in pending:
+            if entry.partner_id is None and entry.memorial_id is not None:
+                entry.partner_id = partners.get(entry.memorial_id)
+    return entries
+
+
+# ===== SPOOL: файлы с записями, ещё не перенесёнными в БД =====
+
+def _spool_dir():
+    return str(sink_settings().get('spool_dir', os.path.join(settings.BASE_DIR, 'var', 'audit_spool')))
+
+
+def _entry_to_dict(entry):
+    data = {field: getattr(entry, field) for field in _FIELDS}
+    # isoformat, а не DjangoJSONEncoder: он обрезает время до миллисекунд
+    data['created_at'] = entry.created_at.isoformat()
+    return data
+
+
+def spool(entries):
+    """Атомарно сохраняет записи в файл spool_dir; возвращает путь."""
+    directory = _spool_dir()
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.time_ns()}-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl"
+    tmp_path = os.path.join(directory, f".{name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(_entry_to_dict(entry), cls=DjangoJSONEncoder, ensure_ascii=False))
+            f.write('\n')
+    path = os.path.join(directory, name)
+    os.replace(tmp_path, path)
+    return path
+
+
+def _read_spool_file(path):
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                data = json.loads(line)
+                data['created_at'] = parse_datetime(data['created_at'])
+                entries.append(AuditLog(**data))
+    return entries
+
+
+def drain_spool(max_batch=None, stale_seconds=None):
+    """
+    Переносит файлы spool_dir в БД пачками до max_batch записей. Файл сначала
+    переименовывается (захват), поэтому процессы не переносят его дважды;
+    захваченные файлы упавших процессов старше stale_seconds возвращаются
+    в очередь. Возвращает число записанных записей.
+    """
+    options = sink_settings()
+    max_batch = max_batch or options.get('max_batch', 500)
+    stale_seconds = stale_seconds or options.get('stale_claim_seconds', 300)
+    directory = _spool_dir()
+    if not os.path.isdir(directory):
+        return 0
+
+    suffix = f".inflight-{os.getpid()}"
+    now = time.time()
+    names = sorted(os.listdir(directory))
+    for name in names:
+        if '.inflight-' in name:
+            path = os.path.join(directory, name)
+            try:
+                if now - os.path.getmtime(path) > stale_seconds:
+                    os.replace(path, os.path.join(directory, name.split('.inflight-')[0]))
+            except OSError:
+                pass
+
+    written = 0
+    pending = sorted(name for name in os.listdir(directory) if name.endswith('.jsonl'))
+    while pending:
+        claimed, entries = [], []
+        while pending and len(entries) < max_batch:
+            name = pending.pop(0)
+            path = os.path.join(directory, name)
+            try:
+                os.replace(path, path + suffix)
+                # rename сохраняет mtime файла: без touch давно ждущий файл
+                # выглядел бы захваченным упавшим процессом сразу после захвата
+                os.utime(path + suffix)
+                entries.extend(_read_spool_file(path + suffix))
+            except FileNotFoundError:
+                continue  # файл забрал другой процесс
+            claimed.append(path)
+        if not claimed:
+            break
+        try:
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(fill_scope(entries))
+        except Exception:
+            for path in claimed:
+                try:
+                    os.replace(path + suffix, path)
+                except FileNotFoundError:
+                    pass  # уже возвращён в очередь как устаревший
+            raise
+        for path in claimed:
+            try:
+                os.remove(path + suffix)
+            except FileNotFoundError:
+                # Другой процесс счёл захват устаревшим и вернул файл в очередь:
+                # его записи будут перенесены повторно (at-least-once)
+                logger.warning("Audit spool file %s was reclaimed while being drained", path)
+        written += len(entries)
+    return written
+
+
+class AuditWriter:
+    """
+    Фоновый поток режима async: раз в flush_interval_seconds (или сразу,
+    когда накопилось max_batch записей) переносит spool в БД. Один на процесс,
+    после fork создаётся заново (см. get_writer).
+    """
+
+    def __init__(self, flush_interval=1.0, max_batch=500):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending = 0
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, entries):
+        spool(entries)
+        self._pending += len(entries)
+        if self._pending >= self.max_batch:
+            self._wake.set()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._drain()
+
+    def _drain(self):
+        self._pending = 0
+        try:
+            close_old_connections()
+            drain_spool(self.max_batch)
+        except Exception:
+            logger.exception("Audit writer could not drain the spool, retrying in %ss", self.flush_interval)
+        finally:
+            close_old_connections()
+
+    def stop(self):
+        """Останавливает поток и переносит оставшиеся файлы."""
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout=10)
+        self._drain()
+
+
+_writer = None
+_writer_pid = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    global _writer, _writer_pid
+
+    pid = os.getpid()
+    if _writer is not None and _writer_pid == pid:
+        return _writer
+
+    with _writer_lock:
+        if _writer is None or _writer_pid != pid:
+            options = sink_settings()
+            _writer = AuditWriter(
+                flush_interval=options.get('flush_interval_seconds', 1.0),
+                max_batch=options.get('max_batch', 500),
+            )
+            _writer_pid = pid
+            atexit.register(_writer.stop)
+    return _writer
@@ -0,0 +1,32 @@
+import logging
+from celery import shared_task
+from . import sink
+from .archive import archive_settings, archive_old_entries
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def drain_audit_spool():
+    """
+    Переносит в БД записи аудита из AUDIT_SINK['spool_dir']: пачки, которые
+    не удалось записать сразу, и файлы процессов, завершившихся до записи.
+    """
+    written = sink.drain_spool()
+    if written:
+        logger.info("Drained %s audit entries from the spool", written)
+    return f"Drained {written} audit entries"
+
+
+@shared_task
+def archive_audit_logs():
+    """
+    Переносит записи аудита старше AUDIT_ARCHIVE['hot_days'] из таблицы
+    в сжатые сегменты на хранилище (audits.archive).
+    """
+    if not archive_settings().get('enabled', False):
+        return "Audit archive is disabled"
+    archived = archive_old_entries()
+    if archived:
+        logger.info("Archived %s audit entries", archived)
+    return f"Archived {archived} audit entries"
@@ -0,0 +1,282 @@
+import os
+import shutil
+import tempfile
+import json
+import time
+import tracemalloc
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from . import sink
+from .archive import archive_old_entries, hot_cutoff, iter_audit_entries, iter_hot_entries
+from .export import export_lines
+from .models import AuditArchiveSegment, AuditLog
+
+
+def make_entries(count, action='test_entry', **fields):
+    return [
+        AuditLog(actor_type='system', action=action, target_type='memorial', target_id=number, metadata={}, **fields)
+        for number in range(count)
+    ]
+
+
+class RecordManyTests(TestCase):
+
+    @override_settings(AUDIT_SINK={'mode': 'on_commit'})
+    def test_written_once_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            sink.record_many(make_entries(5))
+            self.assertFalse(AuditLog.objects.filter(action='test_entry').exists())
+        self.assertEqual(len(callbacks), 1)
+        with self.assertNumQueries(2):  # partner_id по memorial_id и один INSERT
+            callbacks[0]()
+        self.assertEqual(AuditLog.objects.filter(action='test_entry').count(), 5)
+
+    @override_settings(AUDIT_SINK={'mode': 'on_commit'})
+    def test_joins_open_buffer(self):
+        # Пачка и одиночная запись из одного запроса - один INSERT при sink.end()
+        with self.assertNumQueries(2):
+            with sink.buffered():
+                with self.captureOnCommitCallbacks(execute=True):
+                    sink.record_many(make_entries(3))
+                    sink.log(actor_type='system', action='test_entry', target_type='memorial', target_id=99, metadata={})
+        self.assertEqual(AuditLog.objects.filter(action='test_entry').count(), 4)
+
+    @override_settings(AUDIT_SINK={'mode': 'immediate'})
+    def test_immediate_mode_writes_at_once(self):
+        with self.assertNumQueries(2):
+            sink.record_many(make_entries(4))
+        self.assertEqual(AuditLog.objects.filter(action='test_entry').count(), 4)
+
+
+class DrainSpoolTests(TestCase):
+
+    def setUp(self):
+        self.spool_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool_dir)
+        settings_override = override_settings(AUDIT_SINK={'mode': 'on_commit', 'spool_dir': self.spool_dir})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_old_file_is_not_stale_once_claimed(self):
+        path = sink.spool(make_entries(3, action='spooled'))
+        hour_ago = time.time() - 3600
+        os.utime(path, (hour_ago, hour_ago))
+
+        ages = []
+        read_spool_file = sink._read_spool_file
+
+        def read_and_check(claimed_path):
+            ages.append(time.time() - os.path.getmtime(claimed_path))
+            return read_spool_file(claimed_path)
+
+        with mock.patch('audits.sink._read_spool_file', side_effect=read_and_check):
+            self.assertEqual(sink.drain_spool(stale_seconds=300), 3)
+        self.assertLess(ages[0], 300)
+        self.assertEqual(os.listdir(self.spool_dir), [])
+
+    def test_reclaimed_file_is_not_an_error(self):
+        path = sink.spool(make_entries(2, action='spooled'))
+        fill_scope = sink.fill_scope
+
+        def reclaim_and_fill(entries):
+            # Другой процесс вернул захваченный файл в очередь во время записи
+            claimed = [name for name in os.listdir(self.spool_dir) if '.inflight-' in name]
+            os.replace(os.path.join(self.spool_dir, claimed[0]), path)
+            return fill_scope(entries)
+
+        with mock.patch('audits.sink.fill_scope', side_effect=reclaim_and_fill):
+            self.assertEqual(sink.drain_spool(), 2)
+        self.assertEqual(os.listdir(self.spool_dir), [os.path.basename(path)])
+
+
+class ExportPaginationTests(TestCase):
+    """Выгрузка читает таблицу страницами по (created_at, id) с фиксированным числом запросов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user('auditor', 'auditor@example.invalid')
+        start = timezone.now() - timedelta(days=1)
+        # По три записи на один момент: страницы режут группы с одинаковым created_at
+        entries = make_entries(23, action='exported', actor_id=user.id)
+        for number, entry in enumerate(entries):
+            entry.actor_type = 'user' if number % 2 else 'system'
+            entry.created_at = start + timedelta(seconds=number // 3)
+        AuditLog.objects.bulk_create(entries[::-1])
+        cls.ids = list(AuditLog.objects.filter(action='exported').order_by('created_at', 'id').values_list('id', flat=True))
+
+    def test_keyset_pages_return_every_row_once(self):
+        queryset = AuditLog.objects.filter(action='exported')
+        for chunk_size in (1, 3, 5, 23, 100):
+            with self.subTest(chunk_size=chunk_size):
+                ids = [entry.id for entry in iter_hot_entries(queryset, chunk_size=chunk_size)]
+                self.assertEqual(ids, self.ids)
+
+    def test_one_query_per_page(self):
+        queryset = AuditLog.objects.filter(action='exported')
+        # 23 строки по 5: четыре полные страницы и одна неполная
+        with self.assertNumQueries(5):
+            list(iter_hot_entries(queryset, chunk_size=5))
+        # 25 строк по 5: после пятой полной страницы - пустой запрос
+        AuditLog.objects.bulk_create(make_entries(2, action='exported'))
+        with self.assertNumQueries(6):
+            list(iter_hot_entries(queryset, chunk_size=5))
+
+    def test_export_queries_do_not_depend_on_row_count(self):
+        # Индекс архива + страницы таблицы + пользователи пачками по 500 записей
+        with self.assertNumQueries(1 + 3 + 1):
+            lines = list(export_lines('jsonl', chunk_size=10, action='exported'))
+        self.assertEqual([json.loads(line)['id'] for line in lines], self.ids)
+        self.assertEqual(json.loads(lines[1])['actor_display'], 'auditor@example.invalid')
+
+        with self.assertNumQueries(1 + 1 + 1):
+            rows = list(export_lines('csv', chunk_size=100, action='exported'))
+        self.assertEqual(len(rows), len(self.ids) + 1)
+
+
+class ExportMemoryTests(TestCase):
+    """
+    Пиковая память выгрузки не растёт с числом строк. Тот же замер
+    на миллионах строк - manage.py bench_audit_export.
+    """
+
+    CHUNK_SIZE = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        start = timezone.now() - timedelta(days=1)
+        entries = make_entries(30 * cls.CHUNK_SIZE, action='memory')
+        for number, entry in enumerate(entries):
+            entry.created_at = start + timedelta(milliseconds=number)
+            entry.metadata = {'memorial_id': number, 'token_preview': 'abcdefgh...', 'note': 'x' * 200}
+        AuditLog.objects.bulk_create(entries, batch_size=500)
+
+    def peak_memory(self, rows):
+        since = AuditLog.objects.filter(action='memory').order_by('created_at').values_list('created_at', flat=True)
+        until = since[rows - 1] + timedelta(microseconds=1)
+        lines = export_lines('csv', since=since[0], until=until, chunk_size=self.CHUNK_SIZE, action='memory')
+        tracemalloc.start()
+        try:
+            count = sum(1 for _ in lines)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        self.assertEqual(count, rows + 1)
+        return peak
+
+    def test_peak_memory_does_not_grow_with_rows(self):
+        # Обе выгрузки больше пачки акторов (ACTOR_BATCH записей держится в памяти)
+        small = self.peak_memory(10 * self.CHUNK_SIZE)
+        large = self.peak_memory(30 * self.CHUNK_SIZE)
+        # В 3 раза больше строк: если бы выгрузка копила строки, пик вырос бы так же
+        self.assertLess(large, small * 1.2, f"peak {small} -> {large} bytes")
+
+
+class ArchiveRoundTripTests(TestCase):
+    """Записи, перенесённые в архив, читаются вместе с горячими без потерь и повторов."""
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        storages = dict(settings.STORAGES, audit_archive_test={
+            'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': location},
+        })
+        settings_override = override_settings(
+            STORAGES=storages,
+            AUDIT_ARCHIVE={'storage': 'audit_archive_test', 'hot_days': 180, 'batch_size': 4, 'max_batches_per_run': 100},
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_export_across_hot_cutoff(self):
+        cutoff = hot_cutoff()
+        # Два месяца архива и горячие записи, два партнёра, одинаковые created_at
+        moments = [cutoff - timedelta(days=days) for days in (45, 45, 44, 12, 12, 3)] + [cutoff + timedelta(days=5)] * 3
+        entries = []
+        for number, moment in enumerate(moments):
+            for partner_id in (1, 2):
+                entry = make_entries(1, action='archived', partner_id=partner_id)[0]
+                entry.target_id, entry.created_at = number, moment
+                entries.append(entry)
+        AuditLog.objects.bulk_create(entries[::-1])
+        rows = list(AuditLog.objects.filter(action='archived').order_by('created_at', 'id').values_list('id', 'partner_id'))
+        expected = [pk for pk, _partner_id in rows]
+
+        self.assertEqual(archive_old_entries(), 12)
+        self.assertEqual(AuditLog.objects.filter(action='archived').count(), 6)
+        self.assertGreater(AuditArchiveSegment.objects.count(), 2)
+
+        ids = [entry.id for entry in iter_audit_entries(since=cutoff - timedelta(days=60), action='archived', chunk_size=2)]
+        self.assertEqual(ids, expected)
+        partner_ids = [entry.id for entry in iter_audit_entries(action='archived', partner_id=2)]
+        self.assertEqual(partner_ids, [pk for pk, partner_id in rows if partner_id == 2])
+
+
+# Сессия, пользователь, два COUNT, страница, date_hierarchy (2) и list_filter (2);
+# строки акторов добавляют по запросу на таблицу (User, PartnerUser), а не на строку
+CHANGELIST_QUERIES = 9
+
+
+class AuditLogChangelistTests(TestCase):
+    """Строка актора в админке загружается пачкой: запросов столько же при любом числе акторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        from partners.models import Partner, PartnerUser
+
+        User = get_user_model()
+        cls.superuser = User.objects.create_superuser('audit-admin', 'audit-admin@example.invalid', None)
+        partner = Partner.objects.create(name='Audit', legal_name='Audit', billing_email='audit@example.invalid')
+        users = [User.objects.create_user(f'audit-user-{i}', f'user-{i}@example.invalid') for i in range(10)]
+        partner_users = PartnerUser.objects.bulk_create([
+            PartnerUser(partner=partner, email=f'partner-{i}@example.invalid', password_hash='!', role='admin')
+            for i in range(10)
+        ])
+        # Акторы чередуются, чтобы на странице были и User, и PartnerUser
+        actors = [('superuser', cls.superuser.id), ('family', None), ('system', None)]
+        for user, partner_user in zip(users, partner_users):
+            actors[1:1] = [('user', user.id), ('partner_user', partner_user.id)]
+        AuditLog.objects.bulk_create(
+            [AuditLog(actor_type='user', actor_id=users[0].id, action='single_actor', target_type='memorial',
+                      target_id=i, metadata={}) for i in range(50)]
+            + [AuditLog(actor_type=actors[i % len(actors)][0], actor_id=actors[i % len(actors)][1],
+                        action='many_actors', target_type='memorial', target_id=i,
+                        metadata={'token_preview': 'abcdefgh...', 'family_email': 'family@example.invalid'})
+               for i in range(50)]
+        )
+
+    def setUp(self):
+        self.client.force_login(self.superuser)
+        self.url = reverse('admin:audits_auditlog_changelist')
+        model_admin = admin.site._registry[AuditLog]
+        list_per_page = model_admin.list_per_page
+        model_admin.list_per_page = 50
+        self.addCleanup(setattr, model_admin, 'list_per_page', list_per_page)
+
+    def get(self, action):
+        response = self.client.get(self.url, {'action': action})
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_query_count_does_not_depend_on_actors(self):
+        self.get('single_actor')  # сессия, ContentType и т.п. - вне замера
+        with self.assertNumQueries(CHANGELIST_QUERIES + 1):
+            self.get('single_actor')
+        # 21 разный актор на странице: всё так же по одному запросу на User и PartnerUser
+        with self.assertNumQueries(CHANGELIST_QUERIES + 2):
+            response = self.get('many_actors')
+        self.assertContains(response, 'partner-9@example.invalid')
+        self.assertContains(response, 'user-9@example.invalid')
+
+    def test_invalid_hierarchy_date_redirects(self):
+        for params in ({'created_at__year': 2024, 'created_at__month': 13},
+                       {'created_at__year': 2024, 'created_at__month': 2, 'created_at__day': 30}):
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 302)
+                self.assertTrue(response['Location'].endswith('?e=1'))
@@ -1,2 +1,6 @@
 from django.urls import path
-urlpatterns = []
+from .api import AuditExport
+
+urlpatterns = [
+    path('api/audit/export/', AuditExport.as_view(), name='audit-export'),
+]
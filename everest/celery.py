@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import task_postrun, task_prerun, worker_process_shutdown, worker_ready
 from django.conf import settings
 
 # Устанавливаем переменную окружения для настроек Django
@@ -21,4 +22,35 @@ app.autodiscover_tasks()
 
 @app.task(bind=True, ignore_result=True)
 def debug_task(self):
-    print(f'Request: {self.request!r}')
\ No newline at end of file
+    print(f'Request: {self.request!r}')
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    """
+    В multiprocess-режиме prometheus_client метрики каждого процесса лежат
+    в PROMETHEUS_MULTIPROC_DIR; gauge завершившегося воркера больше не учитываются.
+    """
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+@worker_ready.connect
+def warm_up_ollama_on_start(sender=None, **kwargs):
+    """
+    Воркер готов: ставим прогрев Ollama в очередь, чтобы первый трибьют
+    после деплоя не ждал загрузки модели. Выполняется дочерним процессом.
+    """
+    if settings.AI_MODERATION_SETTINGS.get('warmup', {}).get('on_worker_start', False):
+        from tributes.tasks import warm_up_ollama
+        warm_up_ollama.delay()
+
+@task_prerun.connect
+def begin_audit_buffer(**kwargs):
+    """Записи аудита задачи пишутся одной пачкой после её завершения."""
+    from audits import sink
+    sink.begin()
+
+@task_postrun.connect
+def flush_audit_buffer(**kwargs):
+    from audits import sink
+    sink.end()
@@ -0,0 +1,85 @@
+import atexit
+import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# Обработчики выбранных логгеров (файлы, консоль) переносятся в фоновый поток:
+# воркер только кладёт запись в очередь, форматирование и запись на диск
+# выполняет QueueListener. Один слушатель на каждый набор обработчиков,
+# чтобы у tributes и audits остались свои файлы.
+
+_listeners = []
+_queue_handlers = []
+_installed = False
+
+
+class LocalQueueHandler(QueueHandler):
+    """
+    QueueHandler для очереди внутри процесса. Стандартный prepare() форматирует
+    запись целиком (ради pickle); здесь подставляются только аргументы, чтобы
+    сообщение не зависело от объектов, изменённых после вызова логгера, а
+    форматтер, asctime и трейсбек остаются слушателю.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        self.queue.put_nowait(record)
+
+
+def install_queue_logging(logger_names):
+    """
+    Подменяет обработчики логгеров logger_names одним LocalQueueHandler на
+    каждый набор обработчиков и запускает слушателей. Повторный вызов ничего не делает.
+    """
+    global _installed
+    if _installed:
+        return
+    _installed = True
+
+    by_handlers = {}
+    for name in logger_names:
+        target_logger = logging.getLogger(name)
+        handlers = tuple(target_logger.handlers)
+        if not handlers:
+            continue
+        if handlers not in by_handlers:
+            event_queue = queue.SimpleQueue()
+            queue_handler = LocalQueueHandler(event_queue)
+            listener = QueueListener(event_queue, *handlers, respect_handler_level=True)
+            by_handlers[handlers] = queue_handler
+            _queue_handlers.append(queue_handler)
+            _listeners.append(listener)
+            listener.start()
+        for handler in handlers:
+            target_logger.removeHandler(handler)
+        target_logger.addHandler(by_handlers[handlers])
+
+    atexit.register(stop_queue_logging)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def _restart_after_fork():
+    """
+    Поток слушателя не переживает fork (prefork-воркеры Celery, gunicorn):
+    в дочернем процессе создаются новые очереди и слушатели, иначе записи
+    копились бы в очереди без читателя.
+    """
+    for queue_handler, listener in zip(_queue_handlers, _listeners):
+        event_queue = queue.SimpleQueue()
+        queue_handler.queue = event_queue
+        listener.queue = event_queue
+        listener._thread = None
+        listener.start()
+
+
+def stop_queue_logging():
+    """Дописывает оставшиеся записи при завершении процесса."""
+    for listener in _listeners:
+        if listener._thread is not None:
+            listener.stop()
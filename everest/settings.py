@@ -246,6 +246,8 @@ LOGIN_URL = '/admin/login/'
 # НАСТРОЙКИ ДЛЯ ИИ-МОДЕРАЦИИ 
 # Настройки Ollama (для локальной модели)
 OLLAMA_API_URL = os.environ.get('OLLAMA_API_URL', 'http://localhost:11434/api/generate')
+# Несколько серверов Ollama через запятую; пусто - используется только OLLAMA_API_URL
+OLLAMA_API_URLS = [url.strip() for url in os.environ.get('OLLAMA_API_URLS', '').split(',') if url.strip()]
 OLLAMA_MODEL = os.environ.get('OLLAMA_MODEL', 'phi3:latest')
 
 # Настройки Celery для фоновых задач
@@ -260,7 +262,79 @@ AI_MODERATION_SETTINGS = {
     'auto_moderate_new': True,
     'max_retries': 3,
     'timeout_seconds': 60,
+    # Предохранитель Ollama: после failure_threshold ошибок подряд запросы
+    # не отправляются reset_timeout_seconds, новая работа откладывается
+    'circuit_breaker': {
+        'enabled': True,
+        'failure_threshold': 5,
+        'reset_timeout_seconds': 60,
+        'probe_timeout_seconds': 90,
+        # Скорость разбора отложенной работы после восстановления
+        'drain_batch_size': 10,
+        'drain_interval_seconds': 30,
+    },
+    # Асинхронный воркер (manage.py run_async_moderation) - альтернатива Celery
+    'async_runner': {
+        'max_in_flight': 16,
+        'batch_size': 20,
+        'db_threads': 4,
+        'poll_interval_seconds': 5,
+    },
+    # Аренда трибьюта воркером: пока не истекла, повторная постановка в очередь игнорируется
+    'lease_seconds': 300,
+    # Потоковый ответ Ollama: чтение прекращается после первого полного JSON-объекта
+    'stream_responses': True,
+    # Локальный классификатор (manage.py train_preclassifier): очевидные трибьюты
+    # решаются без ИИ, остальные уходят в Ollama
+    'preclassifier': {
+        'enabled': False,               # включить после обучения и проверки точности
+        'model_path': BASE_DIR / 'var' / 'preclassifier.json',
+        'min_confidence': 0.98,
+        'decide_labels': ['approved'],  # отклонение остаётся за ИИ и модераторами
+        'max_text_length': 400,         # длинные тексты всегда проверяет ИИ
+    },
+    # Модель держится в памяти Ollama keep_alive после каждого запроса; прогрев
+    # при старте воркера и периодический пинг не дают ей выгрузиться между редкими трибьютами
+    'warmup': {
+        'on_worker_start': True,
+        'keep_alive': '30m',
+        'ping_interval_seconds': 600,   # меньше keep_alive
+    },
+    # Логирование модерации: обработчики логгеров queue_loggers работают в фоновом
+    # потоке (everest/log_queue.py). Отладочные дампы ответа ИИ пишутся для доли
+    # debug_dump_sample_rate трибьютов (при уровне DEBUG - для всех)
+    'logging': {
+        'queue_loggers': ['tributes', 'tributes.tasks', 'audits'],
+        'debug_dump_sample_rate': 1.0 if DEBUG else 0.01,
+    },
     'languages': ['de', 'fr', 'it', 'en'],
+
+    # Маршрутизация (tributes/routing.py): модель, вариант промпта (full/compact)
+    # и бюджет генерации по длине текста, языку и контексту имён. Выбирается первый
+    # подходящий маршрут, без совпадения - default. Неопределённый язык - 'unknown'
+    'routing': {
+        'enabled': False,
+        'routes': [
+            {
+                'name': 'short',
+                'max_chars': 200,
+                'languages': ['de', 'fr', 'it', 'en'],
+                'name_contexts': ['correct_name', 'no_name', 'partial_name_first_only', 'partial_name_last_only'],
+                'model': os.environ.get('OLLAMA_SMALL_MODEL', OLLAMA_MODEL),
+                'prompt_variant': 'compact',
+                'num_predict': 160,
+                'max_text_chars': 400,
+            },
+        ],
+        # Длинные, неоднозначные тексты и ошибки в именах - большая модель с полным промптом
+        'default': {
+            'name': 'default',
+            'model': OLLAMA_MODEL,
+            'prompt_variant': 'full',
+            'num_predict': 600,
+            'max_text_chars': 2000,
+        },
+    },
     
     # Пороги уверенности для авто-действий
     'confidence_thresholds': {
@@ -279,10 +353,131 @@ AI_MODERATION_SETTINGS = {
         'min_name_length': 2,
         'check_for_test_names': True,
     },
-    
-    
+
+    # Пакетная модерация: новые трибьюты не отправляются в Celery по одному,
+    # а собираются задачей flush_moderation_batch каждые flush_interval_seconds
+    'batch': {
+        'enabled': False,
+        'size': 20,
+        'flush_interval_seconds': 30,
+        'max_concurrency': 4,           # одновременных запросов к Ollama
+    },
+
+    # Справедливое распределение модерации между партнёрами: новые трибьюты
+    # не отправляются в Celery сразу, их ставит в очередь dispatch_fair_share
+    # (или выбирает flush_moderation_batch в пакетном режиме) по deficit round robin
+    'fair_share': {
+        'enabled': False,
+        'dispatch_interval_seconds': 5,
+        'max_in_flight': 32,                        # всего в очереди moderation и в работе
+        'default_weight': 1.0,
+        'weights': {},                              # {partner_id: вес}, 2.0 - двойная доля
+        'default_max_in_flight_per_partner': None,  # None - без лимита на партнёра
+        'max_in_flight_per_partner': {},            # {partner_id: лимит}
+    },
+
+    # HTTP-клиент Ollama: пул keep-alive соединений на процесс воркера
+    'ollama_client': {
+        'pool_connections': 4,
+        'pool_maxsize': 8,              # также лимит одновременных запросов на процесс
+        'connect_timeout': 3.05,
+        'read_timeout': 60,
+    },
+
+    # Распределение запросов между серверами OLLAMA_API_URLS (состояние - в каждом процессе)
+    'ollama_pool': {
+        'max_in_flight_per_endpoint': None,   # None - ollama_client.pool_maxsize
+        'ewma_alpha': 0.3,                    # вес нового замера в средней задержке
+        'failure_threshold': 3,               # ошибок подряд до исключения сервера
+        'down_seconds': 30,
+        'probe_interval_seconds': 60,         # простаивающий сервер снова пробуется
+    },
+
+    # Кэш вердиктов ИИ по нормализованному тексту + контексту имён + модели/версии промпта
+    'verdict_cache': {
+        'enabled': True,
+        'max_entries': 10000,           # LRU в памяти процесса
+        'ttl_seconds': 7 * 24 * 3600,
+        'use_django_cache': True,       # общий кэш между воркерами (Redis в продакшене)
+    },
+}
+
+# Запись AuditLog (audits/sink.py): 'on_commit' - одна пачка на запрос или задачу
+# после коммита, 'async' - пачки через spool_dir и фоновый поток, 'immediate' - INSERT сразу
+AUDIT_SINK = {
+    'mode': os.environ.get('AUDIT_SINK_MODE', 'on_commit'),
+    'spool_dir': BASE_DIR / 'var' / 'audit_spool',   # записи, ещё не попавшие в БД
+    'flush_interval_seconds': 1.0,                  # режим async: как часто поток пишет в БД
+    'max_batch': 500,                               # записей в одном bulk_create
+    'stale_claim_seconds': 300,                     # захваченный упавшим процессом файл снова в очереди
+    'drain_interval_seconds': 60,                   # drain_audit_spool в Celery beat
 }
 
+# Архив аудита (audits/archive.py): записи старше hot_days переносятся из AuditLog
+# в сжатые JSONL-сегменты (месяц + партнёр) на хранилище STORAGES[storage]
+AUDIT_ARCHIVE = {
+    'enabled': False,
+    'hot_days': 180,
+    'storage': 'default',
+    'prefix': 'audit_archive',
+    'batch_size': 5000,             # записей за одну транзакцию
+    'max_batches_per_run': 20,
+    'interval_seconds': 3600,       # archive_audit_logs в Celery beat
+}
+
+CELERY_BEAT_SCHEDULE = {
+    'flush-ai-moderation-batch': {
+        'task': 'tributes.tasks.flush_moderation_batch',
+        'schedule': AI_MODERATION_SETTINGS['batch']['flush_interval_seconds'],
+    },
+    'drain-parked-ai-moderation': {
+        'task': 'tributes.tasks.drain_parked_moderation',
+        'schedule': AI_MODERATION_SETTINGS['circuit_breaker']['drain_interval_seconds'],
+    },
+    # Gauge очереди ИИ-модерации для /metrics. Метрики воркеров попадают в /metrics,
+    # если веб-процессы и Celery запущены с общим PROMETHEUS_MULTIPROC_DIR
+    'record-ai-moderation-backlog': {
+        'task': 'tributes.tasks.record_moderation_backlog',
+        'schedule': 30,
+    },
+    'keep-ollama-warm': {
+        'task': 'tributes.tasks.warm_up_ollama',
+        'schedule': AI_MODERATION_SETTINGS['warmup']['ping_interval_seconds'],
+    },
+    'dispatch-ai-moderation-fair-share': {
+        'task': 'tributes.tasks.dispatch_fair_share',
+        'schedule': AI_MODERATION_SETTINGS['fair_share']['dispatch_interval_seconds'],
+    },
+    # Записи аудита, которые не удалось записать сразу (БД недоступна) или из остановленных процессов
+    'drain-audit-spool': {
+        'task': 'audits.tasks.drain_audit_spool',
+        'schedule': AUDIT_SINK['drain_interval_seconds'],
+    },
+    'archive-audit-logs': {
+        'task': 'audits.tasks.archive_audit_logs',
+        'schedule': AUDIT_ARCHIVE['interval_seconds'],
+    },
+}
+
+# Отдельная очередь для запросов к Ollama, чтобы долгая модерация не задерживала
+# остальные задачи (и наоборот). По умолчанию выключена: воркер без -Q слушает
+# только очередь celery, и задачи модерации ждали бы в очереди без читателя.
+# Включается вместе с воркерами, которые её слушают:
+#   CELERY_MODERATION_QUEUE=moderation
+#   celery -A everest worker -Q moderation       (модерация)
+#   celery -A everest worker -Q celery           (периодические задачи, почта)
+# или один воркер: celery -A everest worker -Q celery,moderation
+CELERY_MODERATION_QUEUE = os.environ.get('CELERY_MODERATION_QUEUE', '')
+CELERY_TASK_ROUTES = {
+    task: {'queue': CELERY_MODERATION_QUEUE}
+    for task in (
+        'tributes.tasks.moderate_tribute_with_ai',
+        'tributes.tasks.moderate_tributes_batch',
+        'tributes.tasks.flush_moderation_batch',   # модерирует пакет сама
+        'tributes.tasks.warm_up_ollama',
+    )
+} if CELERY_MODERATION_QUEUE else {}
+
 
 # Настройки кэширования и сжатия статики
 if not DEBUG:
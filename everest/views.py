@@ -44,6 +44,17 @@ class HealthCheckView(APIView):
             checks['storage'] = 'ok'
         except Exception as e:
             checks['storage'] = f'error: {str(e)}'
+
+        # Предохранитель Ollama: open - ИИ-модерация отложена
+        try:
+            from tributes.breaker import get_ollama_breaker
+            breaker = get_ollama_breaker()
+            if breaker is not None:
+                checks['ollama_circuit'] = breaker.state()
+                if checks['ollama_circuit']['state'] != 'closed':
+                    checks['status'] = 'degraded'
+        except Exception as e:
+            checks['ollama_circuit'] = f'error: {str(e)}'
         
         return Response(checks)
 def debug_i18n(request):
@@ -328,7 +328,7 @@ class FamilyInviteAdmin(MemorialRelatedAdminMixin, admin.ModelAdmin):
         from django.conf import settings
         from django.core.mail import send_mail
         from django.contrib import messages
-        from audits.models import AuditLog  
+        from audits import sink
         import secrets  
         
         # Сохраняем request
@@ -344,7 +344,7 @@ class FamilyInviteAdmin(MemorialRelatedAdminMixin, admin.ModelAdmin):
          # 1. ЛОГИРОВАНИЕ действия
         try:
             actor_id = request.user.id if request.user.is_authenticated else None
-            AuditLog.objects.create(
+            sink.log(
                 actor_type='superuser' if request.user.is_superuser else 'partner_user',
                 actor_id=actor_id,
                 action='create_family_invite',
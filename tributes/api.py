@@ -207,9 +207,18 @@ class TributeAIModerate(APIView):
                     'message': 'ИИ уже провёл модерацию этого трибьюта'
                 })
             
+            # Арендуем трибьют: если он уже в очереди, второй задачи не будет
+            lease_token = tribute.claim_ai_lease()
+            if lease_token is None:
+                return Response({
+                    'status': 'already_queued',
+                    'tribute_id': tribute.id,
+                    'message': 'ИИ-модерация этого трибьюта уже выполняется'
+                })
+
             # Запускаем фоновую задачу
             try:
-                task = moderate_tribute_with_ai.delay(tribute.id)
+                task = moderate_tribute_with_ai.delay(tribute.id, lease_token=lease_token)
                 return Response({
                     'status': 'moderation_started',
                     'tribute_id': tribute.id,
@@ -218,6 +227,7 @@ class TributeAIModerate(APIView):
                 })
             except ImportError:
                 logger.error("Файл tasks.py с moderate_tribute_with_ai не найден")
+                tribute.release_ai_lease(lease_token)
                 return Response(
                     {'error': 'Система ИИ-модерации ещё не настроена'},
                     status=status.HTP_503_SERVICE_UNAVAILABLE
@@ -233,24 +243,31 @@ class TributeAIModerate(APIView):
                     status=status.HTTP_403_FORBIDDEN
                 )
             
-            # Берём трибьюты только этого партнера
-            pending_tributes = Tribute.objects.filter(
-                memorial__partner=partner_user.partner,
-                status='pending',
-                ai_verdict='pending_ai'
-            )[:10]  # Ограничиваем пакет
+            # Арендуем трибьюты только этого партнера; уже арендованные пропускаются
+            lease_token, tribute_ids = Tribute.claim_ai_batch(
+                10,  # Ограничиваем пакет
+                queryset=Tribute.objects.filter(memorial__partner=partner_user.partner)
+            )
             
             task_ids = []
-            for tribute in pending_tributes:
+            unsent_ids = []
+            for tribute_id in tribute_ids:
                 try:
-                    task = moderate_tribute_with_ai.delay(tribute.id)
+                    task = moderate_tribute_with_ai.delay(tribute_id, lease_token=lease_token)
                     task_ids.append(task.id)
                 except Exception as e:
-                    logger.error(f"Ошибка запуска ИИ-модерации для {tribute.id}: {e}")
+                    logger.error("Ошибка запуска ИИ-модерации для %s: %s", tribute_id, e)
+                    unsent_ids.append(tribute_id)
+
+            if unsent_ids:
+                # Задача не ушла в брокер: снимаем аренду, иначе трибьют ждёт её истечения
+                Tribute.objects.filter(id__in=unsent_ids, ai_lease_token=lease_token).update(
+                    ai_lease_token=None, ai_lease_expires_at=None
+                )
             
             return Response({
                 'status': 'batch_moderation_started',
-                'count': len(pending_tributes),
+                'count': len(tribute_ids),
                 'tasks_started': len(task_ids),
                 'task_ids': task_ids,
                 'message': f'Запущена ИИ-модерация {len(task_ids)} трибьютов'
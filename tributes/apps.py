@@ -7,4 +7,14 @@ class TributesConfig(AppConfig):
     verbose_name = _('Tributes')
 
     def ready(self):
-        import tributes.signals 
+        import tributes.signals
+        from django.conf import settings
+        from django.core import checks
+        from .breaker import check_state_cache
+        from everest.log_queue import install_queue_logging
+
+        checks.register(check_state_cache)
+
+        # LOGGING уже применён Django - переносим файловые обработчики в фоновый поток
+        logging_settings = settings.AI_MODERATION_SETTINGS.get('logging', {})
+        install_queue_logging(logging_settings.get('queue_loggers', []))
@@ -0,0 +1,245 @@
+import asyncio
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from .models import Tribute
+from .breaker import get_ollama_breaker
+from .ollama import (
+    ollama_urls, build_endpoint_pool, is_endpoint_failure, blocking_reply, StreamReply, OllamaBusy, OllamaUnavailable,
+)
+from . import metrics
+from .tasks import (
+    run_local_checks,
+    build_ollama_payload,
+    lookup_cached_verdict,
+    process_ai_response,
+    finalize_ai_result,
+    mark_ai_error,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncModerationRunner:
+    """
+    Модерация без Celery: один процесс держит до max_in_flight запросов к Ollama
+    одновременно. Трибьюты арендуются пакетами (Tribute.claim_ai_batch), вся работа
+    с БД и кэшем выполняется в небольшом пуле потоков, в event loop остаются
+    только HTTP-запросы. Проверки, промпт, разбор и применение вердикта - те же
+    функции, что и в Celery-задаче, поэтому вердикты совпадают.
+    """
+
+    def __init__(self, max_in_flight=16, batch_size=20, db_threads=4,
+                 poll_interval=5.0, max_attempts=3, retry_backoff=30, once=False):
+        if httpx is None:
+            raise RuntimeError("httpx is required for the async moderation runner")
+
+        self.max_in_flight = max_in_flight
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.once = once
+
+        # Те же правила выбора сервера, что и у OllamaClient, с собственным состоянием
+        self.endpoints = build_endpoint_pool(ollama_urls(), default_max_in_flight=max_in_flight)
+        client_settings = settings.AI_MODERATION_SETTINGS.get('ollama_client', {})
+        self.timeout = httpx.Timeout(
+            client_settings.get('read_timeout', settings.AI_MODERATION_SETTINGS.get('timeout_seconds', 60)),
+            connect=client_settings.get('connect_timeout', 3.05),
+        )
+
+        self._db_pool = ThreadPoolExecutor(max_workers=db_threads, thread_name_prefix='moderation-db')
+        self._in_flight = set()
+        self._attempts = {}
+        self._stopping = False
+        self.summary = {'claimed': 0, 'local': 0, 'ai': 0, 'parked': 0, 'released': 0, 'errors': 0}
+
+    def stop(self):
+        """Перестать брать новые трибьюты; начатые будут завершены."""
+        self._stopping = True
+
+    async def _db(self, func, *args):
+        """Выполняет синхронный код Django (ORM, кэш) в пуле потоков."""
+        def call():
+            close_old_connections()
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(self._db_pool, call)
+
+    async def run(self):
+        limits = httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight)
+        async with httpx.AsyncClient(timeout=self.timeout, limits=limits) as client:
+            self._client = client
+            while not self._stopping:
+                free_slots = self.max_in_flight - len(self._in_flight)
+                if free_slots <= 0:
+                    await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    continue
+
+                lease_token, tribute_ids = await self._db(
+                    Tribute.claim_ai_batch, min(self.batch_size, free_slots)
+                )
+                self.summary['claimed'] += len(tribute_ids)
+                for tribute_id in tribute_ids:
+                    task = asyncio.create_task(self._moderate(tribute_id, lease_token))
+                    self._in_flight.add(task)
+                    task.add_done_callback(self._in_flight.discard)
+
+                if not tribute_ids:
+                    if self.once and not self._in_flight:
+                        break
+                    await asyncio.sleep(self.poll_interval)
+
+            if self._in_flight:
+                await asyncio.wait(self._in_flight)
+
+        self._db_pool.shutdown(wait=True)
+        return self.summary
+
+    async def _moderate(self, tribute_id, lease_token):
+        try:
+            tribute = await self._db(self._load, tribute_id, lease_token)
+            if tribute is None:
+                return
+
+            message, name_analysis = await self._db(run_local_checks, tribute)
+            if message:
+                self._attempts.pop(tribute_id, None)
+                self.summary['local'] += 1
+                return
+
+            payload = await self._db(build_ollama_payload, tribute, name_analysis)
+            cache_key, ai_result = await self._db(lookup_cached_verdict, tribute, name_analysis, payload)
+            if ai_result is None:
+                ai_response, llm_stats = await self._call_ollama(payload)
+                ai_result = await self._db(process_ai_response, tribute, ai_response, llm_stats, cache_key)
+
+            await self._db(finalize_ai_result, ai_result, tribute, name_analysis)
+            self._attempts.pop(tribute_id, None)
+            self.summary['ai'] += 1
+
+        except (httpx.HTTPError, OllamaBusy, OllamaUnavailable) as e:
+            logger.error("Ошибка подключения к Ollama для трибьюта %s: %s", tribute_id, e)
+            outcome = await self._db(self._handle_ollama_error, tribute, e)
+            self.summary[outcome] += 1
+        except Exception as e:
+            logger.exception("Неожиданная ошибка асинхронной модерации для трибьюта %s: %s", tribute_id, e)
+            self.summary['errors'] += 1
+
+    @staticmethod
+    def _load(tribute_id, lease_token):
+        tribute = Tribute.objects.select_related('memorial').filter(
+            id=tribute_id, ai_lease_token=lease_token
+        ).first()
+        if tribute is None or tribute.status != 'pending' or tribute.ai_moderated_at:
+            return None
+        return tribute
+
+    def _handle_ollama_error(self, tribute, error):
+        """
+        Аналог handle_ollama_error без Celery-ретраев: при открытом предохранителе
+        или исключённых серверах трибьют откладывается, OllamaBusy - обычный повтор; иначе аренда сокращается до паузы перед повтором
+        (как countdown у Celery-ретрая) и трибьют будет взят снова после неё;
+        после max_attempts попыток - error_ai. Возвращает ключ для summary.
+        """
+        breaker = get_ollama_breaker()
+        if isinstance(error, OllamaUnavailable) or (breaker is not None and not breaker.is_closed()):
+            self._attempts.pop(tribute.id, None)
+            tribute.park_ai_moderation(tribute.ai_lease_token)
+            metrics.record_outcome('parked')
+            return 'parked'
+
+        attempts = self._attempts.get(tribute.id, 0) + 1
+        if attempts >= self.max_attempts:
+            self._attempts.pop(tribute.id, None)
+            logger.error("Failed after %s attempts for tribute %s: %s", attempts, tribute.id, error)
+            mark_ai_error(tribute, error)
+            return 'errors'
+
+        # Аренда истечёт через паузу - до этого claim_ai_batch трибьют не возьмёт
+        self._attempts[tribute.id] = attempts
+        tribute.renew_ai_lease(tribute.ai_lease_token, seconds=self.retry_backoff * attempts)
+        metrics.record_outcome('retry_scheduled')
+        return 'released'
+
+    async def _call_ollama(self, payload):
+        """Асинхронный аналог call_ollama: предохранитель, метрики, потоковый режим."""
+        breaker = get_ollama_breaker()
+        if breaker is not None and not await self._db(breaker.allow_request):
+            raise OllamaUnavailable("Ollama circuit breaker is open")
+
+        try:
+            with metrics.stage('ollama_roundtrip'):
+                call = self._call_streaming if payload.get('stream') else self._call_blocking
+                result = await self._call_endpoints(call, payload)
+        except httpx.HTTPError:
+            if breaker is not None:
+                await self._db(breaker.record_failure)
+            raise
+
+        if breaker is not None:
+            await self._db(breaker.record_success)
+        return result
+
+    async def _call_endpoints(self, call, payload):
+        """
+        Выполняет call(url, payload) на лучшем сервере пула; при ошибке сервера -
+        на следующем. Пока все серверы заняты, ждёт, не блокируя event loop,
+        но не дольше read-таймаута (затем OllamaBusy, как у OllamaClient).
+        """
+        tried = []
+        last_error = None
+        deadline = time.monotonic() + self.timeout.read
+        while True:
+            endpoint = self.endpoints.acquire(exclude=tried, timeout=0)
+            if endpoint is None:
+                if len(tried) == len(self.endpoints):
+                    raise last_error
+                if time.monotonic() >= deadline:
+                    raise self.endpoints.exhausted_error(self.timeout.read)
+                await asyncio.sleep(0.01)
+                continue
+
+            started = time.monotonic()
+            try:
+                result = await call(endpoint.url, payload)
+            except httpx.HTTPError as e:
+                status_code = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                failed = is_endpoint_failure(status_code)
+                self.endpoints.release(endpoint, failed=failed)
+                if not failed or len(self.endpoints) == 1:
+                    raise
+                logger.warning("Ollama endpoint %s failed, trying another: %s", endpoint.url, e)
+                tried.append(endpoint)
+                last_error = e
+                continue
+            except BaseException:
+                self.endpoints.release(endpoint)
+                raise
+            self.endpoints.release(endpoint, latency_ms=(time.monotonic() - started) * 1000)
+            return result
+
+    async def _call_blocking(self, url, payload):
+        started = time.monotonic()
+        response = await self._client.post(url, json=payload)
+        response.raise_for_status()
+        return blocking_reply(response.json(), started)
+
+    async def _call_streaming(self, url, payload):
+        reply = StreamReply(time.monotonic())
+        # Выход из контекста закрывает соединение - Ollama прекращает генерацию
+        async with self._client.stream('POST', url, json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if line and reply.feed(json.loads(line)):
+                    break
+        return reply.result()
@@ -0,0 +1,163 @@
+import time
+import logging
+import threading
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+_fallback_cache = None
+_fallback_lock = threading.Lock()
+
+
+def state_cache(alias='default'):
+    """
+    Кэш для общего состояния воркеров (предохранитель, очередь fair share).
+    DummyCache (DEBUG) ничего не хранит, и состояние молча терялось бы -
+    вместо него используется LocMemCache процесса: в одном процессе
+    (runserver, CELERY_TASK_ALWAYS_EAGER) всё работает, между процессами
+    состояние не общее (см. check_state_cache).
+    """
+    global _fallback_cache
+
+    backend = caches[alias]
+    if not isinstance(backend, DummyCache):
+        return backend
+    if _fallback_cache is None:
+        with _fallback_lock:
+            if _fallback_cache is None:
+                _fallback_cache = LocMemCache('moderation-state', {'TIMEOUT': None})
+    return _fallback_cache
+
+
+def check_state_cache(app_configs=None, **kwargs):
+    """
+    Предупреждение при запуске: с DummyCache состояние предохранителя
+    и справедливого распределения не общее для воркеров.
+    """
+    ai_settings = settings.AI_MODERATION_SETTINGS
+    breaker_settings = ai_settings.get('circuit_breaker', {})
+    aliases = set()
+    if breaker_settings.get('enabled', False):
+        aliases.add(breaker_settings.get('cache_alias', 'default'))
+    if ai_settings.get('fair_share', {}).get('enabled', False):
+        aliases.add('default')
+    return [
+        checks.Warning(
+            f"CACHES['{alias}'] is DummyCache: the Ollama circuit breaker and fair-share state "
+            "fall back to a per-process LocMemCache and are not shared between workers.",
+            hint="Use Redis (or another shared cache) when running more than one worker process.",
+            id='tributes.W001',
+        )
+        for alias in sorted(aliases)
+        if isinstance(caches[alias], DummyCache)
+    ]
+
+
+class CircuitBreaker:
+    """
+    Предохранитель для внешней зависимости, общий для всех воркеров:
+    состояние хранится в кэше Django (Redis в продакшене).
+
+    closed    - запросы идут как обычно, подряд идущие ошибки считаются;
+    open      - после failure_threshold ошибок подряд запросы не отправляются
+                reset_timeout секунд;
+    half_open - таймаут истёк: ровно один запрос-проба (cache.add) проверяет
+                зависимость, успех закрывает предохранитель, ошибка снова открывает.
+
+    С DummyCache (DEBUG) состояние хранится в памяти процесса (state_cache).
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60, probe_timeout=90, cache=None):
+        self.name = name
+        self.cache = cache if cache is not None else state_cache()
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.probe_timeout = probe_timeout
+
+        self._failures_key = f'circuit:{name}:failures'
+        self._open_until_key = f'circuit:{name}:open_until'
+        self._probe_key = f'circuit:{name}:probe'
+
+    def allow_request(self):
+        """Можно ли сейчас обращаться к зависимости."""
+        open_until = self.cache.get(self._open_until_key)
+        if open_until is None:
+            return True
+        if time.time() < open_until:
+            return False
+        # Полуоткрытое состояние: пропускаем только первый запрос
+        return self.cache.add(self._probe_key, True, timeout=self.probe_timeout)
+
+    def record_success(self):
+        current = self.cache.get_many([self._failures_key, self._open_until_key])
+        if not current:
+            # Обычный случай: ошибок не было, писать в кэш нечего
+            return
+        if self._open_until_key in current:
+            logger.info("Circuit '%s' closed: probe request succeeded", self.name)
+        self.cache.delete_many([self._failures_key, self._open_until_key, self._probe_key])
+
+    def record_failure(self):
+        self.cache.add(self._failures_key, 0, timeout=None)
+        try:
+            failures = self.cache.incr(self._failures_key)
+        except ValueError:
+            # Ключ исчез между add и incr (вытеснен или сброшен успешным запросом)
+            failures = 1
+
+        probe_failed = self.cache.get(self._probe_key) is not None
+        if probe_failed or failures >= self.failure_threshold:
+            self.cache.set(self._open_until_key, time.time() + self.reset_timeout, timeout=None)
+            self.cache.delete(self._probe_key)
+            logger.warning(
+                "Circuit '%s' opened for %ss after %s consecutive failures",
+                self.name, self.reset_timeout, failures
+            )
+
+    def state(self):
+        """Текущее состояние для health-check и диспетчера отложенной работы."""
+        open_until = self.cache.get(self._open_until_key)
+        failures = self.cache.get(self._failures_key) or 0
+
+        if open_until is None:
+            state = STATE_CLOSED
+        elif time.time() < open_until:
+            state = STATE_OPEN
+        else:
+            state = STATE_HALF_OPEN
+
+        return {
+            'state': state,
+            'consecutive_failures': failures,
+            'retry_at': open_until if state == STATE_OPEN else None,
+            'failure_threshold': self.failure_threshold,
+        }
+
+    def is_closed(self):
+        return self.cache.get(self._open_until_key) is None
+
+
+def get_ollama_breaker():
+    """
+    Предохранитель для Ollama или None, если он выключен в настройках.
+    Объект не хранит состояния, поэтому создаётся на каждый вызов.
+    """
+    breaker_settings = settings.AI_MODERATION_SETTINGS.get('circuit_breaker', {})
+    if not breaker_settings.get('enabled', False):
+        return None
+
+    return CircuitBreaker(
+        'ollama',
+        failure_threshold=breaker_settings.get('failure_threshold', 5),
+        reset_timeout=breaker_settings.get('reset_timeout_seconds', 60),
+        probe_timeout=breaker_settings.get('probe_timeout_seconds', 90),
+        cache=state_cache(breaker_settings.get('cache_alias', 'default')),
+    )
@@ -0,0 +1,258 @@
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import logging
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+logger = logging.getLogger(__name__)
+
+# Ответы модели: корректный JSON, JSON с «шумом» вокруг и откровенный мусор
+_VERDICTS = (
+    ('approved_ai', 'none', 'Respektvolle Anteilnahme an die Familie.'),
+    ('approved_ai', 'none', 'Persönliche Erinnerung, angemessen formuliert.'),
+    ('approved_ai', 'none', 'Kondolenz ohne problematische Inhalte.'),
+    ('flag_ai', 'none', 'Bezug zur verstorbenen Person unklar.'),
+    ('rejected_ai', 'spam', 'Werbung oder Links im Text.'),
+)
+
+_GARBAGE = (
+    'I am not able to evaluate this text.',
+    '{"verdict": "approved_ai", "confidence": 0.9, "reasoning": "Abgeschnitten',
+    '```json\n{“verdict”: “flag_ai”, “confidence”: 0.5, “flags”: [“unclear”,],}\n```',
+    'verdict: approved, confidence: high',
+)
+
+
+class FakeOllamaConfig:
+    """
+    Параметры имитации: задержка (логнормальное распределение вокруг медианы),
+    доля ошибок HTTP 500, доля мусорных ответов и скорость потоковой выдачи.
+    load_ms и prompt_eval_ms_per_token имитируют загрузку модели после простоя
+    дольше keep_alive и вычисление промпта (общий с прошлым запросом префикс
+    не пересчитывается); по умолчанию выключены.
+    """
+
+    def __init__(self, latency_ms=800, latency_sigma=0.5, error_rate=0.0,
+                 garbage_rate=0.0, chatter_rate=0.2, stream_chunk_chars=4, seed=None,
+                 load_ms=0, prompt_eval_ms_per_token=0.0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.garbage_rate = garbage_rate
+        self.chatter_rate = chatter_rate
+        self.stream_chunk_chars = max(1, stream_chunk_chars)
+        self.load_ms = load_ms
+        self.prompt_eval_ms_per_token = prompt_eval_ms_per_token
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Случайные параметры одного запроса: (задержка в секундах, ошибка?, текст ответа)."""
+        with self._lock:
+            rnd = self._random
+            latency = self.latency_ms / 1000 * math.exp(rnd.gauss(0, self.latency_sigma)) if self.latency_ms else 0
+            failed = rnd.random() < self.error_rate
+            if rnd.random() < self.garbage_rate:
+                return latency, failed, rnd.choice(_GARBAGE)
+
+            verdict, category, reasoning = rnd.choice(_VERDICTS)
+            text = json.dumps({
+                'verdict': verdict,
+                'confidence': round(rnd.uniform(0.75, 0.97), 2),
+                'reasoning': reasoning,
+                'flags': [] if verdict == 'approved_ai' else [category],
+                'rejection_category': category,
+            }, ensure_ascii=False)
+            if rnd.random() < self.chatter_rate:
+                text = '```json\n' + text + '\n```\n\nExplanation: the tribute was analysed as requested.'
+            return latency, failed, text
+
+
+class _FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeOllama/1.0'
+
+    def log_message(self, format, *args):
+        logger.debug("fake ollama: " + format, *args)
+
+    def do_POST(self):
+        if self.path.rstrip('/') != '/api/generate':
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        try:
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': 'invalid json'})
+            return
+
+        config = self.server.config
+        timings = self.server.evaluate_prompt(payload)
+        if not payload.get('prompt') and not payload.get('system'):
+            # Пустой запрос только загружает (или с keep_alive=0 выгружает) модель
+            self._send_json(200, dict(timings, model=payload.get('model', 'phi3:latest'), response='', done=True))
+            return
+
+        latency, failed, text = config.draw()
+        self.server.count_request(failed)
+        time.sleep((timings['load_duration'] + timings['prompt_eval_duration']) / 1e9)
+
+        if failed:
+            time.sleep(latency / 4)
+            self._send_json(500, {'error': 'model runner has unexpectedly stopped'})
+            return
+
+        eval_count = max(1, len(text) // config.stream_chunk_chars)
+        if payload.get('stream'):
+            self._stream(text, latency, dict(timings, eval_count=eval_count))
+            return
+
+        time.sleep(latency)
+        self._send_json(200, dict(
+            timings,
+            model=payload.get('model', 'phi3:latest'),
+            response=text,
+            done=True,
+            eval_count=eval_count,
+            total_duration=int(latency * 1e9) + timings['load_duration'] + timings['prompt_eval_duration'],
+        ))
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, text, latency, final):
+        """NDJSON-поток как у Ollama: задержка распределяется по токенам."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        step = self.server.config.stream_chunk_chars
+        chunks = [text[i:i + step] for i in range(0, len(text), step)]
+        delay = latency / max(len(chunks), 1)
+        try:
+            for chunk in chunks:
+                time.sleep(delay)
+                self._write_chunk({'response': chunk, 'done': False})
+            self._write_chunk(dict(final, response='', done=True))
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            # Клиент закрыл соединение после полного JSON-объекта - как и Ollama, прекращаем генерацию
+            self.server.count_cancelled()
+            self.close_connection = True
+
+    def _write_chunk(self, body):
+        line = (json.dumps(body, ensure_ascii=False) + '\n').encode('utf-8')
+        self.wfile.write(b'%x\r\n%s\r\n' % (len(line), line))
+        self.wfile.flush()
+
+
+def _keep_alive_seconds(value, default=300):
+    """keep_alive Ollama: число секунд или строка "30s" / "5m" / "1h"; отрицательное - навсегда."""
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return value
+    units = {'s': 1, 'm': 60, 'h': 3600}
+    try:
+        if value[-1:] in units:
+            return float(value[:-1]) * units[value[-1]]
+        return float(value)
+    except ValueError:
+        return default
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    """
+    Локальная замена Ollama /api/generate для нагрузочных тестов и разработки.
+    Запуск в фоне: server = FakeOllamaServer(port=0).start(); server.url
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=11434, config=None):
+        super().__init__((host, port), _FakeOllamaHandler)
+        self.config = config or FakeOllamaConfig()
+        self._stats = {'requests': 0, 'errors': 0, 'cancelled_streams': 0}
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        # Один «слот» модели: загружена до loaded_until, помнит последний промпт
+        self._model_lock = threading.Lock()
+        self._loaded_until = 0.0
+        self._last_prompt = ''
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}/api/generate'
+
+    def evaluate_prompt(self, payload):
+        """
+        Тайминги в наносекундах, как их возвращает Ollama: загрузка модели,
+        если она выгружена, и вычисление только той части промпта, что
+        отличается от предыдущего запроса (~4 символа на токен).
+        """
+        config = self.config
+        keep_alive = _keep_alive_seconds(payload.get('keep_alive'))
+        if payload.get('raw') or not payload.get('system'):
+            prompt = payload.get('prompt', '')
+        else:
+            prompt = payload['system'] + '\n' + payload.get('prompt', '')
+
+        with self._model_lock:
+            now = time.monotonic()
+            if keep_alive == 0 and not prompt.strip():
+                self._loaded_until = 0.0
+                return {'load_duration': 0, 'prompt_eval_count': 0, 'prompt_eval_duration': 0}
+            load_ms = 0 if now < self._loaded_until else config.load_ms
+            if load_ms:
+                self._last_prompt = ''
+            shared = len(os.path.commonprefix([self._last_prompt, prompt]))
+            self._last_prompt = prompt
+            self._loaded_until = now + load_ms / 1000 + keep_alive if keep_alive >= 0 else math.inf
+
+        prompt_eval_count = max(1, (len(prompt) - shared) // 4) if prompt else 0
+        return {
+            'load_duration': int(load_ms * 1e6),
+            'prompt_eval_count': prompt_eval_count,
+            'prompt_eval_duration': int(prompt_eval_count * config.prompt_eval_ms_per_token * 1e6),
+        }
+
+    def count_request(self, failed):
+        with self._stats_lock:
+            self._stats['requests'] += 1
+            self._stats['errors'] += failed
+
+    def count_cancelled(self):
+        with self._stats_lock:
+            self._stats['cancelled_streams'] += 1
+
+    def stats(self):
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def handle_error(self, request, client_address):
+        # Клиент оборвал keep-alive соединение (например, после досрочной остановки потока)
+        error = sys.exc_info()[1]
+        if isinstance(error, (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-ollama', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
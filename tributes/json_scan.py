@@ -0,0 +1,220 @@
+# Посимвольный разбор JSON-объектов в ответах модели.
+# Учитывает строки и экранирование, поэтому фигурные скобки внутри
+# "reasoning" не сбивают подсчёт вложенности.
+
+import json
+import re
+
+OPEN_QUOTES = '"“”'
+# Строка, открытая типографской кавычкой, может закрываться любой из них
+_CLOSING_QUOTES = {'"': '"', '“': '“”', '”': '“”'}
+
+
+class JsonObjectDetector:
+    """
+    Инкрементальный детектор: получает текст кусками (например, токены из
+    потока Ollama) и сообщает, когда закончился первый JSON-объект верхнего уровня.
+
+    С required_key закрытый объект проверяется scan_json_object: объект без
+    этого ключа (например, пример формата в пояснении модели перед ответом)
+    пропускается, и детектор ждёт следующий.
+    """
+
+    def __init__(self, required_key=None):
+        self.required_key = required_key
+        self.complete = False
+        self._reset()
+
+    def _reset(self):
+        self.depth = 0
+        self.started = False
+        self._quote = None
+        self._escape = False
+        self._buffer = []
+
+    def feed(self, chunk):
+        """Добавляет кусок текста. Возвращает True, когда объект закрыт."""
+        if self.complete:
+            return True
+
+        for char in chunk:
+            if self.started:
+                self._buffer.append(char)
+
+            if self._quote is not None:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char in _CLOSING_QUOTES[self._quote]:
+                    self._quote = None
+                continue
+
+            if char == '{':
+                if not self.started:
+                    self.started = True
+                    self._buffer.append(char)
+                self.depth += 1
+            elif not self.started:
+                continue
+            elif char in OPEN_QUOTES:
+                self._quote = char
+            elif char == '}':
+                self.depth -= 1
+                if self.depth == 0:
+                    if self.required_key is None or scan_json_object(self.text, self.required_key)[0] is not None:
+                        self.complete = True
+                        return True
+                    self._reset()
+        return False
+
+    @property
+    def text(self):
+        """Текст объекта от первой '{' (целиком, если complete)."""
+        return ''.join(self._buffer)
+
+
+# Символы, на которых сканер останавливается; всё между ними копируется срезами
+_OBJECT_SPECIAL_RE = re.compile(r'[{}\[\],"“”\\]')
+_STRING_SPECIAL_RE = re.compile(r'["“”\\]')
+
+
+def _strip_trailing(out, chars):
+    """Убирает с конца собранного текста пробелы и символы из chars."""
+    while out:
+        stripped = out[-1].rstrip(chars)
+        if stripped:
+            out[-1] = stripped
+            return
+        out.pop()
+
+
+def _close_candidate(out, stack):
+    """Дописывает закрывающие скобки к обрезанному объекту."""
+    out = list(out)
+    _strip_trailing(out, ' \t\r\n,:')
+    return ''.join(out) + ''.join('}' if bracket == '{' else ']' for bracket in reversed(stack))
+
+
+_DECODER = json.JSONDecoder(strict=False)
+
+
+def _load(candidate):
+    try:
+        value = json.loads(candidate, strict=False)
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+
+def extract_json_object(text, required_key=None, accept_repaired=None):
+    """Первый JSON-объект из ответа модели или None (см. scan_json_object)."""
+    return scan_json_object(text, required_key, accept_repaired)[0]
+
+
+def scan_json_object(text, required_key=None, accept_repaired=None):
+    """
+    Извлекает первый JSON-объект из ответа модели за один проход по тексту.
+
+    По ходу сканирования исправляет типичные ошибки phi3:
+    - типографские кавычки вместо ASCII ("“verdict”: “approved_ai”");
+    - висячие запятые перед } и ];
+    - обрезанный ответ (num_predict закончился) - незакрытые строки и скобки
+      дописываются, при неудаче объект обрезается до последней запятой.
+
+    Текст вокруг объекта (```json, пояснения модели) пропускается.
+    Достроенный из обрезанного ответа объект принимается, только если его
+    одобряет accept_repaired(value) (если задан): от обрезанного ответа может
+    остаться, например, {"verdict": "approved"}.
+
+    Возвращает (объект, repaired) - первый разобранный объект (с ключом
+    required_key, если он задан) и признак, что он достроен из обрезанного
+    ответа; (None, False), если объекта нет.
+    """
+    length = len(text)
+    pos = text.find('{')
+    while pos != -1:
+        # Быстрый путь: корректный объект разбирается json на C,
+        # текст после него не читается
+        try:
+            value, end = _DECODER.raw_decode(text, pos)
+        except ValueError:
+            pass
+        else:
+            if isinstance(value, dict) and (required_key is None or required_key in value):
+                return value, False
+            pos = text.find('{', end if isinstance(value, dict) else pos + 1)
+            continue
+
+        out = ['{']
+        stack = ['{']
+        quote = None
+        # (длина out, состояние стека) перед последней запятой вне строк
+        last_comma = None
+        pos += 1
+
+        while stack:
+            special = (_STRING_SPECIAL_RE if quote else _OBJECT_SPECIAL_RE).search(text, pos)
+            if special is None:
+                break
+            start = special.start()
+            if start > pos:
+                out.append(text[pos:start])
+            char = text[start]
+            pos = start + 1
+
+            if quote is not None:
+                if char == '\\':
+                    # Экранированный символ копируется как есть
+                    out.append(text[start:start + 2])
+                    pos = start + 2
+                elif char in _CLOSING_QUOTES[quote]:
+                    quote = None
+                    out.append('"')
+                else:
+                    # ASCII-кавычка внутри строки в типографских кавычках
+                    out.append('\\"')
+            elif char in OPEN_QUOTES:
+                quote = char
+                out.append('"')
+            elif char == '{' or char == '[':
+                stack.append(char)
+                out.append(char)
+            elif char == '}' or char == ']':
+                # Висячая запятая: {"a": 1,} -> {"a": 1}
+                _strip_trailing(out, ' \t\r\n')
+                if out[-1].endswith(','):
+                    _strip_trailing(out, ',')
+                stack.pop()
+                out.append(char)
+            elif char == ',':
+                last_comma = (len(out), tuple(stack))
+                out.append(char)
+            else:
+                # Обратная косая черта вне строки - мусор модели
+                out.append(char)
+
+        if stack:
+            # Ответ оборвался внутри объекта
+            if pos < length:
+                out.append(text[pos:])
+            if quote is not None:
+                out.append('"')
+            candidates = [_close_candidate(out, stack)]
+            if last_comma is not None:
+                comma_length, comma_stack = last_comma
+                candidates.append(_close_candidate(out[:comma_length], comma_stack))
+            for candidate in candidates:
+                value = _load(candidate)
+                if value is None or (required_key is not None and required_key not in value):
+                    continue
+                if accept_repaired is None or accept_repaired(value):
+                    return value, True
+            return None, False
+
+        value = _load(''.join(out))
+        if value is not None and (required_key is None or required_key in value):
+            return value, False
+        pos = text.find('{', pos)
+
+    return None, False
@@ -0,0 +1,178 @@
+import re
+from functools import lru_cache
+
+# === СЛОВАРИ ПРЕ-МОДЕРАЦИИ ===
+# Все списки компилируются один раз при импорте в одно регулярное выражение,
+# которое находит вхождения всех категорий за один проход по тексту.
+
+# Короткие, но осмысленные тексты ("Мои соболезнования")
+SHORT_MEANINGFUL_PHRASES = (
+    'mein beileid', 'condoléances', 'condoglianze', 'my condolences',
+    'соболезную', 'співчуття', 'riposa in pace', 'rip'
+)
+
+# Тестовые фразы
+TEST_PHRASES = (
+    'test', 'тест', 'проба', 'check', 'testing',
+    '123', '456', '789', '000', '111',
+    'hello world', 'привет мир'
+)
+
+# Эмодзи, неуместные на странице памяти
+SPAM_EMOJI = (
+    '💀', '😂', '🤣', '👻', '😈', '😅', '😆', '😁',
+    '🎉', '🔥', '💩', '🤡', '👏', '🙈', '🙉', '🙊'
+)
+
+# "Рофл" и интернет-сленг
+INAPPROPRIATE_SLANG = (
+    'рофл', 'ролф', 'rofl', 'лмао', 'lmao', 'кек', 'kek',
+    'ауф', 'auf', 'краш', 'crash', 'кринж', 'cringe',
+    'прикол', 'шуточка', 'шутка', 'joke', 'prank',
+    'чебурек', 'пельмень', 'пацан', 'братан'
+)
+
+# Уважительные слова - сленг рядом с ними допустим
+RESPECTFUL_WORDS = (
+    'beileid', 'condoléances', 'condoglianze', 'condolences',
+    'соболезн', 'співчут', 'trauer', 'mourning', 'peace'
+)
+
+# Явные оскорбления на разных языках
+EXPLICIT_INSULTS = {
+    'russian': ('жопа', 'сука', 'пизда', 'блядь', 'ебать', 'хуй', 'идиот', 'дурак', 'шлюха', 'шлюх', 'дура', 'идиотка', 'хуйня', 'блядина'),
+    'german': ('scheisse', 'arsch', 'hurensohn', 'wichser', 'fotze', 'miststück', 'schwanz', 'hass', 'huren', 'hasse', 'schwein', 'hund', 'sau', 'kuh', 'affe', 'ratte', 'käfer', 'dick'),
+    'english': ('shit', 'fuck', 'asshole', 'bitch', 'motherfucker', 'cunt'),
+    'french': ('merde', 'putain', 'connard', 'salope', 'enculé'),
+    'italian': ('merda', 'cazzo', 'stronzo', 'vaffanculo', 'puttana'),
+}
+
+# Дополнительная проверка немецких оскорблений
+ADDITIONAL_GERMAN_INSULTS = ('hass', 'hasse', 'hassen', 'idiot', 'depp', 'blöd', 'dumm')
+
+KEYWORD_CATEGORIES = {
+    'short_meaningful': SHORT_MEANINGFUL_PHRASES,
+    'test': TEST_PHRASES,
+    'emoji': SPAM_EMOJI,
+    'slang': INAPPROPRIATE_SLANG,
+    'respectful': RESPECTFUL_WORDS,
+    'insult': tuple(word for words in EXPLICIT_INSULTS.values() for word in words),
+    'german_insult': ADDITIONAL_GERMAN_INSULTS,
+}
+
+# Клавиатурный спам: все раскладки в одном выражении
+KEYBOARD_SPAM_RE = re.compile(
+    r'^(?:'
+    r'[asdfghjkl;]+'        # asdfghjkl
+    r'|[qwertyuiop]+'       # qwertyuiop
+    r'|[zxcvbnm]+'          # zxcvbnm
+    r'|[йцукенгшщзхъ]+'     # русская раскладка
+    r'|[1234567890]+'       # цифры
+    r')$'
+)
+
+# "Du Schwein!" vs "Herr Schwein"
+SCHWEIN_INSULT_RE = re.compile(r'\b(du|sie|er|sie)\s+schwein\b', re.IGNORECASE)
+
+
+def _trie_pattern(words):
+    """
+    Собирает слова в префиксное дерево и превращает его в регулярное выражение:
+    "hass", "hasse", "hassen" -> hass(?:e(?:n)?)?. Движок re ветвится по первому
+    символу вместо перебора всех альтернатив, а жадные группы дают самое длинное
+    совпадение в позиции.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def build(node):
+        branches = []
+        single_chars = []
+        for char in sorted(key for key in node if key):
+            child = build(node[char])
+            if child is None:
+                single_chars.append(re.escape(char))
+            else:
+                branches.append(re.escape(char) + child)
+        if single_chars:
+            branches.append(single_chars[0] if len(single_chars) == 1 else '[' + ''.join(single_chars) + ']')
+        if not branches:
+            return None
+        pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' in node:
+            pattern = '(?:' + pattern + ')?'
+        return pattern
+
+    return build(trie)
+
+
+def _build_keyword_index(categories):
+    """
+    Строит выражение вида (?=(слово|...)): lookahead находит в каждой позиции
+    самое длинное ключевое слово, не съедая текст, поэтому перекрывающиеся
+    вхождения ("hass" внутри "hasse", "test" внутри "testing") тоже находятся.
+    Все более короткие слова, начинающиеся в той же позиции, являются префиксами
+    найденного - их список вычисляется заранее.
+    """
+    keyword_categories = {}
+    for category, words in categories.items():
+        for word in words:
+            keyword_categories.setdefault(word, set()).add(category)
+
+    keywords = sorted(keyword_categories, key=len, reverse=True)
+    # Первый lookahead по множеству первых букв быстро пропускает остальные позиции
+    first_chars = ''.join(sorted({re.escape(word[0]) for word in keywords}))
+    pattern = re.compile('(?=[' + first_chars + '])(?=(' + _trie_pattern(keywords) + '))')
+
+    prefix_hits = {}
+    for word in keywords:
+        prefix_hits[word] = tuple(
+            (category, prefix)
+            for prefix in keywords if word.startswith(prefix)
+            for category in keyword_categories[prefix]
+        )
+    return pattern, prefix_hits
+
+
+_KEYWORD_RE, _PREFIX_HITS = _build_keyword_index(KEYWORD_CATEGORIES)
+
+
+class KeywordHits:
+    """Результат одного прохода по тексту: найденные слова по категориям."""
+
+    __slots__ = ('_hits', 'emoji_count')
+
+    def __init__(self, hits, emoji_count):
+        self._hits = hits
+        self.emoji_count = emoji_count
+
+    def has(self, category):
+        return category in self._hits
+
+    def get(self, category):
+        return self._hits.get(category, frozenset())
+
+
+@lru_cache(maxsize=1024)
+def scan_keywords(text_lower):
+    """
+    Находит все ключевые слова всех категорий за один проход по тексту.
+    Ожидает уже приведённый к нижнему регистру текст; результат кэшируется,
+    поэтому пре-модерация и проверка оскорблений сканируют текст один раз.
+    """
+    hits = {}
+    emoji_count = 0
+    for match in _KEYWORD_RE.finditer(text_lower):
+        for category, word in _PREFIX_HITS[match.group(1)]:
+            hits.setdefault(category, set()).add(word)
+            if category == 'emoji':
+                emoji_count += 1
+
+    return KeywordHits(
+        {category: frozenset(words) for category, words in hits.items()},
+        emoji_count
+    )
@@ -0,0 +1,113 @@
+import json
+import random
+import re
+import time
+from django.core.management.base import BaseCommand
+from tributes.json_scan import scan_json_object
+from tributes.response_corpus import PHI3_RESPONSES, mutate_response
+from tributes.tasks import is_complete_verdict
+
+
+def _scan(text):
+    """Разбор как в parse_ai_response: ремонт обрезанного ответа - только для полного вердикта."""
+    return scan_json_object(text, required_key='verdict', accept_repaired=is_complete_verdict)[0]
+
+
+# === Прежняя реализация parse_ai_response - только для сравнения ===
+def _legacy_parse(ai_response):
+    cleaned_response = ai_response.replace('```json', '').replace('```', '').strip()
+    json_match = None
+    matches = re.findall(r'\{[^{}]*\{[^{}]*\}[^{}]*\}|{[^{}]*\}', cleaned_response, re.DOTALL)
+    if matches:
+        json_match = max(matches, key=len)
+    if not json_match:
+        start = cleaned_response.find('{')
+        end = cleaned_response.rfind('}') + 1
+        if start >= 0 and end > start:
+            json_match = cleaned_response[start:end]
+    if json_match:
+        try:
+            return json.loads(json_match)
+        except json.JSONDecodeError:
+            json_match_fixed = re.sub(r',\s*}', '}', json_match)
+            json_match_fixed = re.sub(r',\s*]', ']', json_match_fixed)
+            try:
+                return json.loads(json_match_fixed)
+            except json.JSONDecodeError:
+                pass
+    return None
+
+
+def _verdict(result):
+    return result.get('verdict') if isinstance(result, dict) else None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark and fuzz the AI response parser: legacy regex parsing vs single-pass scanner'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=2000, help='Passes over the corpus')
+        parser.add_argument('--fuzz', type=int, default=20000, help='Number of randomly corrupted responses')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rounds = options['rounds']
+        corpus = [text for text, _expected in PHI3_RESPONSES]
+
+        correct = {'legacy': 0, 'scanner': 0}
+        for text, expected in PHI3_RESPONSES:
+            legacy = _verdict(_legacy_parse(text))
+            current = _verdict(_scan(text))
+            correct['legacy'] += legacy == expected
+            correct['scanner'] += current == expected
+            self.stdout.write(
+                f"{'ok ' if current == expected else '-- '}{'ok ' if legacy == expected else '-- '}{text[:70]!r}"
+            )
+        self.stdout.write(
+            f"Expected verdict: scanner {correct['scanner']}/{len(corpus)}, "
+            f"legacy {correct['legacy']}/{len(corpus)}"
+        )
+
+        # Фаззинг: парсер не должен падать ни на каком входе
+        rng = random.Random(options['seed'])
+        failures = 0
+        recovered = 0
+        for _ in range(options['fuzz']):
+            text = mutate_response(rng.choice(corpus), rng)
+            try:
+                result = _scan(text)
+            except Exception as e:
+                failures += 1
+                self.stderr.write(f"Parser raised {e!r} on {text[:100]!r}")
+                continue
+            recovered += result is not None
+        self.stdout.write(f"Fuzz: {options['fuzz']} inputs, {recovered} with verdict, {failures} exceptions")
+
+        # Время отдельно для ответов, которые разбирает и старый парсер,
+        # и для испорченных, где новый парсер делает ремонт
+        groups = {
+            'well-formed': [text for text in corpus if _legacy_parse(text) is not None],
+            'all': corpus,
+        }
+        speedups = {}
+        for group, texts in groups.items():
+            per_response = {}
+            for name, func in (('legacy', _legacy_parse), ('scanner', _scan)):
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    for text in texts:
+                        func(text)
+                elapsed = time.perf_counter() - start
+                per_response[name] = elapsed / (rounds * len(texts)) * 1_000_000
+            speedups[group] = per_response['legacy'] / per_response['scanner']
+            self.stdout.write(
+                f"{group:>12}: legacy {per_response['legacy']:7.2f} µs, "
+                f"scanner {per_response['scanner']:7.2f} µs per response ({len(texts)} texts)"
+            )
+
+        if failures:
+            self.stderr.write(self.style.ERROR(f"{failures} fuzz inputs raised"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Speedup on well-formed responses: x{speedups['well-formed']:.2f}"
+            ))
@@ -0,0 +1,97 @@
+import math
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from requests.exceptions import RequestException
+from tributes.ollama import OllamaClient, build_endpoint_pool
+from tributes.fake_ollama import FakeOllamaServer, FakeOllamaConfig
+
+
+def _record_routing(pool, routed):
+    """Запоминает сервер каждого успешного запроса в порядке завершения."""
+    release = pool.release
+
+    def recording_release(endpoint, latency_ms=None, failed=False):
+        release(endpoint, latency_ms=latency_ms, failed=failed)
+        if latency_ms is not None and not failed:
+            routed.append(endpoint.url)
+
+    pool.release = recording_release
+    return pool
+
+
+class Command(BaseCommand):
+    help = ('Start several fake Ollama endpoints with different latencies and show how the endpoint pool '
+            'spreads requests between them and fails over')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency-ms', type=float, action='append',
+                            help='Median latency of one fake endpoint, repeatable (default: 100 100 800)')
+        parser.add_argument('--error-rate', type=float, action='append',
+                            help='HTTP 500 share per endpoint, in the same order as --latency-ms')
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument('--max-in-flight', type=int, default=4, help='In-flight limit per endpoint')
+        parser.add_argument('--windows', type=int, default=3, help='Report the traffic split in this many windows')
+
+    def handle(self, *args, **options):
+        latencies = options['latency_ms'] or [100, 100, 800]
+        error_rates = options['error_rate'] or []
+        if len(error_rates) > len(latencies):
+            raise CommandError("More --error-rate values than endpoints")
+        error_rates += [0.0] * (len(latencies) - len(error_rates))
+
+        servers = [
+            FakeOllamaServer(port=0, config=FakeOllamaConfig(
+                latency_ms=latency, latency_sigma=0.2, error_rate=error_rate, seed=index
+            )).start()
+            for index, (latency, error_rate) in enumerate(zip(latencies, error_rates))
+        ]
+        urls = [server.url for server in servers]
+        names = {server.url: f"#{index} ({latency:g}ms, {error_rate:.0%} errors)"
+                 for index, (server, latency, error_rate) in enumerate(zip(servers, latencies, error_rates))}
+
+        # Отдельный клиент с настройками пула из AI_MODERATION_SETTINGS['ollama_pool']
+        routed = []
+        client = OllamaClient(
+            urls, pool_maxsize=options['max_in_flight'], read_timeout=30,
+            endpoints=_record_routing(
+                build_endpoint_pool(urls, default_max_in_flight=options['max_in_flight']), routed
+            ),
+        )
+        failed = Counter()
+        payload = {"model": "fake", "prompt": "Analysiere diesen Nachruf.", "stream": False}
+
+        def send(number):
+            try:
+                client.generate(payload)
+            except RequestException as e:
+                failed[type(e).__name__] += 1
+
+        started = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                list(executor.map(send, range(options['requests'])))
+        finally:
+            elapsed = time.monotonic() - started
+            for server in servers:
+                server.stop()
+
+        self.stdout.write(
+            f"{options['requests']} requests in {elapsed:.1f}s ({options['requests'] / elapsed:.1f}/s), "
+            f"concurrency {options['concurrency']}, failed {dict(failed) or 0}"
+        )
+        window = max(1, math.ceil(len(routed) / options['windows']))
+        for start in range(0, len(routed), window):
+            split = Counter(routed[start:start + window])
+            total = sum(split.values())
+            self.stdout.write(
+                f"  completed {start + 1}-{start + total}: "
+                + ', '.join(f"{names[url]} {split[url] / total:.0%}" for url in urls)
+            )
+        for endpoint in client.endpoints.stats():
+            self.stdout.write(
+                f"  {names[endpoint['url']]}: {endpoint['requests']} requests, {endpoint['failures']} failures, "
+                f"EWMA {endpoint['ewma_ms']} ms, healthy {endpoint['healthy']}"
+            )
@@ -0,0 +1,123 @@
+import statistics
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from memorials.models import Memorial
+from tributes.ollama import OllamaClient, ollama_urls, response_timings
+from tributes.fake_ollama import FakeOllamaServer, FakeOllamaConfig
+from tributes.tasks import (
+    AI_SYSTEM_PROMPT,
+    analyze_name_mentions,
+    prepare_name_analysis_for_prompt,
+    build_ai_prompt,
+    ollama_keep_alive,
+)
+
+TEXTS = (
+    "Mein herzliches Beileid an die ganze Familie. Wir werden Hans immer in guter Erinnerung behalten.",
+    "Ruhe in Frieden, lieber Hans. Deine Güte und dein Humor werden uns sehr fehlen.",
+    "In stiller Trauer denken wir an Hans Müller und an alle Angehörigen.",
+    "Sincères condoléances à toute la famille Müller. Nous garderons de Hans le souvenir d'un homme généreux.",
+    "Sentite condoglianze. Hans resterà sempre nei nostri cuori.",
+    "My deepest condolences to the family. Hans touched so many lives.",
+)
+
+
+def _legacy_payload(model, user_prompt):
+    """
+    Раскладка промпта v1: данные трибьюта стоят перед инструкциями внутри
+    одного <|system|>-блока, keep_alive не передаётся.
+    """
+    return {
+        "model": model,
+        "prompt": f"<|system|>\n{user_prompt}\n\n{AI_SYSTEM_PROMPT}<|end|>\n"
+                  "<|user|>\nAnalysiere diesen Nachruf:<|end|>\n<|assistant|>",
+        "raw": True,
+        "stream": False,
+    }
+
+
+def _split_payload(model, user_prompt):
+    """Текущая раскладка: статический system-промпт + данные трибьюта, keep_alive."""
+    return {
+        "model": model,
+        "system": AI_SYSTEM_PROMPT,
+        "prompt": user_prompt,
+        "stream": False,
+        "keep_alive": ollama_keep_alive(),
+    }
+
+
+LAYOUTS = {'legacy': _legacy_payload, 'split': _split_payload}
+
+
+class Command(BaseCommand):
+    help = 'Compare Ollama prompt evaluation and cold-start time for the old and the system-prompt layout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--samples', type=int, default=12, help='Requests per layout')
+        parser.add_argument('--num-predict', type=int, default=1,
+                            help='Tokens to generate; 1 measures prompt handling only')
+        parser.add_argument('--cold-start', action='store_true',
+                            help='Unload the model (keep_alive=0) before each layout. '
+                                 'Do not use against an Ollama serving live traffic')
+        parser.add_argument('--fake-ollama', action='store_true',
+                            help='Run against an in-process fake Ollama that simulates load and prompt eval')
+        parser.add_argument('--load-ms', type=float, default=3000, help='Fake Ollama model load time')
+        parser.add_argument('--prompt-eval-ms-per-token', type=float, default=2.0, help='Fake Ollama prompt cost')
+
+    def handle(self, *args, **options):
+        server = None
+        url = ollama_urls()[0]
+        if options['fake_ollama']:
+            server = FakeOllamaServer(port=0, config=FakeOllamaConfig(
+                latency_ms=0,
+                load_ms=options['load_ms'],
+                prompt_eval_ms_per_token=options['prompt_eval_ms_per_token'],
+            )).start()
+            url = server.url
+
+        # Отдельный клиент: бенчмарк не должен влиять на клиент процесса
+        client = OllamaClient(url, read_timeout=300)
+        model = getattr(settings, 'OLLAMA_MODEL', 'phi3:latest')
+        memorial = Memorial(first_name='Hans', last_name='Müller', short_code='bench')
+        prompts = []
+        for text in TEXTS:
+            name_analysis = analyze_name_mentions(text, memorial)
+            name_analysis_text = prepare_name_analysis_for_prompt(name_analysis, memorial)
+            prompts.append(build_ai_prompt(text, memorial, name_analysis_text))
+
+        self.stdout.write(f"Ollama: {url}, model {model}, {options['samples']} requests per layout")
+        try:
+            for layout, build_payload in LAYOUTS.items():
+                if options['cold_start']:
+                    client.generate({"model": model, "keep_alive": 0})
+                rows = []
+                for i in range(options['samples']):
+                    payload = build_payload(model, prompts[i % len(prompts)])
+                    payload['options'] = {"temperature": 0.1, "num_predict": options['num_predict']}
+                    started = time.monotonic()
+                    result = client.generate(payload)
+                    rows.append(dict(response_timings(result), total_ms=round((time.monotonic() - started) * 1000)))
+                self._report(layout, rows)
+        finally:
+            client.close()
+            if server is not None:
+                server.stop()
+
+    def _report(self, layout, rows):
+        first, warm = rows[0], rows[1:] or rows
+
+        def mean(key):
+            values = [row[key] for row in warm if row[key] is not None]
+            return statistics.mean(values) if values else float('nan')
+
+        self.stdout.write(
+            f"{layout:>6}: first request {first['total_ms']} ms "
+            f"(load {first['load_ms']} ms, prompt eval {first['prompt_eval_ms']} ms / "
+            f"{first['prompt_eval_count']} tokens)"
+        )
+        self.stdout.write(
+            f"{'':>6}  warm avg: total {mean('total_ms'):.0f} ms, load {mean('load_ms'):.0f} ms, "
+            f"prompt eval {mean('prompt_eval_ms'):.0f} ms / {mean('prompt_eval_count'):.0f} tokens"
+        )
@@ -0,0 +1,145 @@
+import re
+import time
+from django.core.management.base import BaseCommand
+from tributes.keywords import scan_keywords
+from tributes.tasks import check_pre_moderation_red_flags, check_explicit_insults
+
+# Многоязычный корпус типичных трибьютов (de/fr/it/en/ru)
+CORPUS = [
+    # Deutsch
+    "Mein herzliches Beileid",
+    "Mein herzliches Beileid an die ganze Familie. Wir werden Hans immer in guter Erinnerung behalten.",
+    "Ruhe in Frieden, lieber Hans. Deine Güte und dein Humor werden uns sehr fehlen.",
+    "In stiller Trauer denken wir an euch. Möge die Erinnerung an schöne Stunden Trost spenden.",
+    "Er war ein wunderbarer Mensch, immer hilfsbereit und freundlich. Unser tiefes Mitgefühl.",
+    "Du Schwein, ich hasse dich",
+    "test test",
+    "asdfghjkl",
+    # Français
+    "Sincères condoléances à toute la famille.",
+    "Repose en paix. Nous garderons de lui le souvenir d'un homme généreux et bienveillant.",
+    "Toutes nos pensées vous accompagnent dans cette douloureuse épreuve.",
+    "merde alors, quel connard",
+    # Italiano
+    "Sentite condoglianze",
+    "Riposa in pace, caro amico. Ci mancherai tantissimo, la tua gentilezza resterà con noi.",
+    "Un abbraccio forte a tutta la famiglia in questo momento di dolore.",
+    "che stronzo 😂😂😂",
+    # English
+    "My condolences",
+    "My deepest condolences to the family. He was a kind and generous man who touched many lives.",
+    "Thinking of you all during this difficult time. May he rest in peace.",
+    "lmao this is a joke 💀💀💀",
+    "hello world",
+    # Русский
+    "Соболезную",
+    "Искренне соболезнуем вашей утрате. Светлая память, он был замечательным человеком.",
+    "Скорбим вместе с вами. Пусть земля будет пухом.",
+    "рофл кек",
+    "йцукенгшщзх",
+]
+
+
+# === Прежняя реализация (до keywords.py) - только для сравнения ===
+def _legacy_pre_moderation(text):
+    text_lower = text.lower().strip()
+    if len(text_lower) < 10:
+        meaningful_short = any(phrase in text_lower for phrase in [
+            'mein beileid', 'condoléances', 'condoglianze', 'my condolences',
+            'соболезную', 'співчуття', 'riposa in pace', 'rip'
+        ])
+        if not meaningful_short:
+            return True, "text_too_short_or_meaningless"
+    for pattern in [r'^[asdfghjkl;]+$', r'^[qwertyuiop]+$', r'^[zxcvbnm]+$',
+                    r'^[йцукенгшщзхъ]+$', r'^[1234567890]+$']:
+        if re.match(pattern, text_lower):
+            return True, "keyboard_spam"
+    test_phrases = ['test', 'тест', 'проба', 'check', 'testing', '123', '456', '789',
+                    '000', '111', 'hello world', 'привет мир']
+    if any(phrase in text_lower for phrase in test_phrases) and len(text_lower) < 30:
+        return True, "test_phrase"
+    emoji_count = sum(1 for char in text if char in [
+        '💀', '😂', '🤣', '👻', '😈', '😅', '😆', '😁',
+        '🎉', '🔥', '💩', '🤡', '👏', '🙈', '🙉', '🙊'
+    ])
+    if emoji_count >= 3 and len(text) < 50:
+        return True, "excessive_emoji_spam"
+    inappropriate_slang = [
+        'рофл', 'ролф', 'rofl', 'лмао', 'lmao', 'кек', 'kek',
+        'ауф', 'auf', 'краш', 'crash', 'кринж', 'cringe',
+        'прикол', 'шуточка', 'шутка', 'joke', 'prank',
+        'чебурек', 'пельмень', 'пацан', 'братан'
+    ]
+    if any(slang in text_lower for slang in inappropriate_slang):
+        respectful_words = ['beileid', 'condoléances', 'condoglianze', 'condolences',
+                            'соболезн', 'співчут', 'trauer', 'mourning', 'peace']
+        if not any(word in text_lower for word in respectful_words):
+            return True, "inappropriate_slang_context"
+    return False, "ok"
+
+
+def _legacy_explicit_insults(text):
+    text_lower = text.lower()
+    explicit_insults = {
+        'russian': ['жопа', 'сука', 'пизда', 'блядь', 'ебать', 'хуй', 'идиот', 'дурак', 'шлюха', 'шлюх', 'дура', 'идиотка', 'хуйня', 'блядина'],
+        'german': ['scheisse', 'arsch', 'hurensohn', 'wichser', 'fotze', 'miststück', 'schwanz', 'hass', 'huren', 'hasse', 'schwein', 'hund', 'sau', 'kuh', 'affe', 'ratte', 'käfer', 'dick'],
+        'english': ['shit', 'fuck', 'asshole', 'bitch', 'motherfucker', 'cunt'],
+        'french': ['merde', 'putain', 'connard', 'salope', 'enculé'],
+        'italian': ['merda', 'cazzo', 'stronzo', 'vaffanculo', 'puttana']
+    }
+    found_insults = []
+    for language, words in explicit_insults.items():
+        for word in words:
+            if word in text_lower:
+                found_insults.append(f"{word} ({language})")
+    if 'schwein' in text_lower:
+        if re.search(r'\b(du|sie|er|sie)\s+schwein\b', text_lower, re.IGNORECASE):
+            found_insults.append("schwein (animal_insult)")
+    for word in ['hass', 'hasse', 'hassen', 'idiot', 'depp', 'blöd', 'dumm']:
+        if word in text_lower:
+            found_insults.append(f"{word} (german_insult)")
+    return found_insults
+
+
+class Command(BaseCommand):
+    help = 'Microbenchmark of pre-moderation and insult checks: legacy scans vs compiled keyword index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=2000, help='Passes over the corpus')
+
+    def handle(self, *args, **options):
+        rounds = options['rounds']
+
+        # Сначала убеждаемся, что результаты совпадают
+        for text in CORPUS:
+            if _legacy_pre_moderation(text) != check_pre_moderation_red_flags(text):
+                self.stderr.write(f"Pre-moderation mismatch: {text!r}")
+            if _legacy_explicit_insults(text) != check_explicit_insults(text):
+                self.stderr.write(f"Insult check mismatch: {text!r}")
+
+        def legacy():
+            for text in CORPUS:
+                _legacy_pre_moderation(text)
+                _legacy_explicit_insults(text)
+
+        def compiled():
+            # Кэш сбрасывается на каждом проходе: каждый текст сканируется заново,
+            # как у нового трибьюта
+            scan_keywords.cache_clear()
+            for text in CORPUS:
+                check_pre_moderation_red_flags(text)
+                check_explicit_insults(text)
+
+        per_tribute = {}
+        for name, func in [('legacy', legacy), ('compiled', compiled)]:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                func()
+            elapsed = time.perf_counter() - start
+            per_tribute[name] = elapsed / (rounds * len(CORPUS)) * 1_000_000
+            self.stdout.write(f"{name:>9}: {per_tribute[name]:8.2f} µs per tribute")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Speedup: x{per_tribute['legacy'] / per_tribute['compiled']:.2f} "
+            f"({len(CORPUS)} texts, {rounds} rounds)"
+        ))
@@ -0,0 +1,211 @@
+import math
+import random
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from partners.models import Partner
+from memorials.models import Memorial
+from tributes.models import Tribute
+from tributes.tasks import moderate_tribute_with_ai
+from tributes.ollama import reset_ollama_client
+from tributes.fake_ollama import FakeOllamaServer, FakeOllamaConfig
+
+FIRST_NAMES = ('Hans', 'Anna', 'Peter', 'Maria', 'Jürg', 'Claudia', 'François', 'Giulia', 'Thomas', 'Ursula')
+LAST_NAMES = ('Müller', 'Meier', 'Schmid', 'Keller', 'Weber', 'Huber', 'Rossi', 'Favre', 'Brunner', 'Baumann')
+
+# Шаблоны трибьютов: большинство уходит в ИИ, часть отсекается локальными проверками
+TRIBUTE_TEMPLATES = (
+    "Mein herzliches Beileid an die ganze Familie. Wir werden {first} immer in guter Erinnerung behalten.",
+    "Ruhe in Frieden, lieber {first}. Deine Güte und dein Humor werden uns sehr fehlen.",
+    "In stiller Trauer denken wir an {first} {last} und an alle Angehörigen.",
+    "Sincères condoléances à toute la famille {last}. Nous garderons de {first} le souvenir d'un homme généreux.",
+    "Sentite condoglianze. {first} resterà sempre nei nostri cuori.",
+    "My deepest condolences to the family. {first} touched so many lives.",
+    "Wir haben gemeinsam viele schöne Stunden erlebt. Danke für alles, {first}. Run {n}",
+    "Liebe Familie {last}, unser aufrichtiges Mitgefühl in diesen schweren Tagen ({n}).",
+    "test test",
+    "lmao 💀💀💀",
+)
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = 'Seed memorials and tributes and drive AI moderation to measure throughput, latency and DB queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tributes', type=int, default=200)
+        parser.add_argument('--memorials', type=int, default=20)
+        parser.add_argument('--mode', choices=['eager', 'worker'], default='eager',
+                            help='eager: run the task in this process; worker: send to running Celery workers')
+        parser.add_argument('--concurrency', type=int, default=4, help='Parallel tasks in eager mode')
+        parser.add_argument('--timeout', type=int, default=600, help='Seconds to wait for workers in worker mode')
+        parser.add_argument('--fake-ollama', action='store_true',
+                            help='Start an in-process fake Ollama and point OLLAMA_API_URL at it (eager mode)')
+        parser.add_argument('--latency-ms', type=float, default=800)
+        parser.add_argument('--latency-sigma', type=float, default=0.5)
+        parser.add_argument('--error-rate', type=float, default=0.0)
+        parser.add_argument('--garbage-rate', type=float, default=0.0)
+        parser.add_argument('--no-verdict-cache', action='store_true', help='Disable the verdict cache for the run')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows after the run')
+        parser.add_argument('--force', action='store_true', help='Allow running with DEBUG=False')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError("Refusing to seed load-test data with DEBUG=False (use --force)")
+        if options['fake_ollama'] and options['mode'] == 'worker':
+            raise CommandError(
+                "--fake-ollama runs inside this process; for worker mode start run_fake_ollama "
+                "and point the workers' OLLAMA_API_URL at it"
+            )
+
+        if options['no_verdict_cache']:
+            settings.AI_MODERATION_SETTINGS['verdict_cache'] = dict(
+                settings.AI_MODERATION_SETTINGS.get('verdict_cache', {}), enabled=False
+            )
+
+        server = None
+        if options['fake_ollama']:
+            server = FakeOllamaServer(port=0, config=FakeOllamaConfig(
+                latency_ms=options['latency_ms'],
+                latency_sigma=options['latency_sigma'],
+                error_rate=options['error_rate'],
+                garbage_rate=options['garbage_rate'],
+                seed=options['seed'],
+            )).start()
+            settings.OLLAMA_API_URL = server.url
+            settings.OLLAMA_API_URLS = []
+            reset_ollama_client()
+            self.stdout.write(f"Fake Ollama: {server.url}")
+
+        partner, tribute_ids = self._seed(options['memorials'], options['tributes'], options['seed'])
+        self.stdout.write(f"Seeded {len(tribute_ids)} tributes across {options['memorials']} memorials")
+
+        try:
+            if options['mode'] == 'eager':
+                elapsed, latencies, query_counts = self._run_eager(tribute_ids, options['concurrency'])
+            else:
+                elapsed, latencies = self._run_worker(tribute_ids, options['timeout'])
+                query_counts = []
+            self._report(tribute_ids, elapsed, latencies, query_counts, server)
+        finally:
+            if server is not None:
+                server.stop()
+            if not options['keep']:
+                self._cleanup(partner, tribute_ids)
+
+    def _seed(self, memorial_count, tribute_count, seed):
+        rnd = random.Random(seed)
+        run_id = uuid.uuid4().hex[:8]
+        partner = Partner.objects.create(
+            name=f'Load test {run_id}',
+            legal_name=f'Load test {run_id}',
+            billing_email=f'loadtest-{run_id}@example.invalid',
+        )
+        memorials = Memorial.objects.bulk_create([
+            Memorial(
+                partner=partner,
+                first_name=rnd.choice(FIRST_NAMES),
+                last_name=rnd.choice(LAST_NAMES),
+                slug=f'loadtest-{run_id}-{i}',
+                short_code=f'lt{run_id}{i}'[:16],
+                family_contact_email='family@example.invalid',
+                status='active',
+            )
+            for i in range(memorial_count)
+        ])
+
+        # bulk_create не вызывает post_save: авто-модерация не стартует сама
+        tributes = Tribute.objects.bulk_create([
+            Tribute(
+                memorial=memorial,
+                author_name='Load test',
+                text=rnd.choice(TRIBUTE_TEMPLATES).format(
+                    first=memorial.first_name, last=memorial.last_name, n=i
+                ),
+            )
+            for i, memorial in enumerate(rnd.choice(memorials) for _ in range(tribute_count))
+        ])
+        return partner, [tribute.id for tribute in tributes]
+
+    def _run_eager(self, tribute_ids, concurrency):
+        def run_one(tribute_id):
+            try:
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    moderate_tribute_with_ai.apply(args=[tribute_id])
+                    latency = time.perf_counter() - started
+                return latency, len(queries.captured_queries)
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            results = list(executor.map(run_one, tribute_ids))
+        elapsed = time.perf_counter() - started
+
+        return elapsed, [latency for latency, _ in results], [count for _, count in results]
+
+    def _run_worker(self, tribute_ids, timeout):
+        enqueued_at = {}
+        started = time.perf_counter()
+        for tribute_id in tribute_ids:
+            enqueued_at[tribute_id] = time.time()
+            moderate_tribute_with_ai.delay(tribute_id)
+
+        # Готовность определяется по БД: вердикт ИИ или отклонение локальными проверками
+        latencies = {}
+        deadline = time.monotonic() + timeout
+        while len(latencies) < len(tribute_ids) and time.monotonic() < deadline:
+            done = Tribute.objects.filter(id__in=tribute_ids).exclude(
+                status='pending', ai_verdict='pending_ai'
+            ).exclude(id__in=list(latencies)).values_list('id', 'updated_at')
+            for tribute_id, updated_at in done:
+                latencies[tribute_id] = max(updated_at.timestamp() - enqueued_at[tribute_id], 0.0)
+            time.sleep(0.5)
+        elapsed = time.perf_counter() - started
+
+        if len(latencies) < len(tribute_ids):
+            self.stderr.write(f"Timed out: {len(tribute_ids) - len(latencies)} tributes still pending")
+        return elapsed, list(latencies.values())
+
+    def _report(self, tribute_ids, elapsed, latencies, query_counts, server):
+        latencies = sorted(latencies)
+        outcomes = Counter(Tribute.objects.filter(id__in=tribute_ids).values_list('ai_verdict', flat=True))
+
+        self.stdout.write(f"Completed: {len(latencies)}/{len(tribute_ids)} in {elapsed:.2f}s")
+        self.stdout.write(f"Throughput: {len(latencies) / elapsed if elapsed else 0:.2f} tributes/s")
+        self.stdout.write(
+            "Time to verdict: p50 {:.0f} ms, p95 {:.0f} ms, p99 {:.0f} ms, max {:.0f} ms".format(
+                *(_percentile(latencies, pct) * 1000 for pct in (50, 95, 99)),
+                (latencies[-1] if latencies else 0) * 1000,
+            )
+        )
+        if query_counts:
+            self.stdout.write(
+                f"DB queries per tribute: avg {sum(query_counts) / len(query_counts):.1f}, "
+                f"p95 {_percentile(sorted(query_counts), 95)}, max {max(query_counts)}"
+            )
+        else:
+            self.stdout.write("DB queries per tribute: not measured in worker mode")
+        self.stdout.write(f"Outcomes: {dict(outcomes)}")
+        if server is not None:
+            self.stdout.write(f"Fake Ollama: {server.stats()}")
+
+    def _cleanup(self, partner, tribute_ids):
+        from audits.models import AuditLog
+
+        AuditLog.objects.filter(target_type='tribute', target_id__in=tribute_ids).delete()
+        # Мемориалы и трибьюты удаляются каскадом
+        partner.delete()
@@ -0,0 +1,228 @@
+import json
+import os
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.db.models import Count
+from django.utils.dateparse import parse_date
+from memorials.models import Memorial
+from tributes.models import Tribute
+from tributes.tasks import moderate_tributes_batch
+
+DEFAULT_VERDICTS = ['flag_ai', 'error_ai']
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}"
+
+
+class Command(BaseCommand):
+    help = ('Re-run AI moderation over tributes still awaiting manual review '
+            '(flag_ai/error_ai by default), e.g. after a prompt, threshold or model change')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--partner', type=int, help='Partner id')
+        parser.add_argument('--memorial', help='Memorial id or short code')
+        parser.add_argument('--verdict', action='append', choices=['flag_ai', 'error_ai', 'pending_ai'],
+                            help=f"AI verdict to re-moderate, repeatable (default: {', '.join(DEFAULT_VERDICTS)})")
+        parser.add_argument('--since', help='Created on or after YYYY-MM-DD')
+        parser.add_argument('--until', help='Created on or before YYYY-MM-DD')
+        parser.add_argument('--mode', choices=['celery', 'local'], default='celery',
+                            help='celery: send batches to the workers; local: moderate in this process')
+        parser.add_argument('--chunk-size', type=int, default=50, help='Tributes per batch task')
+        parser.add_argument('--workers', type=int, default=4, help='Parallel batches in local mode')
+        parser.add_argument('--pause', type=float, default=0.0,
+                            help='Seconds to wait between dispatched batches in celery mode')
+        parser.add_argument('--lease-seconds', type=int, default=None,
+                            help='Lease for claimed tributes; in celery mode cover the expected queue wait')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after this many tributes')
+        parser.add_argument('--checkpoint', help='JSON file with the last finished id, updated as batches finish')
+        parser.add_argument('--resume', action='store_true', help='Continue after the id stored in --checkpoint')
+        parser.add_argument('--dry-run', action='store_true', help='Only count and list what would be re-moderated')
+
+    def handle(self, *args, **options):
+        if options['resume'] and not options['checkpoint']:
+            raise CommandError("--resume needs --checkpoint")
+
+        filters = self._filters(options)
+        queryset = Tribute.objects.filter(**filters)
+
+        last_id = 0
+        self._done_before = 0
+        if options['resume'] and os.path.exists(options['checkpoint']):
+            state = self._read_checkpoint(options['checkpoint'])
+            if state.get('filters') != self._describe(filters):
+                raise CommandError(f"Checkpoint was written for other filters: {state.get('filters')}")
+            last_id = state['last_id']
+            self._done_before = state.get('processed', 0)
+            self.stdout.write(f"Resuming after tribute {last_id} ({state.get('processed', 0)} done before)")
+
+        total = queryset.filter(id__gt=last_id).count()
+        if options['limit'] is not None:
+            total = min(total, options['limit'])
+        self.stdout.write(f"{total} tributes to re-moderate ({self._describe(filters)})")
+
+        if options['dry_run']:
+            self._dry_run(queryset.filter(id__gt=last_id), total)
+            return
+        if not total:
+            return
+
+        self._total = total
+        self._done = 0
+        self._started = time.monotonic()
+        self._summary = Counter()
+        chunks = self._chunks(queryset, last_id, options['chunk_size'], options['limit'])
+
+        try:
+            if options['mode'] == 'celery':
+                self._run_celery(chunks, filters, options)
+            else:
+                self._run_local(chunks, filters, options)
+        except KeyboardInterrupt:
+            self.stderr.write("Interrupted; re-run with --resume to continue from the checkpoint")
+            raise
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Finished {self._done} tributes in {_format_duration(time.monotonic() - self._started)}: "
+            f"{dict(self._summary)}"
+        ))
+
+    def _filters(self, options):
+        filters = {
+            'status': 'pending',
+            'ai_verdict__in': options['verdict'] or DEFAULT_VERDICTS,
+        }
+        if options['partner']:
+            filters['memorial__partner_id'] = options['partner']
+        if options['memorial']:
+            memorial_id = Memorial.objects.filter(short_code=options['memorial']).values_list('id', flat=True).first()
+            if memorial_id is None and options['memorial'].isdigit():
+                memorial_id = Memorial.objects.filter(id=int(options['memorial'])).values_list('id', flat=True).first()
+            if memorial_id is None:
+                raise CommandError(f"Memorial {options['memorial']} not found")
+            filters['memorial_id'] = memorial_id
+        for option, lookup in (('since', 'created_at__date__gte'), ('until', 'created_at__date__lte')):
+            if options[option]:
+                try:
+                    value = parse_date(options[option])
+                except ValueError:  # правильный формат, но несуществующая дата
+                    value = None
+                if value is None:
+                    raise CommandError(f"--{option} must be YYYY-MM-DD")
+                filters[lookup] = value
+        return filters
+
+    @staticmethod
+    def _describe(filters):
+        return {key: value if isinstance(value, (int, str, list)) else str(value) for key, value in filters.items()}
+
+    def _chunks(self, queryset, last_id, chunk_size, limit):
+        """Id по возрастанию страницами по chunk_size: WHERE id > последний id, без OFFSET."""
+        remaining = limit
+        while remaining is None or remaining > 0:
+            size = chunk_size if remaining is None else min(chunk_size, remaining)
+            ids = list(queryset.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:size])
+            if not ids:
+                return
+            last_id = ids[-1]
+            if remaining is not None:
+                remaining -= len(ids)
+            yield ids
+
+    def _dry_run(self, queryset, total):
+        by_verdict = dict(queryset.values_list('ai_verdict').annotate(count=Count('id')).order_by())
+        self.stdout.write(f"By verdict: {by_verdict}")
+        sample = list(queryset.order_by('id').values_list('id', 'memorial__short_code', 'text')[:10])
+        for tribute_id, short_code, text in sample:
+            self.stdout.write(f"  #{tribute_id} [{short_code}] {text[:70]!r}")
+        if total > len(sample):
+            self.stdout.write(f"  ... and {total - len(sample)} more")
+
+    def _run_celery(self, chunks, filters, options):
+        for ids in chunks:
+            lease_token, claimed = Tribute.claim_for_remoderation(
+                Tribute.objects.filter(id__in=ids), seconds=options['lease_seconds']
+            )
+            if claimed:
+                try:
+                    moderate_tributes_batch.delay(claimed, lease_token=lease_token)
+                except Exception:
+                    # Задача не ушла: снимаем аренду, трибьюты остаются в обычной очереди ИИ
+                    Tribute.objects.filter(ai_lease_token=lease_token).update(
+                        ai_lease_token=None, ai_lease_expires_at=None
+                    )
+                    raise
+            self._summary['dispatched'] += len(claimed)
+            self._summary['skipped'] += len(ids) - len(claimed)
+            self._progress(len(ids), ids[-1], filters, options, verb='dispatched')
+            if options['pause']:
+                time.sleep(options['pause'])
+
+    def _run_local(self, chunks, filters, options):
+        workers = max(1, options['workers'])
+        pending = deque()  # (последний id пакета, future) в порядке отправки
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='remoderate') as executor:
+            for ids in chunks:
+                pending.append((ids, executor.submit(self._moderate_chunk, ids, options['lease_seconds'])))
+                if len(pending) >= workers * 2:
+                    wait([future for _, future in pending], return_when=FIRST_COMPLETED)
+                    self._collect(pending, filters, options)
+            while pending:
+                wait([future for _, future in pending], return_when=FIRST_COMPLETED)
+                self._collect(pending, filters, options)
+
+    def _collect(self, pending, filters, options):
+        # Контрольная точка двигается только по непрерывному префиксу завершённых пакетов
+        while pending and pending[0][1].done():
+            ids, future = pending.popleft()
+            self._summary.update(future.result())
+            self._progress(len(ids), ids[-1], filters, options, verb='moderated')
+
+    @staticmethod
+    def _moderate_chunk(ids, lease_seconds):
+        close_old_connections()
+        try:
+            lease_token, claimed = Tribute.claim_for_remoderation(
+                Tribute.objects.filter(id__in=ids), seconds=lease_seconds
+            )
+            result = Counter(skipped=len(ids) - len(claimed))
+            if claimed:
+                moderate_tributes_batch(claimed, lease_token=lease_token)
+                result.update(Tribute.objects.filter(id__in=claimed).values_list('ai_verdict', flat=True))
+            return result
+        finally:
+            close_old_connections()
+
+    def _progress(self, count, last_id, filters, options, verb):
+        self._done += count
+        elapsed = time.monotonic() - self._started
+        rate = self._done / elapsed if elapsed else 0.0
+        eta = (self._total - self._done) / rate if rate else 0.0
+        self.stdout.write(
+            f"{verb} {self._done}/{self._total} ({self._done / self._total:.1%}), "
+            f"{rate:.1f} tributes/s, ETA {_format_duration(eta)}"
+        )
+        if options['checkpoint']:
+            self._write_checkpoint(options['checkpoint'], {
+                'last_id': last_id,
+                'processed': self._done_before + self._done,
+                'filters': self._describe(filters),
+            })
+
+    @staticmethod
+    def _read_checkpoint(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    @staticmethod
+    def _write_checkpoint(path, state):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,74 @@
+import math
+from collections import Counter
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from tributes.models import Tribute
+
+# Итоговый статус, который противоречит вердикту ИИ: решение изменил модератор
+_OVERTURNED = {('approved_ai', 'rejected'), ('rejected_ai', 'approved')}
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = 'Per-route latency and verdict distribution of LLM moderation (AI_MODERATION_SETTINGS["routing"])'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='Tributes moderated in the last N days')
+        parser.add_argument('--partner', type=int, help='Partner id')
+
+    def handle(self, *args, **options):
+        queryset = Tribute.objects.filter(
+            ai_moderated_at__gte=timezone.now() - timedelta(days=options['days']),
+            ai_moderation_result__isnull=False,
+        )
+        if options['partner']:
+            queryset = queryset.filter(memorial__partner_id=options['partner'])
+
+        routes = {}
+        for ai_result, status in queryset.values_list('ai_moderation_result', 'status').iterator(chunk_size=2000):
+            # Локальные проверки и предклассификатор пишут результат без llm_stats
+            if not isinstance(ai_result, dict) or not ('route' in ai_result or 'llm_stats' in ai_result):
+                continue
+            if ai_result.get('decided_by', 'llm') != 'llm':
+                continue
+            route = routes.setdefault(ai_result.get('route') or 'unrouted', {
+                'count': 0, 'verdicts': Counter(), 'cache_hits': 0, 'latencies': [], 'tokens': [], 'overturned': 0,
+            })
+            verdict = ai_result.get('verdict', 'unknown')
+            route['count'] += 1
+            route['verdicts'][verdict] += 1
+            route['overturned'] += (verdict, status) in _OVERTURNED
+            if ai_result.get('cache_hit'):
+                route['cache_hits'] += 1
+                continue
+            llm_stats = ai_result.get('llm_stats') or {}
+            if llm_stats.get('time_to_verdict_ms') is not None:
+                route['latencies'].append(llm_stats['time_to_verdict_ms'])
+            if llm_stats.get('tokens_generated') is not None:
+                route['tokens'].append(llm_stats['tokens_generated'])
+
+        total = sum(route['count'] for route in routes.values())
+        self.stdout.write(f"{total} LLM verdicts in the last {options['days']} days")
+        for name, route in sorted(routes.items(), key=lambda item: -item[1]['count']):
+            latencies = sorted(route['latencies'])
+            verdicts = ', '.join(
+                f"{verdict} {count / route['count']:.0%}" for verdict, count in route['verdicts'].most_common()
+            )
+            mean_tokens = sum(route['tokens']) / len(route['tokens']) if route['tokens'] else None
+            self.stdout.write(
+                f"\n{name}: {route['count']} ({route['count'] / total:.0%}), cache hits {route['cache_hits']}, "
+                f"overturned by moderators {route['overturned']}"
+            )
+            self.stdout.write(f"  verdicts: {verdicts}")
+            self.stdout.write(
+                f"  time to verdict: p50 {_percentile(latencies, 50)} ms, p95 {_percentile(latencies, 95)} ms, "
+                f"max {latencies[-1] if latencies else None} ms; "
+                f"tokens generated: {round(mean_tokens) if mean_tokens is not None else None} on average"
+            )
@@ -0,0 +1,47 @@
+import asyncio
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from tributes.async_runner import AsyncModerationRunner, httpx
+
+
+class Command(BaseCommand):
+    help = 'Run the asyncio AI moderation worker: claims pending tributes and keeps many Ollama calls in flight'
+
+    def add_arguments(self, parser):
+        runner_settings = settings.AI_MODERATION_SETTINGS.get('async_runner', {})
+        parser.add_argument('--max-in-flight', type=int, default=runner_settings.get('max_in_flight', 16),
+                            help='Concurrent Ollama requests')
+        parser.add_argument('--batch-size', type=int, default=runner_settings.get('batch_size', 20),
+                            help='Tributes claimed per database round-trip')
+        parser.add_argument('--db-threads', type=int, default=runner_settings.get('db_threads', 4),
+                            help='Threads for ORM and cache work')
+        parser.add_argument('--poll-interval', type=float, default=runner_settings.get('poll_interval_seconds', 5),
+                            help='Seconds to wait when nothing is pending')
+        parser.add_argument('--once', action='store_true', help='Exit when the backlog is empty')
+
+    def handle(self, *args, **options):
+        if httpx is None:
+            raise CommandError("httpx is not installed (pip install httpx)")
+
+        runner = AsyncModerationRunner(
+            max_in_flight=options['max_in_flight'],
+            batch_size=options['batch_size'],
+            db_threads=options['db_threads'],
+            poll_interval=options['poll_interval'],
+            once=options['once'],
+        )
+
+        async def main():
+            loop = asyncio.get_running_loop()
+            # SIGTERM/SIGINT: новые трибьюты не берём, начатые дорабатываем
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.add_signal_handler(sig, runner.stop)
+            return await runner.run()
+
+        self.stdout.write(
+            f"Async moderation runner: {options['max_in_flight']} requests in flight, "
+            f"{options['db_threads']} DB threads"
+        )
+        summary = asyncio.run(main())
+        self.stdout.write(self.style.SUCCESS(f"Stopped: {summary}"))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from tributes.fake_ollama import FakeOllamaServer, FakeOllamaConfig
+
+
+class Command(BaseCommand):
+    help = 'Run a local stand-in for the Ollama /api/generate endpoint (latency, errors, garbage, streaming)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=11434)
+        parser.add_argument('--latency-ms', type=float, default=800, help='Median response latency')
+        parser.add_argument('--latency-sigma', type=float, default=0.5, help='Log-normal spread of the latency')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of HTTP 500 responses')
+        parser.add_argument('--garbage-rate', type=float, default=0.0, help='Share of malformed model outputs')
+        parser.add_argument('--chatter-rate', type=float, default=0.2, help='Share of JSON wrapped in extra text')
+        parser.add_argument('--load-ms', type=float, default=0,
+                            help='Model load time after being idle longer than keep_alive')
+        parser.add_argument('--prompt-eval-ms-per-token', type=float, default=0.0,
+                            help='Prompt evaluation cost; a prefix shared with the previous request is free')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        config = FakeOllamaConfig(
+            latency_ms=options['latency_ms'],
+            latency_sigma=options['latency_sigma'],
+            error_rate=options['error_rate'],
+            garbage_rate=options['garbage_rate'],
+            chatter_rate=options['chatter_rate'],
+            seed=options['seed'],
+            load_ms=options['load_ms'],
+            prompt_eval_ms_per_token=options['prompt_eval_ms_per_token'],
+        )
+        server = FakeOllamaServer(options['host'], options['port'], config)
+        self.stdout.write(f"Fake Ollama listening on {server.url} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served: {server.stats()}")
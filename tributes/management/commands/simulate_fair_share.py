@@ -0,0 +1,114 @@
+import math
+from collections import Counter, deque
+from django.core.management.base import BaseCommand
+from tributes.scheduler import FairShareScheduler
+
+LARGE_PARTNER = 1
+TICK_MS = 100
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = ('Simulate moderation scheduling during one partner\'s burst and compare the wait times '
+            'of small partners under plain FIFO and fair-share dispatch')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--burst', type=int, default=2000, help='Tributes the large partner submits at once')
+        parser.add_argument('--small-partners', type=int, default=5)
+        parser.add_argument('--small-interval', type=float, default=10.0,
+                            help='Seconds between tributes of each small partner')
+        parser.add_argument('--duration', type=float, default=600.0, help='Simulated seconds')
+        parser.add_argument('--workers', type=int, default=4, help='Concurrent moderations')
+        parser.add_argument('--service-seconds', type=float, default=2.0, help='Time to moderate one tribute')
+        parser.add_argument('--dispatch-interval', type=float, default=5.0, help='Seconds between dispatcher runs')
+        parser.add_argument('--max-in-flight', type=int, default=32, help='Queued plus running tributes')
+        parser.add_argument('--large-weight', type=float, default=1.0)
+        parser.add_argument('--large-cap', type=int, default=None, help='In-flight limit of the large partner')
+
+    def handle(self, *args, **options):
+        arrivals = self._arrivals(options)
+        self.stdout.write(
+            f"{options['burst']} tributes from the large partner at t=0, {options['small_partners']} small partners "
+            f"every {options['small_interval']:g}s, {options['workers']} workers x {options['service_seconds']:g}s"
+        )
+        for policy in ('fifo', 'fair'):
+            waits, unserved = self._simulate(policy, arrivals, options)
+            self._report(policy, waits, unserved)
+
+    def _arrivals(self, options):
+        """[(время прихода в мс, партнёр)] по возрастанию времени."""
+        arrivals = [(0, LARGE_PARTNER)] * options['burst']
+        step = int(options['small_interval'] * 1000)
+        duration = int(options['duration'] * 1000)
+        for index in range(options['small_partners']):
+            # Небольшой сдвиг, чтобы малые партнёры не приходили в один тик
+            for at in range(index * TICK_MS, duration, step):
+                arrivals.append((at, LARGE_PARTNER + 1 + index))
+        return sorted(arrivals, key=lambda item: item[0])
+
+    def _simulate(self, policy, arrivals, options):
+        scheduler = FairShareScheduler(
+            weights={LARGE_PARTNER: options['large_weight']},
+            max_in_flight={LARGE_PARTNER: options['large_cap']} if options['large_cap'] else None,
+        )
+        service_ms = int(options['service_seconds'] * 1000)
+        dispatch_ms = int(options['dispatch_interval'] * 1000)
+        duration = int(options['duration'] * 1000)
+
+        incoming = deque(arrivals)
+        backlog = {}            # партнёр -> очередь времён прихода (трибьюты в БД)
+        broker = deque()        # (партнёр, время прихода) в очереди Celery
+        running = []            # (время окончания, партнёр)
+        in_flight = Counter()
+        waits = {}
+
+        for now in range(0, duration, TICK_MS):
+            while incoming and incoming[0][0] <= now:
+                at, partner_id = incoming.popleft()
+                if policy == 'fifo':
+                    broker.append((partner_id, at))
+                    in_flight[partner_id] += 1
+                else:
+                    backlog.setdefault(partner_id, deque()).append(at)
+
+            if policy == 'fair' and now % dispatch_ms == 0:
+                slots = options['max_in_flight'] - sum(in_flight.values())
+                counts = {partner_id: len(queue) for partner_id, queue in backlog.items()}
+                for partner_id in scheduler.schedule(counts, in_flight, slots):
+                    broker.append((partner_id, backlog[partner_id].popleft()))
+                    in_flight[partner_id] += 1
+
+            finished = [item for item in running if item[0] <= now]
+            for _, partner_id in finished:
+                in_flight[partner_id] -= 1
+            running = [item for item in running if item[0] > now]
+            while broker and len(running) < options['workers']:
+                partner_id, at = broker.popleft()
+                waits.setdefault(partner_id, []).append((now - at) / 1000)
+                running.append((now + service_ms, partner_id))
+
+        unserved = Counter(partner_id for partner_id, _ in broker)
+        for partner_id, queue in backlog.items():
+            unserved[partner_id] += len(queue)
+        return waits, unserved
+
+    def _report(self, policy, waits, unserved):
+        self.stdout.write(f"\n{policy}:")
+        groups = {
+            'large partner': [LARGE_PARTNER],
+            'small partners': [partner_id for partner_id in set(waits) | set(unserved) if partner_id != LARGE_PARTNER],
+        }
+        for label, partner_ids in groups.items():
+            values = sorted(wait for partner_id in partner_ids for wait in waits.get(partner_id, []))
+            left = sum(unserved.get(partner_id, 0) for partner_id in partner_ids)
+            self.stdout.write(
+                f"  {label:<15} started {len(values):>5}, waiting at end {left:>5}, "
+                f"wait p50 {_percentile(values, 50):7.1f}s  p95 {_percentile(values, 95):7.1f}s  "
+                f"max {values[-1] if values else 0.0:7.1f}s"
+            )
@@ -0,0 +1,103 @@
+import random
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from tributes.models import Tribute
+from tributes.preclassifier import CharNgramNaiveBayes, LABEL_VERDICTS
+
+
+class Command(BaseCommand):
+    help = 'Train the local tribute pre-classifier from moderated tributes and save it as a JSON artifact'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help='Artifact path (default: preclassifier.model_path)')
+        parser.add_argument('--holdout', type=float, default=0.2, help='Share of tributes kept for evaluation')
+        parser.add_argument('--ngram-min', type=int, default=2)
+        parser.add_argument('--ngram-max', type=int, default=4)
+        parser.add_argument('--max-features', type=int, default=20000)
+        parser.add_argument('--min-count', type=int, default=2)
+        parser.add_argument('--min-samples', type=int, default=200, help='Refuse to train on fewer tributes')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--dry-run', action='store_true', help='Evaluate only, do not write the artifact')
+
+    def handle(self, *args, **options):
+        preclassifier_settings = settings.AI_MODERATION_SETTINGS.get('preclassifier', {})
+        output = options['output'] or preclassifier_settings.get('model_path')
+        if not output and not options['dry_run']:
+            raise CommandError("No --output and no AI_MODERATION_SETTINGS['preclassifier']['model_path']")
+
+        samples = self._load_samples()
+        if len(samples) < options['min_samples']:
+            raise CommandError(f"Only {len(samples)} labelled tributes, need at least {options['min_samples']}")
+
+        random.Random(options['seed']).shuffle(samples)
+        split = int(len(samples) * (1 - options['holdout']))
+        train, holdout = samples[:split], samples[split:]
+
+        started = time.perf_counter()
+        model = self._fit(train, options)
+        self.stdout.write(
+            f"Trained on {len(train)} tributes {model.doc_counts} in {time.perf_counter() - started:.2f}s, "
+            f"{len(model._vocabulary)} n-grams"
+        )
+        if holdout:
+            self._evaluate(model, holdout, preclassifier_settings)
+
+        if options['dry_run']:
+            return
+        # Итоговая модель обучается на всех данных
+        model = self._fit(samples, options)
+        model.save(str(output))
+        self.stdout.write(self.style.SUCCESS(f"Saved pre-classifier to {output}"))
+
+    def _load_samples(self):
+        """
+        (текст, итоговый статус) трибьютов, прошедших модерацию. Решения самого
+        классификатора пропускаются, чтобы он не обучался на своих ответах.
+        """
+        queryset = Tribute.objects.filter(
+            status__in=list(LABEL_VERDICTS)
+        ).exclude(ai_verdict='pending_ai').values_list('text', 'status', 'ai_moderation_result')
+
+        samples = []
+        for text, status, ai_result in queryset.iterator(chunk_size=2000):
+            if isinstance(ai_result, dict) and ai_result.get('decided_by') == 'preclassifier':
+                continue
+            samples.append((text, status))
+        return samples
+
+    def _fit(self, samples, options):
+        return CharNgramNaiveBayes(ngram_range=(options['ngram_min'], options['ngram_max'])).fit(
+            [text for text, _ in samples],
+            [label for _, label in samples],
+            max_features=options['max_features'],
+            min_count=options['min_count'],
+        )
+
+    def _evaluate(self, model, holdout, preclassifier_settings):
+        """Точность и покрытие на отложенной выборке при нескольких порогах."""
+        decide_labels = preclassifier_settings.get('decide_labels', ['approved'])
+        max_length = preclassifier_settings.get('max_text_length', 400)
+        predictions = []
+        started = time.perf_counter()
+        for text, actual in holdout:
+            label, probability = model.predict(text)
+            predictions.append((label, probability, actual, len(text) <= max_length))
+        per_text_ms = (time.perf_counter() - started) * 1000 / len(holdout)
+
+        accuracy = sum(label == actual for label, _, actual, _ in predictions) / len(predictions)
+        self.stdout.write(f"Holdout: {len(holdout)} tributes, accuracy {accuracy:.3f}, {per_text_ms:.2f} ms/tribute")
+
+        configured = preclassifier_settings.get('min_confidence', 0.98)
+        for threshold in sorted({0.9, 0.95, 0.98, 0.99, 0.995, configured}):
+            decided = [
+                (label, actual) for label, probability, actual, short in predictions
+                if short and label in decide_labels and probability >= threshold
+            ]
+            correct = sum(label == actual for label, actual in decided)
+            precision = correct / len(decided) if decided else 0.0
+            marker = ' (configured)' if threshold == configured else ''
+            self.stdout.write(
+                f"  threshold {threshold:.3f}{marker}: decided locally {len(decided) / len(holdout):.1%}, "
+                f"precision {precision:.3f}, wrong {len(decided) - correct}"
+            )
@@ -0,0 +1,140 @@
+from prometheus_client import Counter, Gauge, Histogram
+
+# Метрики ИИ-модерации. Отдаются через /metrics (django_prometheus).
+# Чтобы в /metrics попадали и метрики Celery-воркеров, веб-процессы и воркеры
+# должны запускаться с общим PROMETHEUS_MULTIPROC_DIR (каталог очищается при деплое).
+
+PIPELINE_STAGES = (
+    'pre_moderation',
+    'insult_check',
+    'name_analysis',
+    'preclassifier',
+    'prompt_build',
+    'ollama_roundtrip',
+    'parse',
+    'name_adjustment',
+    'apply_verdict',
+    'audit_write',
+)
+
+OUTCOMES = (
+    'pre_moderation_reject',
+    'insult_reject',
+    'wrong_name',
+    'preclassifier_verdict',
+    'llm_verdict',
+    'verdict_cache_hit',  # подмножество llm_verdict: вердикт взят из кэша
+    'fallback',
+    'retry_scheduled',
+    'parked',
+    'error_ai',
+)
+
+# От микросекунд (словари) до минуты (Ollama на CPU)
+_STAGE_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+STAGE_SECONDS = Histogram(
+    'everest_ai_moderation_stage_seconds',
+    'Duration of AI moderation pipeline stages',
+    ['stage'],
+    buckets=_STAGE_BUCKETS,
+)
+
+OUTCOMES_TOTAL = Counter(
+    'everest_ai_moderation_outcomes',
+    'Terminal outcomes of AI moderation per tribute',
+    ['outcome'],
+)
+
+# Фазы ответа Ollama: загрузка модели, вычисление промпта, время до первого токена
+LLM_PHASE_SECONDS = Histogram(
+    'everest_ollama_phase_seconds',
+    'Ollama model load, prompt evaluation and time to first token',
+    ['phase'],
+    buckets=_STAGE_BUCKETS,
+)
+
+# Маршруты модерации (AI_MODERATION_SETTINGS['routing']): задержка ответа модели
+# и распределение вердиктов. Метка route - имя маршрута из настроек
+ROUTE_SECONDS = Histogram(
+    'everest_ai_moderation_route_seconds',
+    'Time to verdict of LLM requests per moderation route',
+    ['route'],
+    buckets=_STAGE_BUCKETS,
+)
+
+ROUTE_VERDICTS_TOTAL = Counter(
+    'everest_ai_moderation_route_verdicts',
+    'LLM verdicts per moderation route (cache hits included)',
+    ['route', 'verdict'],
+)
+
+# Кэш вердиктов (tributes/verdict_cache.py) в каждом процессе: hit - из памяти процесса,
+# shared_hit - из общего кэша Django, miss - запрос к модели
+VERDICT_CACHE_EVENTS = (
+    'hit',
+    'shared_hit',
+    'miss',
+    'store',
+    'eviction',
+    'expired',
+)
+
+VERDICT_CACHE_EVENTS_TOTAL = Counter(
+    'everest_ai_verdict_cache_events',
+    'AI verdict cache lookups, stores and evictions',
+    ['event'],
+)
+
+BACKLOG = Gauge(
+    'everest_ai_moderation_backlog',
+    'Tributes waiting for AI moderation',
+    ['state'],
+    multiprocess_mode='livemax',
+)
+
+# Дочерние метрики с метками создаются один раз, а не на каждый трибьют
+_stage_histograms = {name: STAGE_SECONDS.labels(stage=name) for name in PIPELINE_STAGES}
+_outcome_counters = {name: OUTCOMES_TOTAL.labels(outcome=name) for name in OUTCOMES}
+_verdict_cache_counters = {name: VERDICT_CACHE_EVENTS_TOTAL.labels(event=name) for name in VERDICT_CACHE_EVENTS}
+_llm_phases = {
+    key: LLM_PHASE_SECONDS.labels(phase=phase)
+    for key, phase in (('load_ms', 'load'), ('prompt_eval_ms', 'prompt_eval'),
+                       ('time_to_first_token_ms', 'first_token'))
+}
+
+
+def stage(name):
+    """Контекстный менеджер: with stage('parse'): ..."""
+    return _stage_histograms[name].time()
+
+
+def record_outcome(outcome):
+    _outcome_counters[outcome].inc()
+
+
+def record_verdict_cache(event, count=1):
+    _verdict_cache_counters[event].inc(count)
+
+
+def record_llm_timings(llm_stats):
+    """Тайминги из llm_stats (мс); отсутствующие (None) пропускаются."""
+    for key, histogram in _llm_phases.items():
+        value = llm_stats.get(key)
+        if value is not None:
+            histogram.observe(value / 1000)
+
+
+def record_route(route, ai_result, cache_hit=False):
+    """Вердикт маршрута и, если был запрос к модели, время до вердикта."""
+    ROUTE_VERDICTS_TOTAL.labels(route=route, verdict=ai_result.get('verdict', 'unknown')).inc()
+    time_to_verdict_ms = (ai_result.get('llm_stats') or {}).get('time_to_verdict_ms')
+    if not cache_hit and time_to_verdict_ms is not None:
+        ROUTE_SECONDS.labels(route=route).observe(time_to_verdict_ms / 1000)
+
+
+def set_backlog(state, value):
+    BACKLOG.labels(state=state).set(value)
@@ -1,12 +1,47 @@
-from django.db import models
+import uuid
+from datetime import timedelta
+from contextlib import nullcontext
+from django.db import connections, models, transaction
+from django.db.models import Q
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from model_utils import FieldTracker
+from . import metrics
 from django.utils import timezone
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+# Токен отложенной работы: трибьют не арендован, его заберёт drain_parked_moderation
+AI_LEASE_PARKED = 'parked'
+
+
+# Поля, которые записывает применение вердикта ИИ
+AI_VERDICT_FIELDS = [
+    'ai_moderation_result',
+    'ai_moderated_at',
+    'ai_confidence',
+    'ai_verdict',
+    'status',
+    'approved_at',
+    'ai_lease_token',
+    'ai_lease_expires_at',
+]
+
+
+def _ai_lease_seconds():
+    return settings.AI_MODERATION_SETTINGS.get('lease_seconds', 300)
+
+
+def _ai_claimable(now):
+    """Трибьют ждёт ИИ-модерации и не арендован (или аренда истекла)."""
+    return (
+        Q(status='pending', ai_moderated_at__isnull=True)
+        & (Q(ai_lease_expires_at__isnull=True) | Q(ai_lease_expires_at__lte=now))
+    )
+
+
 class Tribute(models.Model):
     memorial = models.ForeignKey(
         'memorials.Memorial', 
@@ -69,6 +104,23 @@ class Tribute(models.Model):
         verbose_name=_('AI Verdict')
     )
 
+    # === АРЕНДА ДЛЯ ВОРКЕРОВ ИИ-МОДЕРАЦИИ ===
+    # Воркер, поставивший трибьют в очередь, получает токен аренды; пока аренда
+    # не истекла, повторная постановка в очередь ничего не делает
+    ai_lease_token = models.CharField(
+        max_length=32,
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_('AI Lease Token')
+    )
+    ai_lease_expires_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name=_('AI Lease Expires At')
+    )
+
     tracker = FieldTracker()  
 
     class Meta:
@@ -79,6 +131,7 @@ class Tribute(models.Model):
             # Индексы для быстрого поиска по ИИ-полям
             models.Index(fields=['ai_verdict', 'created_at']),
             models.Index(fields=['status', 'ai_verdict']),
+            models.Index(fields=['ai_verdict', 'ai_lease_expires_at']),
         ]
         ordering = ['-created_at']          
     
@@ -98,36 +151,38 @@ class Tribute(models.Model):
 
    
     # === МЕТОДЫ ДЛЯ ИИ-МОДЕРАЦИИ ===
-    def apply_ai_verdict(self, ai_result):
+    @staticmethod
+    def _ai_verdict_policy():
+        """Пороги уверенности и строгость проверки имён из настроек."""
+        thresholds = settings.AI_MODERATION_SETTINGS.get('confidence_thresholds', {})
+        return {
+            'auto_approve': thresholds.get('auto_approve', 0.8),
+            'auto_reject': thresholds.get('auto_reject', 0.7),
+            'name_strictness': settings.AI_MODERATION_SETTINGS.get('name_verification_strictness', 'strict'),
+        }
+
+    def _decide_ai_verdict(self, ai_result, policy):
         """
-        Применяет вердикт ИИ к трибьюту и логирует действие.
+        Записывает результат ИИ в поля трибьюта и выбирает действие по порогам
+        и флагам имён. Ничего не сохраняет. Возвращает (action_taken, auto_action).
         """
-        from audits.models import AuditLog  
-    
         verdict = ai_result.get('verdict', 'flag_ai')
         confidence = ai_result.get('confidence', 0.5)
-        reasoning = ai_result.get('reasoning', '')
         flags = ai_result.get('flags', [])
         name_context = ai_result.get('name_context', 'unknown')
-    
-        # Получаем пороги из настроек
-        thresholds = settings.AI_MODERATION_SETTINGS.get('confidence_thresholds', {})
-        auto_approve = thresholds.get('auto_approve', 0.8)
-        auto_reject = thresholds.get('auto_reject', 0.7)
+        auto_approve = policy['auto_approve']
+        auto_reject = policy['auto_reject']
 
-        # Настройки проверки имён
-        name_strictness = settings.AI_MODERATION_SETTINGS.get('name_verification_strictness', 'strict')
-        name_check = settings.AI_MODERATION_SETTINGS.get('name_check', {})
-        
-        logger.info(f"Applying AI verdict for tribute {self.id}: verdict={verdict}, confidence={confidence}")
-        logger.info(f"Thresholds: approve={auto_approve}, reject={auto_reject}")
-        logger.info(f"Name context: {name_context}, Flags: {flags}")
+        logger.debug("Applying AI verdict for tribute %s: verdict=%s, confidence=%s", self.id, verdict, confidence)
+        logger.debug("Thresholds: approve=%s, reject=%s", auto_approve, auto_reject)
+        logger.debug("Name context: %s, Flags: %s", name_context, flags)
 
         # Сохраняем результат ИИ
         self.ai_moderation_result = ai_result
         self.ai_moderated_at = timezone.now()
         self.ai_confidence = confidence
         self.ai_verdict = verdict
+        self.clear_ai_lease()
         
         action_taken = None
         auto_action = False
@@ -141,14 +196,14 @@ class Tribute(models.Model):
             self.status = 'pending'  # На ручную проверку
             action_taken = 'ai_flag_name_mismatch'
             auto_action = False
-            logger.warning(f"Critical name error for tribute {self.id}: {name_context}")
+            logger.warning("Critical name error for tribute %s: %s", self.id, name_context)
 
         # 2. Затем проверяем REJECT (самый высокий приоритет после критических ошибок)
         elif confidence >= auto_reject and verdict == 'rejected_ai':
             self.status = 'rejected'
             action_taken = 'ai_auto_reject'
             auto_action = True
-            logger.info(f"Auto-rejected tribute {self.id}")    
+            logger.debug("Auto-rejected tribute %s", self.id)    
     
         # 3. Потом APPROVE
         elif confidence >= auto_approve and verdict == 'approved_ai':
@@ -156,100 +211,323 @@ class Tribute(models.Model):
             name_warnings = ['different_name_mentioned', 'partial_name_first_only', 'partial_name_last_only']
             has_name_warning = any(warning in str(flags) for warning in name_warnings)
 
-            if has_name_warning and name_strictness == 'strict':
+            if has_name_warning and policy['name_strictness'] == 'strict':
                 self.status = 'pending'
                 action_taken = 'ai_flag_name_warning'
                 auto_action = False
-                logger.info(f"Name warning in strict mode: tribute {self.id} flagged")
+                logger.debug("Name warning in strict mode: tribute %s flagged", self.id)
             else:
                 self.status = 'approved'
                 self.approved_at = timezone.now()
                 action_taken = 'ai_auto_approve'
                 auto_action = True
-                logger.info(f"Auto-approved tribute {self.id}")
+                logger.debug("Auto-approved tribute %s", self.id)
             
         else:
             action_taken = 'ai_flag_review'
-            logger.info(f"Tribute {self.id} needs manual review (confidence={confidence})")
+            logger.debug("Tribute %s needs manual review (confidence=%s)", self.id, confidence)
     
         # Если не было авто-действия и статус не изменился
         if not action_taken and self.status == 'pending':
             action_taken = 'ai_flag_review'
-            
-    
-        # Сохраняем изменения
-        self.save(update_fields=[
-            'ai_moderation_result',
-            'ai_moderated_at', 
-            'ai_confidence',
-            'ai_verdict',
-            'status',
-            'approved_at'
-        ])
-    
-        # Логируем действие ИИ
-        AuditLog.objects.create(
+
+        # То же, что делает save(); bulk_update его не вызывает
+        if self.status != 'approved':
+            self.approved_at = None
+
+        return action_taken, auto_action
+
+    def _ai_audit_log(self, ai_result, action_taken, auto_action, policy):
+        """
+        Несохранённая запись AuditLog о решении ИИ. partner_id берётся из уже
+        загруженного мемориала; если он не загружен, его заполнит
+        audits.sink.fill_scope по memorial_id одним запросом на пачку.
+        """
+        from audits.models import AuditLog
+
+        partner_id = self.memorial.partner_id if Tribute.memorial.is_cached(self) else None
+        return AuditLog(
             actor_type='ai_moderator',
             actor_id=None,
             action=action_taken or 'ai_moderation_complete',
             target_type='tribute',
             target_id=self.id,
+            partner_id=partner_id,
+            memorial_id=self.memorial_id,
             metadata={
                 'tribute_id': self.id,
-                'memorial_id': self.memorial.id,
-                'ai_verdict': verdict,
-                'ai_confidence': confidence,
-                'ai_reasoning': reasoning,
-                'ai_flags': flags,
-                'name_context': name_context,
+                'memorial_id': self.memorial_id,
+                'ai_verdict': ai_result.get('verdict', 'flag_ai'),
+                'ai_confidence': ai_result.get('confidence', 0.5),
+                'ai_reasoning': ai_result.get('reasoning', ''),
+                'ai_flags': ai_result.get('flags', []),
+                'name_context': ai_result.get('name_context', 'unknown'),
+                'verdict_cache_hit': ai_result.get('cache_hit', False),
+                'decided_by': ai_result.get('decided_by', 'llm'),
                 'auto_action_taken': auto_action,
                 'gdpr_relevant': True,
                 'final_status': self.status,
                 'thresholds_used': { 
-                'auto_approve': auto_approve,
-                'auto_reject': auto_reject
+                'auto_approve': policy['auto_approve'],
+                'auto_reject': policy['auto_reject']
                 }
             }
         )
+
+    def apply_ai_verdict(self, ai_result):
+        """
+        Применяет вердикт ИИ к трибьюту и логирует действие.
+        """
+        policy = self._ai_verdict_policy()
+        action_taken, auto_action = self._decide_ai_verdict(ai_result, policy)
+
+        # Сохраняем изменения
+        with metrics.stage('apply_verdict'):
+            self.save(update_fields=AI_VERDICT_FIELDS)
+    
+        # Логируем действие ИИ
+        with metrics.stage('audit_write'):
+            from audits import sink
+            sink.record(self._ai_audit_log(ai_result, action_taken, auto_action, policy))
     
         return {
             'action': action_taken,
             'auto_action': auto_action,
-            'verdict': verdict,
-            'confidence': confidence
+            'verdict': ai_result.get('verdict', 'flag_ai'),
+            'confidence': ai_result.get('confidence', 0.5)
         }
+
+    @classmethod
+    def apply_ai_verdicts(cls, results):
+        """
+        Пакетный вариант apply_ai_verdict для списка пар (трибьют, результат ИИ):
+        одна транзакция и один bulk_update независимо от размера пакета, записи
+        AuditLog уходят одной пачкой в audits.sink.record_many. Решения
+        и метаданные аудита те же.
+
+        bulk_update не вызывает post_save, поэтому запись 'moderate_tribute'
+        о смене статуса, которую обычно делает audits.signals, добавляется
+        в ту же пачку. Возвращает список действий в порядке results.
+        """
+        from audits import sink
+        from audits.signals import tribute_status_audit_log
+
+        results = list(results)
+        if not results:
+            return []
+
+        # memorial нужен для записи о смене статуса; без select_related - один запрос на пакет
+        models.prefetch_related_objects([tribute for tribute, _ in results], 'memorial')
+
+        policy = cls._ai_verdict_policy()
+        audit_logs = []
+        actions = []
+        for tribute, ai_result in results:
+            old_status = tribute.status
+            action_taken, auto_action = tribute._decide_ai_verdict(ai_result, policy)
+            audit_logs.append(tribute._ai_audit_log(ai_result, action_taken, auto_action, policy))
+            if tribute.status != old_status:
+                audit_logs.append(tribute_status_audit_log(tribute, old_status, tribute.status))
+            actions.append({
+                'action': action_taken,
+                'auto_action': auto_action,
+                'verdict': ai_result.get('verdict', 'flag_ai'),
+                'confidence': ai_result.get('confidence', 0.5)
+            })
+
+        with transaction.atomic():
+            with metrics.stage('apply_verdict'):
+                cls.objects.bulk_update([tribute for tribute, _ in results], AI_VERDICT_FIELDS)
+            with metrics.stage('audit_write'):
+                sink.record_many(audit_logs)
+
+        return actions
     
     def trigger_ai_moderation(self):
         """
         Триггерит асинхронную ИИ-модерацию для этого трибьюта.
+        Повторный вызов, пока трибьют в очереди, ничего не делает.
         """
-        from django.core.cache import cache
-        
-        # Используем кэш как блокировку, чтобы не запускать повторно
-        lock_key = f'tribute_ai_lock_{self.id}'
-        
         # Запускаем только если:
         # 1. Трибьют в статусе pending
         # 2. ИИ еще не модерировал
-        # 3. Нет активной блокировки
-        if (self.status == 'pending' and 
-            not self.ai_moderated_at and 
-            not cache.get(lock_key)):
-            
-            # Устанавливаем блокировку на 5 минут
-            cache.set(lock_key, True, timeout=300)
-            
-            # Импортируем и запускаем задачу
-            try:
-                from .tasks import moderate_tribute_with_ai
-                moderate_tribute_with_ai.delay(self.id)
-                return True
-            except ImportError:
-                cache.delete(lock_key)
-                return False
-        
-        return False
-    
+        # 3. Трибьют не арендован другим воркером
+        if self.status != 'pending' or self.ai_moderated_at:
+            return False
+
+        lease_token = self.claim_ai_lease()
+        if lease_token is None:
+            return False
+
+        try:
+            from .tasks import moderate_tribute_with_ai
+            moderate_tribute_with_ai.delay(self.id, lease_token=lease_token)
+            return True
+        except ImportError:
+            self.release_ai_lease(lease_token)
+            return False
+        except Exception:
+            # Брокер недоступен - освобождаем аренду, чтобы трибьют можно было поставить снова
+            self.release_ai_lease(lease_token)
+            raise
+
+    def claim_ai_lease(self, seconds=None):
+        """
+        Атомарно арендует трибьют для ИИ-модерации (условный UPDATE).
+        Возвращает токен аренды или None, если трибьют уже арендован или отмодерирован.
+        """
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        expires_at = now + timedelta(seconds=seconds or _ai_lease_seconds())
+
+        claimed = Tribute.objects.filter(_ai_claimable(now), pk=self.pk).update(
+            ai_lease_token=token,
+            ai_lease_expires_at=expires_at
+        )
+        if not claimed:
+            return None
+
+        self.ai_lease_token = token
+        self.ai_lease_expires_at = expires_at
+        return token
+
+    def renew_ai_lease(self, token, seconds=None):
+        """Продлевает аренду (например, перед отложенной повторной попыткой)."""
+        expires_at = timezone.now() + timedelta(seconds=seconds or _ai_lease_seconds())
+        renewed = Tribute.objects.filter(pk=self.pk, ai_lease_token=token).update(
+            ai_lease_expires_at=expires_at
+        )
+        if renewed:
+            self.ai_lease_expires_at = expires_at
+        return bool(renewed)
+
+    def release_ai_lease(self, token):
+        """Снимает аренду, если она всё ещё принадлежит этому токену."""
+        Tribute.objects.filter(pk=self.pk, ai_lease_token=token).update(
+            ai_lease_token=None,
+            ai_lease_expires_at=None
+        )
+        self.clear_ai_lease()
+
+    def park_ai_moderation(self, token):
+        """
+        Откладывает модерацию, пока Ollama недоступна: аренда снимается,
+        трибьют помечается как отложенный и ждёт drain_parked_moderation.
+        """
+        Tribute.objects.filter(pk=self.pk, ai_lease_token=token).update(
+            ai_lease_token=AI_LEASE_PARKED,
+            ai_lease_expires_at=None
+        )
+        self.ai_lease_token = AI_LEASE_PARKED
+        self.ai_lease_expires_at = None
+
+    def clear_ai_lease(self):
+        """Снимает аренду на экземпляре - сохраняется вместе с результатом модерации."""
+        self.ai_lease_token = None
+        self.ai_lease_expires_at = None
+
+    @classmethod
+    def claim_ai_batch(cls, limit, queryset=None, seconds=None, token=None):
+        """
+        Арендует до limit ожидающих трибьютов (самые старые первыми).
+        Строки, уже заблокированные другим воркером, пропускаются (SKIP LOCKED),
+        поэтому параллельные воркеры получают непересекающиеся пакеты.
+        С переданным token аренда добавляется к уже взятой с этим токеном.
+        Возвращает (токен аренды, список id).
+        """
+        now = timezone.now()
+        token = token or uuid.uuid4().hex
+        expires_at = now + timedelta(seconds=seconds or _ai_lease_seconds())
+        queryset = cls.objects.all() if queryset is None else queryset
+
+        # Транзакция нужна только для FOR UPDATE. На SQLite (без блокировок строк)
+        # SELECT + UPDATE в одной транзакции приводят к "database is locked"
+        # при повышении блокировки, а корректность обеспечивает условный UPDATE
+        db_connection = connections[queryset.db]
+        locking = db_connection.features.has_select_for_update
+        with transaction.atomic(using=queryset.db) if locking else nullcontext():
+            candidate_ids = list(
+                queryset.filter(_ai_claimable(now), ai_verdict='pending_ai')
+                .order_by('created_at')
+                .select_for_update(skip_locked=True, of=('self',))
+                .values_list('id', flat=True)[:limit]
+            )
+            if not candidate_ids:
+                return token, []
+
+            # Условие повторяется в UPDATE: на БД без SKIP LOCKED (SQLite)
+            # конкурирующий воркер просто не обновит уже арендованные строки
+            cls.objects.filter(_ai_claimable(now), id__in=candidate_ids).update(
+                ai_lease_token=token,
+                ai_lease_expires_at=expires_at
+            )
+
+        claimed_ids = list(
+            cls.objects.filter(ai_lease_token=token).order_by('created_at').values_list('id', flat=True)
+        )
+        return token, claimed_ids
+
+    @classmethod
+    def claim_ai_fair(cls, slots, scheduler, seconds=None):
+        """
+        Арендует до slots ожидающих трибьютов, распределяя места между
+        партнёрами планировщиком (tributes.scheduler.FairShareScheduler) вместо
+        общей очереди по created_at. Внутри партнёра - самые старые первыми.
+        Возвращает (токен аренды, список id в порядке обслуживания).
+        """
+        now = timezone.now()
+        waiting = cls.objects.filter(_ai_claimable(now), ai_verdict='pending_ai')
+        backlog = dict(
+            waiting.values_list('memorial__partner_id').annotate(count=models.Count('id')).order_by()
+        )
+        in_flight = dict(
+            cls.objects.filter(status='pending', ai_moderated_at__isnull=True, ai_lease_expires_at__gt=now)
+            .values_list('memorial__partner_id').annotate(count=models.Count('id')).order_by()
+        )
+
+        sequence = scheduler.schedule(backlog, in_flight, slots)
+        token = uuid.uuid4().hex
+        quotas = {}
+        for partner_id in sequence:
+            quotas[partner_id] = quotas.get(partner_id, 0) + 1
+        for partner_id, quota in quotas.items():
+            cls.claim_ai_batch(
+                quota, queryset=cls.objects.filter(memorial__partner_id=partner_id), seconds=seconds, token=token
+            )
+
+        # Порядок обслуживания: трибьюты партнёров чередуются так, как решил планировщик
+        claimed = {}
+        for tribute_id, partner_id in (
+            cls.objects.filter(ai_lease_token=token).order_by('created_at').values_list('id', 'memorial__partner_id')
+        ):
+            claimed.setdefault(partner_id, []).append(tribute_id)
+        ordered_ids = [claimed[partner_id].pop(0) for partner_id in sequence if claimed.get(partner_id)]
+        return token, ordered_ids
+
+    @classmethod
+    def claim_for_remoderation(cls, queryset, seconds=None):
+        """
+        Сбрасывает результат ИИ у трибьютов из queryset, ещё ожидающих ручной
+        модерации, и сразу арендует их - одним UPDATE, поэтому трибьют, который
+        сейчас обрабатывает воркер, не будет взят повторно. Прежний
+        ai_moderation_result остаётся до нового вердикта. Возвращает (токен, список id).
+        """
+        now = timezone.now()
+        token = uuid.uuid4().hex
+        queryset.filter(
+            Q(status='pending')
+            & (Q(ai_lease_expires_at__isnull=True) | Q(ai_lease_expires_at__lte=now))
+        ).update(
+            ai_verdict='pending_ai',
+            ai_moderated_at=None,
+            ai_lease_token=token,
+            ai_lease_expires_at=now + timedelta(seconds=seconds or _ai_lease_seconds())
+        )
+        claimed_ids = list(
+            cls.objects.filter(ai_lease_token=token).order_by('id').values_list('id', flat=True)
+        )
+        return token, claimed_ids
+
     def get_ai_moderation_display(self):
         """
         Возвращает читаемое представление результата AI-модерации.
@@ -0,0 +1,188 @@
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+# === СЛОВАРИ ДЛЯ АНАЛИЗА ИМЁН ===
+# Неизменяемые множества собираются один раз при импорте, а не на каждый трибьют.
+
+# СПИСОК АБСТРАКТНЫХ ПОНЯТИЙ - НИКОГДА НЕ СЧИТАТЬ ИМЕНАМИ!
+ABSTRACT_NOUNS = frozenset({
+    'güte', 'weisheit', 'geduld', 'liebe', 'hoffnung',
+    'freude', 'trauer', 'frieden', 'ruhe', 'stärke',
+    'mut', 'kraft', 'würde', 'stolz', 'demut',
+    'freundlichkeit', 'hilfsbereitschaft', 'grosszügigkeit',
+    'mitgefühl', 'anteilnahme', 'beileid', 'kondolenz'
+})
+
+# МЕСТОИМЕНИЯ - НЕ ИМЕНА
+PRONOUNS = frozenset({
+    'sein', 'seine', 'seinem', 'seinen', 'seiner',
+    'ihr', 'ihre', 'ihrem', 'ihren', 'ihrer',
+    'unser', 'unsere', 'unserem', 'unseren', 'unserer',
+    'mein', 'meine', 'meinem', 'meinen', 'meiner',
+    'dein', 'deine', 'deinem', 'deinen', 'deiner',
+    'euer', 'eure', 'eurem', 'euren', 'eurer'
+})
+
+# Игнорируем общие слова
+IGNORE_WORDS = ABSTRACT_NOUNS | PRONOUNS | frozenset({
+    # Обращения
+    'herr', 'frau', 'mr', 'mrs', 'ms', 'fräulein', 'dr', 'prof',
+    'sir', 'madam', 'monsieur', 'madame', 'signor', 'signora',
+
+    # Семья/отношения
+    'family', 'familie', 'and', 'und', 'oder', 'or',
+    'vater', 'mutter', 'sohn', 'tochter', 'bruder', 'schwester',
+    'father', 'mother', 'son', 'daughter', 'brother', 'sister',
+
+    # Артикли/местоимения
+    'der', 'die', 'das', 'den', 'dem', 'des', 'ein', 'eine', 'eines',
+    'sein', 'seine', 'seinem', 'seinen', 'seiner', 'Seine',
+    'ihr', 'ihre', 'ihrem', 'ihren', 'ihrer',
+    'unser', 'unsere', 'unserem', 'unseren', 'unserer',
+    'euer', 'eure', 'eurem', 'euren', 'eurer',
+    'mein', 'meine', 'meinem', 'meinen', 'meiner',
+    'dein', 'deine', 'deinem', 'deinen', 'deiner',
+
+    # Прилагательные/существительные (часто используемые в текстах)
+    'gute', 'güte', 'weise', 'weisheit', 'ruhe', 'frieden',
+    'friede', 'ruh', 'gedenken', 'erinnerung', 'Möge',
+    'mensch', 'person', 'freund', 'kollege', 'nachbar', 'mitarbeiter',
+    'liebe', 'trauer', 'beileid', 'kondolenz', 'mitgefühl',
+    'dank', 'dankbarkeit', 'respekt', 'ehre', 'Güte'
+    'herz', 'seele', 'geist', 'leben',
+
+    # Местоимения
+    'jemand', 'niemand', 'jedermann', 'etwas', 'nichts',
+    'man', 'frau', 'kind', 'kinder',
+
+    # Дни/время
+    'heute', 'gestern', 'morgen', 'tag', 'zeit', 'stunde',
+
+    # Общие немецкие слова, которые могут быть с большой буквы
+    'deutschland', 'schweiz', 'österreich', 'europa', 'welt'
+})
+
+# Паттерны для поиска имен
+NAME_PATTERNS = (
+    # Два слова с заглавной буквы (полное имя)
+    re.compile(r'\b([A-ZÄÖÜ][a-zäöüß]+)\s+([A-ZÄÖÜ][a-zäöüß]+)\b'),
+    # Обращения + имя/фамилия
+    re.compile(r'\b(Herr|Frau|Mr\.|Mrs\.|Ms\.|Dr\.|Prof\.)\s+([A-ZÄÖÜ][a-zäöüß]+(?:\s+[A-ZÄÖÜ][a-zäöüß]+)?)\b'),
+    # ОДИНОЧНЫЕ ИМЕНА - ЭТО ВАЖНО!
+    re.compile(r'\b([A-ZÄÖÜ][a-zäöüß]+)\b'),
+)
+
+# Транслитерация умлаутов: Müller -> Mueller
+_UMLAUT_TRANSLIT = str.maketrans({'ä': 'ae', 'ö': 'oe', 'ü': 'ue', 'ß': 'ss'})
+
+
+def transliterate_umlauts(text_lower):
+    """müller -> mueller, weiß -> weiss"""
+    return text_lower.translate(_UMLAUT_TRANSLIT)
+
+
+def fold_diacritics(text_lower):
+    """müller -> muller, françois -> francois, weiß -> weiss"""
+    decomposed = unicodedata.normalize('NFKD', text_lower.replace('ß', 'ss'))
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def name_keys(word_lower):
+    """Варианты написания слова, по которым сравниваются имена."""
+    return frozenset((word_lower, transliterate_umlauts(word_lower), fold_diacritics(word_lower)))
+
+
+class MemorialNameProfile:
+    """
+    Предвычисленные данные об имени мемориала: строчные формы, варианты написания
+    (без диакритики, ß/ss, транслитерация умлаутов). Строится один раз на мемориал,
+    поэтому анализ каждого трибьюта сводится к проходу по его тексту.
+    """
+
+    __slots__ = (
+        'memorial_id', 'source', 'first_name', 'last_name', 'full_name',
+        'first_name_keys', 'last_name_keys',
+        '_translit', '_folded',
+    )
+
+    def __init__(self, memorial_id, first_name, last_name):
+        self.memorial_id = memorial_id
+        self.source = (first_name, last_name)
+        self.first_name = first_name.lower()
+        self.last_name = last_name.lower()
+        self.full_name = f"{first_name} {last_name}".lower()
+
+        self.first_name_keys = name_keys(self.first_name)
+        self.last_name_keys = name_keys(self.last_name)
+
+        # (имя, фамилия, полное имя) в обеих нормализованных формах
+        self._translit = tuple(transliterate_umlauts(name) for name in (self.first_name, self.last_name, self.full_name))
+        self._folded = tuple(fold_diacritics(name) for name in (self.first_name, self.last_name, self.full_name))
+
+    def mentions(self, text_lower):
+        """
+        Возвращает (полное имя, имя, фамилия) - упомянуты ли они в тексте
+        в любом из вариантов написания.
+        """
+        found = [
+            self.full_name in text_lower,
+            self.first_name in text_lower,
+            self.last_name in text_lower,
+        ]
+        if all(found):
+            return tuple(found)
+
+        text_translit = transliterate_umlauts(text_lower)
+        text_folded = fold_diacritics(text_lower)
+        first_t, last_t, full_t = self._translit
+        first_f, last_f, full_f = self._folded
+
+        return (
+            found[0] or full_t in text_translit or full_f in text_folded,
+            found[1] or first_t in text_translit or first_f in text_folded,
+            found[2] or last_t in text_translit or last_f in text_folded,
+        )
+
+    def is_first_name(self, word_lower):
+        return word_lower == self.first_name or not self.first_name_keys.isdisjoint(name_keys(word_lower))
+
+    def is_last_name(self, word_lower):
+        return word_lower == self.last_name or not self.last_name_keys.isdisjoint(name_keys(word_lower))
+
+
+# Кэш профилей на процесс: memorial_id -> MemorialNameProfile
+_PROFILE_CACHE_SIZE = 2048
+_profiles = OrderedDict()
+_profiles_lock = threading.Lock()
+
+
+def get_name_profile(memorial):
+    """
+    Возвращает профиль имени мемориала из кэша процесса.
+    Если имя изменилось, а сигнал об этом до процесса не дошёл, профиль
+    всё равно будет перестроен - он сверяется с текущими first_name/last_name.
+    """
+    source = (memorial.first_name, memorial.last_name)
+
+    with _profiles_lock:
+        profile = _profiles.get(memorial.pk)
+        if profile is not None and profile.source == source:
+            _profiles.move_to_end(memorial.pk)
+            return profile
+
+    profile = MemorialNameProfile(memorial.pk, *source)
+
+    with _profiles_lock:
+        _profiles[memorial.pk] = profile
+        _profiles.move_to_end(memorial.pk)
+        while len(_profiles) > _PROFILE_CACHE_SIZE:
+            _profiles.popitem(last=False)
+    return profile
+
+
+def invalidate_name_profile(memorial_id):
+    """Сбрасывает профиль мемориала (вызывается при изменении имени)."""
+    with _profiles_lock:
+        _profiles.pop(memorial_id, None)
@@ -0,0 +1,460 @@
+import os
+import json
+import time
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from .json_scan import JsonObjectDetector
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OLLAMA_URL = 'http://localhost:11434/api/generate'
+
+
+class OllamaUnavailable(requests.exceptions.ConnectionError):
+    """Запрос не отправлялся: предохранитель Ollama открыт или все серверы пула исключены."""
+
+
+class OllamaBusy(requests.exceptions.ConnectionError):
+    """Запрос не отправлялся: все серверы пула были заняты всё время ожидания."""
+
+
+def response_timings(result):
+    """
+    Тайминги из ответа Ollama (последний чанк потока или обычный ответ), в мс:
+    load_ms - загрузка модели в память (холодный старт), prompt_eval_ms -
+    вычисление промпта; prompt_eval_count - сколько токенов промпта пришлось
+    вычислить (без переиспользованного префикса). None, если Ollama их не прислала.
+    """
+    def ms(key):
+        value = result.get(key)
+        return round(value / 1e6) if value is not None else None
+
+    return {
+        'load_ms': ms('load_duration'),
+        'prompt_eval_ms': ms('prompt_eval_duration'),
+        'prompt_eval_count': result.get('prompt_eval_count'),
+    }
+
+
+def blocking_reply(result, started):
+    """
+    (текст ответа, llm_stats) из обычного ответа Ollama; started - time.monotonic()
+    перед запросом. Общее для Celery-задачи и асинхронного раннера.
+    """
+    llm_stats = {
+        'mode': 'blocking',
+        'time_to_verdict_ms': round((time.monotonic() - started) * 1000),
+        'tokens_generated': result.get('eval_count'),
+        'early_stop': False,
+        'time_to_first_token_ms': None,
+        **response_timings(result),
+    }
+    return result.get('response', '').strip(), llm_stats
+
+
+class StreamReply:
+    """
+    Чтение потока Ollama, общее для Celery-задачи и асинхронного раннера:
+    транспорт передаёт чанки в feed и перестаёт читать, когда feed вернул True
+    (модель выдала закрытый JSON-объект с вердиктом или поток закончился).
+    """
+
+    def __init__(self, started):
+        self.started = started
+        self.detector = JsonObjectDetector(required_key='verdict')
+        self.parts = []
+        self.tokens = 0
+        self.first_token_at = None
+        # Тайминги Ollama приходят только в последнем чанке; при досрочной остановке
+        # их нет, и холодный старт виден по времени до первого токена
+        self.done_chunk = {}
+
+    def feed(self, chunk):
+        """Учитывает чанк NDJSON; True - дальше читать не нужно."""
+        token = chunk.get('response', '')
+        if token:
+            if self.first_token_at is None:
+                self.first_token_at = time.monotonic()
+            self.tokens += 1
+            self.parts.append(token)
+            if self.detector.feed(token):
+                return True
+        if chunk.get('done'):
+            self.done_chunk = chunk
+            return True
+        return False
+
+    def result(self):
+        """(текст ответа, llm_stats)."""
+        eval_count = self.done_chunk.get('eval_count')
+        first_token_at = self.first_token_at
+        llm_stats = {
+            'mode': 'stream',
+            'time_to_verdict_ms': round((time.monotonic() - self.started) * 1000),
+            'tokens_generated': eval_count if eval_count is not None else self.tokens,
+            'early_stop': self.detector.complete,
+            'time_to_first_token_ms': round((first_token_at - self.started) * 1000) if first_token_at else None,
+            **response_timings(self.done_chunk),
+        }
+        return ''.join(self.parts).strip(), llm_stats
+
+
+def ollama_urls():
+    """Адреса серверов Ollama: OLLAMA_API_URLS, если задан, иначе один OLLAMA_API_URL."""
+    return list(getattr(settings, 'OLLAMA_API_URLS', None) or [getattr(settings, 'OLLAMA_API_URL', DEFAULT_OLLAMA_URL)])
+
+
+def is_endpoint_failure(status_code=None):
+    """
+    Ошибка сервера, а не запроса: соединение, таймаут (status_code None),
+    5xx, 404 (модель не загружена на этом сервере) или 429. Такой запрос
+    повторяется на другом сервере, остальные 4xx - нет.
+    """
+    return status_code is None or status_code >= 500 or status_code in (404, 429)
+
+
+class OllamaEndpoint:
+    """Состояние одного сервера Ollama в пуле (см. OllamaEndpointPool)."""
+
+    def __init__(self, url, max_in_flight):
+        self.url = url
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.ewma_ms = None
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+        self.last_used = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def snapshot(self, now):
+        return {
+            'url': self.url,
+            'healthy': now >= self.down_until,
+            'in_flight': self.in_flight,
+            'ewma_ms': round(self.ewma_ms) if self.ewma_ms is not None else None,
+            'requests': self.requests,
+            'failures': self.failures,
+        }
+
+
+class OllamaEndpointPool:
+    """
+    Выбор сервера Ollama для запроса. У каждого сервера - лимит одновременных
+    запросов и экспоненциальное скользящее среднее (EWMA) задержки; запрос
+    уходит на исправный сервер с наименьшей оценкой ewma_ms * (in_flight + 1),
+    так что медленный сервер получает работу, только когда быстрые заняты.
+
+    После failure_threshold ошибок подряд сервер исключается на down_seconds;
+    сервер без запросов дольше probe_interval_seconds снова пробуется, чтобы
+    его оценка не осталась навсегда завышенной. Если исправных серверов нет,
+    запрос идёт на тот, что был исключён раньше всех.
+
+    Состояние живёт в процессе (как и пул соединений), потокобезопасно.
+    """
+
+    def __init__(self, urls, max_in_flight_per_endpoint=8, ewma_alpha=0.3,
+                 failure_threshold=3, down_seconds=30, probe_interval_seconds=60):
+        self.endpoints = [OllamaEndpoint(url, max_in_flight_per_endpoint) for url in urls]
+        self.ewma_alpha = ewma_alpha
+        self.failure_threshold = failure_threshold
+        self.down_seconds = down_seconds
+        self.probe_interval_seconds = probe_interval_seconds
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        return len(self.endpoints)
+
+    def _score(self, endpoint, now):
+        if endpoint.ewma_ms is None or now - endpoint.last_used > self.probe_interval_seconds:
+            return 0.0
+        return endpoint.ewma_ms * (endpoint.in_flight + 1)
+
+    def _pick(self, exclude, now):
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        healthy = [endpoint for endpoint in candidates if now >= endpoint.down_until]
+        if not healthy and candidates:
+            healthy = [min(candidates, key=lambda endpoint: endpoint.down_until)]
+        available = [endpoint for endpoint in healthy if endpoint.in_flight < endpoint.max_in_flight]
+        if not available:
+            return None
+        return min(available, key=lambda endpoint: (self._score(endpoint, now), endpoint.in_flight))
+
+    def acquire(self, exclude=(), timeout=None):
+        """
+        Занимает слот лучшего сервера не из exclude. Если все подходящие
+        серверы заняты, ждёт до timeout секунд (0 - не ждать); None, если
+        сервера нет.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if all(endpoint in exclude for endpoint in self.endpoints):
+                    return None
+                endpoint = self._pick(exclude, now)
+                if endpoint is not None:
+                    endpoint.in_flight += 1
+                    endpoint.last_used = now
+                    return endpoint
+                remaining = None if deadline is None else deadline - now
+                if remaining is not None and remaining <= 0:
+                    return None
+                self._condition.wait(remaining)
+
+    def release(self, endpoint, latency_ms=None, failed=False):
+        """Освобождает слот и учитывает результат запроса."""
+        with self._condition:
+            endpoint.in_flight -= 1
+            endpoint.requests += 1
+            if failed:
+                endpoint.failures += 1
+                endpoint.consecutive_failures += 1
+                now = time.monotonic()
+                if endpoint.consecutive_failures >= self.failure_threshold and now >= endpoint.down_until:
+                    endpoint.down_until = now + self.down_seconds
+                    logger.warning(
+                        "Ollama endpoint %s marked down for %ss after %s failures",
+                        endpoint.url, self.down_seconds, endpoint.consecutive_failures
+                    )
+            else:
+                if endpoint.down_until:
+                    logger.info("Ollama endpoint %s recovered", endpoint.url)
+                endpoint.consecutive_failures = 0
+                endpoint.down_until = 0.0
+                if latency_ms is not None:
+                    if endpoint.ewma_ms is None:
+                        endpoint.ewma_ms = latency_ms
+                    else:
+                        endpoint.ewma_ms += self.ewma_alpha * (latency_ms - endpoint.ewma_ms)
+            self._condition.notify()
+
+    def all_down(self):
+        """Все серверы исключены после ошибок и down_seconds ещё не истекли."""
+        with self._condition:
+            now = time.monotonic()
+            return all(now < endpoint.down_until for endpoint in self.endpoints)
+
+    def exhausted_error(self, waited):
+        """
+        Ошибка, когда слот не освободился за waited секунд: OllamaUnavailable,
+        если все серверы исключены (трибьют откладывается до восстановления),
+        иначе OllamaBusy - серверы исправны, но перегружены (обычный ретрай).
+        """
+        if self.all_down():
+            return OllamaUnavailable(f"All {len(self.endpoints)} Ollama endpoints are marked down")
+        return OllamaBusy(f"All Ollama endpoints stayed busy for {waited:g}s")
+
+    def stats(self):
+        with self._condition:
+            now = time.monotonic()
+            return [endpoint.snapshot(now) for endpoint in self.endpoints]
+
+
+def build_endpoint_pool(urls, default_max_in_flight=8):
+    """Пул серверов с параметрами из AI_MODERATION_SETTINGS['ollama_pool']."""
+    pool_settings = settings.AI_MODERATION_SETTINGS.get('ollama_pool', {})
+    return OllamaEndpointPool(
+        urls,
+        max_in_flight_per_endpoint=pool_settings.get('max_in_flight_per_endpoint') or default_max_in_flight,
+        ewma_alpha=pool_settings.get('ewma_alpha', 0.3),
+        failure_threshold=pool_settings.get('failure_threshold', 3),
+        down_seconds=pool_settings.get('down_seconds', 30),
+        probe_interval_seconds=pool_settings.get('probe_interval_seconds', 60),
+    )
+
+
+class OllamaClient:
+    """
+    HTTP-клиент для Ollama с пулом keep-alive соединений.
+    Один экземпляр на процесс (см. get_ollama_client), потокобезопасен.
+    С несколькими адресами запросы распределяются OllamaEndpointPool,
+    при ошибке сервера запрос повторяется на следующем.
+    """
+
+    def __init__(self, urls, pool_connections=4, pool_maxsize=8,
+                 connect_timeout=3.05, read_timeout=60, endpoints=None):
+        self.urls = [urls] if isinstance(urls, str) else list(urls)
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_maxsize = pool_maxsize
+        self.endpoints = endpoints or OllamaEndpointPool(self.urls, max_in_flight_per_endpoint=pool_maxsize)
+        # Пул urllib3 на каждый сервер, иначе соединения вытесняются
+        pool_connections = max(pool_connections, len(self.urls))
+
+        # pool_block=True: не больше pool_maxsize одновременных запросов на процесс,
+        # остальные потоки ждут свободное соединение вместо открытия новых
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            max_retries=0,
+            pool_block=True,
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+        self.session.headers.update({
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive',
+        })
+
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def _send(self, payload, stream=False):
+        """
+        Отправляет запрос на лучший сервер пула, при ошибке сервера - на
+        следующий. Возвращает (сервер, ответ, время отправки); слот сервера
+        освобождает вызывающий код через self.endpoints.release. Если слот
+        не освободился за read_timeout - OllamaBusy (или OllamaUnavailable,
+        когда все серверы исключены).
+        """
+        tried = []
+        last_error = None
+        while True:
+            endpoint = self.endpoints.acquire(exclude=tried, timeout=self.timeout[1])
+            if endpoint is None:
+                if len(tried) == len(self.endpoints):
+                    raise last_error
+                raise self.endpoints.exhausted_error(self.timeout[1])
+
+            started = time.monotonic()
+            response = None
+            try:
+                response = self.session.post(endpoint.url, json=payload, timeout=self.timeout, stream=stream)
+                self._remember_pools()
+                response.raise_for_status()
+                return endpoint, response, started
+            except requests.exceptions.RequestException as e:
+                if response is not None:
+                    response.close()
+                status_code = e.response.status_code if e.response is not None else None
+                failed = is_endpoint_failure(status_code)
+                self.endpoints.release(endpoint, failed=failed)
+                if not failed or len(self.endpoints) == 1:
+                    raise
+                logger.warning("Ollama endpoint %s failed, trying another: %s", endpoint.url, e)
+                tried.append(endpoint)
+                last_error = e
+
+    def generate(self, payload):
+        """
+        POST /api/generate. Возвращает JSON-ответ Ollama.
+        Ошибки пробрасываются как requests.exceptions.RequestException.
+        """
+        endpoint, response, started = self._send(payload)
+        failed = True
+        try:
+            result = response.json()
+            failed = False
+        finally:
+            self.endpoints.release(
+                endpoint, latency_ms=(time.monotonic() - started) * 1000, failed=failed
+            )
+        return result
+
+    def generate_stream(self, payload):
+        """
+        POST /api/generate со "stream": true. Генератор NDJSON-чанков Ollama
+        ({"response": "<токен>", "done": false}, ..., {"done": true, "eval_count": ...}).
+        Если вызывающий код перестаёт читать и закрывает генератор, соединение
+        закрывается, и Ollama прекращает генерацию. На другой сервер запрос
+        переходит только до первого чанка.
+        """
+        endpoint, response, started = self._send(dict(payload, stream=True), stream=True)
+        failed = False
+        try:
+            with response:
+                for line in response.iter_lines():
+                    if line:
+                        yield json.loads(line)
+        except requests.exceptions.RequestException:
+            failed = True
+            raise
+        finally:
+            self.endpoints.release(
+                endpoint, latency_ms=(time.monotonic() - started) * 1000, failed=failed
+            )
+
+    def _remember_pools(self):
+        # Запоминаем пулы urllib3, чтобы читать их счётчики в stats()
+        pools = self._adapter.poolmanager.pools
+        if len(self._pools) == len(pools):
+            return
+        with self._lock:
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    self._pools[key] = pool
+
+    def stats(self):
+        """
+        Счётчики пула: сколько запросов ушло по уже открытым соединениям
+        и сколько соединений пришлось открыть заново.
+        """
+        requests_total = 0
+        new_connections = 0
+        for pool in list(self._pools.values()):
+            requests_total += pool.num_requests
+            new_connections += pool.num_connections
+
+        return {
+            'pid': os.getpid(),
+            'requests': requests_total,
+            'new_connections': new_connections,
+            'reused_connections': max(requests_total - new_connections, 0),
+            'pool_maxsize': self.pool_maxsize,
+            'endpoints': self.endpoints.stats(),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_ollama_client():
+    """
+    Возвращает общий для процесса клиент Ollama.
+    После fork (prefork-воркеры Celery) создаётся новый клиент,
+    чтобы не делить сокеты с родительским процессом.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            ai_settings = getattr(settings, 'AI_MODERATION_SETTINGS', {})
+            client_settings = ai_settings.get('ollama_client', {})
+            urls = ollama_urls()
+            pool_maxsize = client_settings.get('pool_maxsize', 8)
+            _client = OllamaClient(
+                urls,
+                pool_connections=client_settings.get('pool_connections', 4),
+                pool_maxsize=pool_maxsize,
+                connect_timeout=client_settings.get('connect_timeout', 3.05),
+                read_timeout=client_settings.get('read_timeout', ai_settings.get('timeout_seconds', 60)),
+                endpoints=build_endpoint_pool(urls, default_max_in_flight=pool_maxsize),
+            )
+            _client_pid = pid
+            logger.info("Ollama client created for pid %s: %s", pid, ', '.join(_client.urls))
+    return _client
+
+
+def reset_ollama_client():
+    """Закрывает клиент процесса; следующий get_ollama_client() перечитает настройки."""
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _client_pid = None
@@ -0,0 +1,212 @@
+import json
+import math
+import os
+import re
+import threading
+import logging
+from collections import Counter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_VERSION = 1
+
+# Метки обучающих данных - итоговый статус трибьюта
+LABEL_VERDICTS = {
+    'approved': 'approved_ai',
+    'rejected': 'rejected_ai',
+}
+
+# Обоснование локального решения для ai_moderation_result, по вердикту
+VERDICT_REASONING = {
+    'approved_ai': 'Lokaler Vorklassifikator: typische Kondolenz',
+    'rejected_ai': 'Lokaler Vorklassifikator: ähnlich wie abgelehnte Beiträge',
+}
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def char_ngrams(text, ngram_range=(2, 4)):
+    """Символьные n-граммы нормализованного текста (нижний регистр, одиночные пробелы, границы слов)."""
+    normalized = ' ' + _WHITESPACE_RE.sub(' ', text.lower()).strip() + ' '
+    low, high = ngram_range
+    grams = Counter()
+    for n in range(low, high + 1):
+        for i in range(len(normalized) - n + 1):
+            grams[normalized[i:i + n]] += 1
+    return grams
+
+
+class CharNgramNaiveBayes:
+    """
+    Мультиномиальный наивный Байес по символьным n-граммам. Без внешних
+    зависимостей: обучение - подсчёт n-грамм, предсказание - сумма логарифмов.
+    Модель хранится в JSON (счётчики n-грамм по меткам), см. save/load.
+    """
+
+    def __init__(self, ngram_range=(2, 4), alpha=1.0):
+        self.ngram_range = tuple(ngram_range)
+        self.alpha = alpha
+        self.doc_counts = {}
+        self.gram_counts = {}
+        self._log_prior = {}
+        self._log_likelihood = {}
+        self._log_unseen = {}
+        self._vocabulary = set()
+
+    def fit(self, texts, labels, max_features=20000, min_count=2):
+        doc_counts = Counter()
+        gram_counts = {}
+        for text, label in zip(texts, labels):
+            doc_counts[label] += 1
+            gram_counts.setdefault(label, Counter()).update(char_ngrams(text, self.ngram_range))
+
+        # Словарь: самые частые n-граммы по всем меткам
+        totals = Counter()
+        for counts in gram_counts.values():
+            totals.update(counts)
+        vocabulary = {gram for gram, count in totals.most_common(max_features) if count >= min_count}
+
+        self.doc_counts = dict(doc_counts)
+        self.gram_counts = {
+            label: {gram: count for gram, count in counts.items() if gram in vocabulary}
+            for label, counts in gram_counts.items()
+        }
+        self._prepare()
+        return self
+
+    def _prepare(self):
+        """Логарифмы вероятностей считаются один раз после обучения или загрузки."""
+        vocabulary = set()
+        for counts in self.gram_counts.values():
+            vocabulary.update(counts)
+        vocabulary_size = max(len(vocabulary), 1)
+        total_docs = sum(self.doc_counts.values())
+
+        self._log_prior = {label: math.log(count / total_docs) for label, count in self.doc_counts.items()}
+        self._log_likelihood = {}
+        self._log_unseen = {}
+        for label, counts in self.gram_counts.items():
+            denominator = math.log(sum(counts.values()) + self.alpha * vocabulary_size)
+            self._log_likelihood[label] = {
+                gram: math.log(count + self.alpha) - denominator for gram, count in counts.items()
+            }
+            self._log_unseen[label] = math.log(self.alpha) - denominator
+        self._vocabulary = vocabulary
+
+    @property
+    def labels(self):
+        return list(self.doc_counts)
+
+    def predict_proba(self, text):
+        """Вероятности меток {метка: p}. N-граммы вне словаря не учитываются."""
+        grams = [(gram, count) for gram, count in char_ngrams(text, self.ngram_range).items()
+                 if gram in self._vocabulary]
+        scores = {}
+        for label, prior in self._log_prior.items():
+            likelihood = self._log_likelihood.get(label, {})
+            unseen = self._log_unseen.get(label, 0.0)
+            scores[label] = prior + sum(count * likelihood.get(gram, unseen) for gram, count in grams)
+
+        best = max(scores.values())
+        exp_scores = {label: math.exp(score - best) for label, score in scores.items()}
+        total = sum(exp_scores.values())
+        return {label: value / total for label, value in exp_scores.items()}
+
+    def predict(self, text):
+        """(метка, вероятность) самой вероятной метки."""
+        probabilities = self.predict_proba(text)
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+
+    def to_dict(self):
+        return {
+            'version': ARTIFACT_VERSION,
+            'ngram_range': list(self.ngram_range),
+            'alpha': self.alpha,
+            'doc_counts': self.doc_counts,
+            'gram_counts': self.gram_counts,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        if data.get('version') != ARTIFACT_VERSION:
+            raise ValueError(f"Unsupported preclassifier artifact version: {data.get('version')}")
+        model = cls(ngram_range=data['ngram_range'], alpha=data['alpha'])
+        model.doc_counts = data['doc_counts']
+        model.gram_counts = data['gram_counts']
+        model._prepare()
+        return model
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, separators=(',', ':'))
+        # Воркеры могут читать файл в этот момент - подменяем атомарно
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding='utf-8') as f:
+            return cls.from_dict(json.load(f))
+
+
+_model = None
+_model_key = None
+_model_lock = threading.Lock()
+
+
+def get_preclassifier():
+    """
+    Модель процесса или None, если классификатор выключен или файла модели нет.
+    После переобучения (файл изменился) модель перечитывается.
+    """
+    global _model, _model_key
+
+    preclassifier_settings = settings.AI_MODERATION_SETTINGS.get('preclassifier', {})
+    if not preclassifier_settings.get('enabled', False):
+        return None
+
+    path = str(preclassifier_settings.get('model_path', ''))
+    try:
+        key = (path, os.stat(path).st_mtime_ns)
+    except OSError:
+        return None
+
+    if key == _model_key:
+        return _model
+
+    with _model_lock:
+        if key != _model_key:
+            try:
+                _model = CharNgramNaiveBayes.load(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.error("Cannot load preclassifier from %s: %s", path, e)
+                _model = None
+            _model_key = key
+            if _model is not None:
+                logger.info("Preclassifier loaded from %s: %s", path, _model.doc_counts)
+    return _model
+
+
+def preclassify(text):
+    """
+    Локальное решение для очевидных трибьютов: (вердикт, уверенность) или None,
+    если текст нужно отправить в ИИ. Решаются только метки из decide_labels
+    с вероятностью не ниже min_confidence и тексты не длиннее max_text_length.
+    """
+    model = get_preclassifier()
+    if model is None:
+        return None
+
+    preclassifier_settings = settings.AI_MODERATION_SETTINGS.get('preclassifier', {})
+    if len(text) > preclassifier_settings.get('max_text_length', 400):
+        return None
+
+    label, probability = model.predict(text)
+    if label not in preclassifier_settings.get('decide_labels', ['approved']):
+        return None
+    if probability < preclassifier_settings.get('min_confidence', 0.98):
+        return None
+    return LABEL_VERDICTS[label], probability
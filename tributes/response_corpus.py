@@ -0,0 +1,64 @@
+# Типичные ответы phi3, в том числе испорченные: (ответ модели, ожидаемый вердикт).
+# None - вердикт извлечь нельзя, parse_ai_response вернёт flag_ai с invalid_format.
+# Корпус используют тесты разбора (tributes/tests.py) и manage.py bench_ai_parser.
+
+PHI3_RESPONSES = [
+    # Чистый JSON
+    ('{"verdict": "approved_ai", "confidence": 0.92, "reasoning": "Respektvolle Anteilnahme.", "flags": [], '
+     '"rejection_category": "none"}', 'approved_ai'),
+    # Обёртка ```json и пояснение после объекта
+    ('```json\n{"verdict": "approved_ai", "confidence": 0.88, "reasoning": "Kondolenz an die Familie", '
+     '"flags": ["correct_first_name_only"], "rejection_category": "none"}\n```\n\n'
+     'Explanation: the text is respectful {see above}.', 'approved_ai'),
+    # Висячие запятые
+    ('{"verdict": "rejected_ai", "confidence": 0.15, "reasoning": "Beleidigung", "flags": ["insult", "offensive",], '
+     '"rejection_category": "offensive",}', 'rejected_ai'),
+    # Типографские кавычки
+    ('{“verdict”: “flag_ai”, “confidence”: 0.5, “reasoning”: “Unklarer Bezug zur Person”, “flags”: [“unclear”], '
+     '“rejection_category”: “none”}', 'flag_ai'),
+    # Кавычки внутри строки в типографских кавычках
+    ('{“verdict”: “approved_ai”, “confidence”: 0.8, “reasoning”: “Zitat: "Ruhe in Frieden"”, “flags”: []}',
+     'approved_ai'),
+    # Фигурные скобки внутри строк
+    ('{"verdict": "approved_ai", "confidence": 0.9, "reasoning": "Template {name} not filled, but text is fine }", '
+     '"flags": []}', 'approved_ai'),
+    # Пример в преамбуле, затем настоящий ответ
+    ('Here is the format {"example": true}. My answer:\n{"verdict": "rejected_ai", "confidence": 0.2, '
+     '"reasoning": "Spam", "flags": ["spam"], "rejection_category": "spam"}', 'rejected_ai'),
+    # Глубокая вложенность
+    ('{"verdict": "flag_ai", "confidence": 0.6, "details": {"names": {"mentioned": {"first": true, "last": false}}}, '
+     '"flags": []}', 'flag_ai'),
+    # Обрезанный ответ (закончился num_predict): вердикт и уверенность уже есть
+    ('{"verdict": "approved_ai", "confidence": 0.85, "reasoning": "Sehr persönliche Erinnerung an gemeinsame '
+     'Stunden und', 'approved_ai'),
+    ('{"verdict": "rejected_ai", "confidence": 0.3, "reasoning": "Falscher Vorname", "flags": ["wrong_first_name", '
+     '"name_mis', 'rejected_ai'),
+    # Обрезанный ответ без уверенности или посреди вердикта - не вердикт
+    ('{"verdict": "flag_ai", "reasoning": "Unklarer Bez', None),
+    ('{"verdict": "approved', None),
+    # Переводы строк внутри строк
+    ('{"verdict": "approved_ai",\n "confidence": 0.9,\n "reasoning": "Zeile 1\nZeile 2",\n "flags": []\n}',
+     'approved_ai'),
+    # Длинная болтовня модели вокруг объекта
+    (('Let me analyze this tribute carefully. ' * 40)
+     + '{"verdict": "approved_ai", "confidence": 0.9, "reasoning": "ok", "flags": []}'
+     + (' I hope this helps. ' * 40), 'approved_ai'),
+    # JSON нет вовсе
+    ('I cannot evaluate this text.', None),
+    ('verdict: approved, confidence: high', None),
+]
+
+
+def mutate_response(text, rng):
+    """Случайная порча ответа: обрезка, лишние запятые, кавычки, мусор вокруг."""
+    mutation = rng.randrange(5)
+    if mutation == 0:
+        return text[:rng.randrange(1, len(text) + 1)]
+    if mutation == 1:
+        return text.replace(', ', ',, ' if rng.random() < 0.3 else ', ', 1).replace('}', ',}', 1)
+    if mutation == 2:
+        return text.replace('"', rng.choice('“”'), rng.randrange(1, 8))
+    if mutation == 3:
+        return rng.choice(['```json\n', 'Answer: ', '{ignore} ']) + text + rng.choice(['\n```', ' Done.', ' }}}'])
+    position = rng.randrange(len(text) + 1)
+    return text[:position] + rng.choice('{}[]",:\\') + text[position:]
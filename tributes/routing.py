@@ -0,0 +1,110 @@
+import re
+from django.conf import settings
+
+# Частые служебные слова: на коротком тексте язык определяется надёжнее,
+# чем по символам, и без внешних зависимостей
+STOPWORDS = {
+    'de': {'und', 'der', 'die', 'das', 'ich', 'wir', 'du', 'dich', 'dir', 'ein', 'eine', 'in', 'mit', 'für',
+           'von', 'zu', 'ist', 'war', 'nicht', 'sehr', 'auf', 'immer', 'unser', 'unsere', 'dein', 'deine',
+           'herzliches', 'beileid', 'ruhe', 'frieden', 'lieber', 'liebe', 'wird', 'werden', 'uns', 'den', 'dem'},
+    'fr': {'et', 'le', 'la', 'les', 'de', 'des', 'du', 'un', 'une', 'je', 'nous', 'tu', 'il', 'elle', 'est',
+           'pour', 'avec', 'dans', 'sur', 'pas', 'très', 'toujours', 'notre', 'nos', 'toute', 'famille',
+           'condoléances', 'sincères', 'paix', 'cher', 'chère', 'repose', 'qui', 'que'},
+    'it': {'e', 'il', 'lo', 'la', 'gli', 'le', 'di', 'del', 'della', 'un', 'una', 'che', 'per', 'con', 'non',
+           'sono', 'è', 'sempre', 'nostro', 'nostra', 'nei', 'nel', 'cuori', 'condoglianze', 'sentite',
+           'pace', 'caro', 'cara', 'riposa', 'resterà'},
+    'en': {'and', 'the', 'of', 'to', 'a', 'in', 'is', 'was', 'you', 'we', 'i', 'my', 'our', 'for', 'with',
+           'will', 'be', 'not', 'very', 'always', 'deepest', 'condolences', 'rest', 'peace', 'family',
+           'sorry', 'loss', 'so', 'many', 'lives', 'dear'},
+}
+
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+PROMPT_VARIANTS = ('full', 'compact')
+
+
+def detect_language(text):
+    """
+    Язык текста из languages настроек по служебным словам или None, если
+    признаков нет или два языка набрали одинаково.
+    """
+    words = _WORD_RE.findall(text.lower())
+    languages = settings.AI_MODERATION_SETTINGS.get('languages', list(STOPWORDS))
+    scores = {language: sum(word in STOPWORDS[language] for word in words)
+              for language in languages if language in STOPWORDS}
+    if not scores:
+        return None
+    ranked = sorted(scores.values(), reverse=True)
+    if ranked[0] == 0 or (len(ranked) > 1 and ranked[0] == ranked[1]):
+        return None
+    return max(scores, key=scores.get)
+
+
+class ModerationRoute:
+    """Модель, вариант промпта и бюджет генерации для трибьюта."""
+
+    def __init__(self, name, model=None, prompt_variant='full', num_predict=600, max_text_chars=2000):
+        if prompt_variant not in PROMPT_VARIANTS:
+            raise ValueError(f"Unknown prompt variant for route {name}: {prompt_variant}")
+        self.name = name
+        self.model = model or getattr(settings, 'OLLAMA_MODEL', 'phi3:latest')
+        self.prompt_variant = prompt_variant
+        self.num_predict = num_predict
+        self.max_text_chars = max_text_chars
+
+    def __repr__(self):
+        return f"<ModerationRoute {self.name}: {self.model}, {self.prompt_variant}, {self.num_predict} tokens>"
+
+
+_ROUTE_FIELDS = ('model', 'prompt_variant', 'num_predict', 'max_text_chars')
+
+
+def _route_from_config(config):
+    return ModerationRoute(config.get('name', 'default'), **{key: config[key] for key in _ROUTE_FIELDS if key in config})
+
+
+def _matches(config, length, language, name_context):
+    if 'min_chars' in config and length < config['min_chars']:
+        return False
+    if 'max_chars' in config and length > config['max_chars']:
+        return False
+    if 'languages' in config and (language or 'unknown') not in config['languages']:
+        return False
+    if 'name_contexts' in config and name_context not in config['name_contexts']:
+        return False
+    return True
+
+
+def routing_settings():
+    return settings.AI_MODERATION_SETTINGS.get('routing', {})
+
+
+def default_route():
+    return _route_from_config(routing_settings().get('default', {'name': 'default'}))
+
+
+def select_route(text, name_analysis):
+    """
+    Первый маршрут из AI_MODERATION_SETTINGS['routing']['routes'], условиям
+    которого (min_chars/max_chars, languages, name_contexts) соответствует
+    трибьют; без совпадения или при выключенной маршрутизации - default.
+    """
+    routing = routing_settings()
+    if not routing.get('enabled', False):
+        return default_route()
+
+    length = len(text.strip())
+    language = detect_language(text)
+    for config in routing.get('routes', []):
+        if _matches(config, length, language, name_analysis.get('context')):
+            return _route_from_config(config)
+    return default_route()
+
+
+def configured_routes():
+    """Все маршруты, которые могут быть выбраны (для прогрева моделей)."""
+    routing = routing_settings()
+    routes = [default_route()]
+    if routing.get('enabled', False):
+        routes += [_route_from_config(config) for config in routing.get('routes', [])]
+    return routes
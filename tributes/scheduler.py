@@ -0,0 +1,112 @@
+import logging
+from django.conf import settings
+from .breaker import state_cache
+
+logger = logging.getLogger(__name__)
+
+STATE_CACHE_KEY = 'moderation:fair_share:state'
+
+
+class FairShareScheduler:
+    """
+    Справедливое распределение слотов модерации между партнёрами
+    (deficit round robin). В каждом раунде партнёр с очередью получает
+    квант, равный своему весу, и забирает столько трибьютов, сколько целых
+    единиц накопилось в его дефиците. Партнёр с большой очередью не может
+    занять больше своей доли, пока у других есть работа; пустая очередь
+    обнуляет дефицит, чтобы неактивный партнёр не копил кредит.
+
+    max_in_flight ограничивает число трибьютов партнёра, которые одновременно
+    стоят в очереди Celery или обрабатываются воркером.
+
+    Состояние (дефициты и позиция обхода) переносится между вызовами через
+    to_state/load_state, поэтому дробные веса работают на протяжении многих
+    запусков диспетчера. Между запусками оно хранится в state_cache():
+    с DummyCache (DEBUG) - в памяти процесса, а не теряется.
+    """
+
+    def __init__(self, weights=None, default_weight=1.0, max_in_flight=None, default_max_in_flight=None):
+        self.weights = {int(key): float(value) for key, value in (weights or {}).items()}
+        self.default_weight = float(default_weight)
+        self.max_in_flight = {int(key): value for key, value in (max_in_flight or {}).items()}
+        self.default_max_in_flight = default_max_in_flight
+        self.deficits = {}
+        self.cursor = None
+
+    def weight(self, partner_id):
+        return max(self.weights.get(partner_id, self.default_weight), 0.0)
+
+    def in_flight_limit(self, partner_id):
+        return self.max_in_flight.get(partner_id, self.default_max_in_flight)
+
+    def schedule(self, backlog, in_flight, slots):
+        """
+        Порядок обслуживания на slots мест: список id партнёров, где каждый
+        элемент - один трибьют этого партнёра. backlog и in_flight - словари
+        {partner_id: количество}.
+        """
+        room = {}
+        for partner_id, waiting in backlog.items():
+            if waiting <= 0 or self.weight(partner_id) <= 0:
+                continue
+            limit = self.in_flight_limit(partner_id)
+            available = waiting if limit is None else min(waiting, limit - in_flight.get(partner_id, 0))
+            if available > 0:
+                room[partner_id] = available
+
+        # Дефицит хранится только для партнёров, которым есть что отправить
+        self.deficits = {partner_id: value for partner_id, value in self.deficits.items() if partner_id in room}
+
+        order = self._rotation(sorted(room))
+        sequence = []
+        while slots > len(sequence) and order:
+            for partner_id in list(order):
+                deficit = self.deficits.get(partner_id, 0.0) + self.weight(partner_id)
+                take = min(int(deficit), room[partner_id], slots - len(sequence))
+                sequence.extend([partner_id] * take)
+                room[partner_id] -= take
+                self.deficits[partner_id] = deficit - take
+                if take:
+                    self.cursor = partner_id
+                if not room[partner_id]:
+                    order.remove(partner_id)
+                    self.deficits.pop(partner_id, None)
+                if len(sequence) >= slots:
+                    break
+        return sequence
+
+    def _rotation(self, partner_ids):
+        """Обход начинается после партнёра, обслуженного последним."""
+        if self.cursor is None:
+            return partner_ids
+        after = [partner_id for partner_id in partner_ids if partner_id > self.cursor]
+        return after + [partner_id for partner_id in partner_ids if partner_id <= self.cursor]
+
+    def to_state(self):
+        return {'deficits': self.deficits, 'cursor': self.cursor}
+
+    def load_state(self, state):
+        if state:
+            self.deficits = dict(state.get('deficits', {}))
+            self.cursor = state.get('cursor')
+        return self
+
+
+def fair_share_settings():
+    return settings.AI_MODERATION_SETTINGS.get('fair_share', {})
+
+
+def get_fair_share_scheduler():
+    """Планировщик из AI_MODERATION_SETTINGS['fair_share'] с состоянием из state_cache()."""
+    fair_share = fair_share_settings()
+    scheduler = FairShareScheduler(
+        weights=fair_share.get('weights'),
+        default_weight=fair_share.get('default_weight', 1.0),
+        max_in_flight=fair_share.get('max_in_flight_per_partner'),
+        default_max_in_flight=fair_share.get('default_max_in_flight_per_partner'),
+    )
+    return scheduler.load_state(state_cache().get(STATE_CACHE_KEY))
+
+
+def save_fair_share_scheduler(scheduler):
+    state_cache().set(STATE_CACHE_KEY, scheduler.to_state(), timeout=None)
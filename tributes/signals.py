@@ -1,11 +1,12 @@
 import logging
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.core.mail import send_mail
 from django.conf import settings 
 from django.utils import timezone
 from .models import Tribute
-from .tasks import moderate_tribute_with_ai
+from .names import invalidate_name_profile
+from memorials.models import Memorial
 from django.db import transaction
 
 logger = logging.getLogger(__name__)
@@ -63,13 +64,16 @@ http://172.20.10.4:8000/memorials/{memorial.short_code}/moderate/?token={invite.
                 #print(f"ERROR sending email: {e}")
                 #pass
 
-def safe_send_to_celery(tribute_id):
+def safe_send_to_celery(tribute):
     """Безопасная отправка задачи в Celery"""
     try:
-        moderate_tribute_with_ai.delay(tribute_id)
-        logger.info(f"Задача отправлена в Celery для трибьюта {tribute_id}")
+        # trigger_ai_moderation арендует трибьют: повторный сигнал не создаст дубль задачи
+        if tribute.trigger_ai_moderation():
+            logger.info("Задача отправлена в Celery для трибьюта %s", tribute.id)
+        else:
+            logger.info("Трибьют %s уже в очереди ИИ-модерации", tribute.id)
     except Exception as e:
-        logger.error(f"Celery недоступен, запускаем синхронно: {e}")
+        logger.error("Celery недоступен, запускаем синхронно: %s", e)
         # Запускаем задачу синхронно
         #try:
             #from tributes.utils import moderate_tribute_sync
@@ -93,14 +97,37 @@ def auto_trigger_ai_moderation(sender, instance, created, **kwargs):
         
         if not ai_settings.get('auto_moderate_new', True):
             return
+
+        # В пакетном режиме трибьют заберёт периодическая задача flush_moderation_batch,
+        # при справедливом распределении - dispatch_fair_share
+        if ai_settings.get('batch', {}).get('enabled', False):
+            return
+        if ai_settings.get('fair_share', {}).get('enabled', False):
+            return
             
         # Только для pending и если ещё не модерировалось ИИ
         if instance.status == 'pending' and not instance.ai_moderated_at:
-            logger.info(f"Auto-triggering AI moderation for tribute {instance.id}")
+            logger.info("Auto-triggering AI moderation for tribute %s", instance.id)
             
             # Запускаем задачу в Celery после успешного коммита транзакции
             transaction.on_commit(
-                lambda: safe_send_to_celery(instance.id)
+                lambda: safe_send_to_celery(instance)
             )
     except Exception as e:
-        logger.error(f"Error in auto_trigger_ai_moderation: {e}")               
\ No newline at end of file
+        logger.error("Error in auto_trigger_ai_moderation: %s", e)
+
+
+@receiver(post_save, sender=Memorial)
+def invalidate_memorial_name_profile(sender, instance, created, **kwargs):
+    """
+    Сбрасывает кэшированный профиль имени, если изменились имя или фамилия мемориала
+    """
+    if created:
+        return
+    if instance.tracker.has_changed('first_name') or instance.tracker.has_changed('last_name'):
+        invalidate_name_profile(instance.pk)
+
+
+@receiver(post_delete, sender=Memorial)
+def drop_memorial_name_profile(sender, instance, **kwargs):
+    invalidate_name_profile(instance.pk)
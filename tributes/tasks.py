@@ -1,11 +1,25 @@
-import json
 import requests
-import re
+import time
 import logging
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 from django.conf import settings
 from celery import shared_task
 from django.utils import timezone
-from .models import Tribute
+from .models import Tribute, AI_LEASE_PARKED
+from .ollama import get_ollama_client, blocking_reply, response_timings, StreamReply, OllamaBusy, OllamaUnavailable
+from .breaker import get_ollama_breaker
+from . import metrics
+from .keywords import (
+    scan_keywords, KEYBOARD_SPAM_RE, SCHWEIN_INSULT_RE,
+    EXPLICIT_INSULTS, ADDITIONAL_GERMAN_INSULTS,
+)
+from .names import get_name_profile, ABSTRACT_NOUNS, PRONOUNS, IGNORE_WORDS, NAME_PATTERNS
+from .verdict_cache import get_verdict_cache, verdict_cache_key
+from .json_scan import scan_json_object
+from .preclassifier import VERDICT_REASONING, preclassify
+from .scheduler import fair_share_settings, get_fair_share_scheduler, save_fair_share_scheduler
+from .routing import select_route, configured_routes
 
 logger = logging.getLogger(__name__)
 
@@ -19,63 +33,31 @@ def check_pre_moderation_red_flags(text):
     Возвращает кортеж (True/False, "причина"), где True значит, что нужно отклонить.
     """
     text_lower = text.lower().strip()
+    # Один проход по тексту находит слова всех категорий (см. keywords.py)
+    hits = scan_keywords(text_lower)
     
     # 1. Слишком короткий/бессмысленный
     if len(text_lower) < 10:
         # Но проверяем - может это просто "Мои соболезнования"
-        meaningful_short = any(phrase in text_lower for phrase in [
-            'mein beileid', 'condoléances', 'condoglianze', 'my condolences',
-            'соболезную', 'співчуття', 'riposa in pace', 'rip'
-        ])
-        if not meaningful_short:
+        if not hits.has('short_meaningful'):
             return True, "text_too_short_or_meaningless"
     
     # 2. Клавиатурный спам
-    keyboard_spam_patterns = [
-        r'^[asdfghjkl;]+$',  # asdfghjkl
-        r'^[qwertyuiop]+$',  # qwertyuiop
-        r'^[zxcvbnm]+$',     # zxcvbnm
-        r'^[йцукенгшщзхъ]+$', # русская раскладка
-        r'^[1234567890]+$',  # цифры
-    ]
-    
-    for pattern in keyboard_spam_patterns:
-        if re.match(pattern, text_lower):
-            return True, "keyboard_spam"
+    if KEYBOARD_SPAM_RE.match(text_lower):
+        return True, "keyboard_spam"
     
     # 3. Тестовые фразы
-    test_phrases = [
-        'test', 'тест', 'проба', 'check', 'testing',
-        '123', '456', '789', '000', '111',
-        'hello world', 'привет мир'
-    ]
-    
-    if any(phrase in text_lower for phrase in test_phrases) and len(text_lower) < 30:
+    if hits.has('test') and len(text_lower) < 30:
         return True, "test_phrase"
     
     # 4. Чрезмерное количество эмодзи
-    emoji_count = sum(1 for char in text if char in [
-        '💀', '😂', '🤣', '👻', '😈', '😅', '😆', '😁',
-        '🎉', '🔥', '💩', '🤡', '👏', '🙈', '🙉', '🙊'
-    ])
-    
-    if emoji_count >= 3 and len(text) < 50:  # Много эмодзи в коротком тексте
+    if hits.emoji_count >= 3 and len(text) < 50:  # Много эмодзи в коротком тексте
         return True, "excessive_emoji_spam"
     
     # 5. "Рофл" и интернет-сленг в неподходящем контексте
-    inappropriate_slang = [
-        'рофл', 'ролф', 'rofl', 'лмао', 'lmao', 'кек', 'kek',
-        'ауф', 'auf', 'краш', 'crash', 'кринж', 'cringe',
-        'прикол', 'шуточка', 'шутка', 'joke', 'prank',
-        'чебурек', 'пельмень', 'пацан', 'братан'
-    ]
-    
-    # Если сленг есть И текст короткий И нет уважительных слов
-    if any(slang in text_lower for slang in inappropriate_slang):
-        respectful_words = ['beileid', 'condoléances', 'condoglianze', 'condolences',
-                           'соболезн', 'співчут', 'trauer', 'mourning', 'peace']
-        if not any(word in text_lower for word in respectful_words):
-            return True, "inappropriate_slang_context"
+    # Если сленг есть И нет уважительных слов
+    if hits.has('slang') and not hits.has('respectful'):
+        return True, "inappropriate_slang_context"
     
     return False, "ok"
 
@@ -85,57 +67,32 @@ def analyze_name_mentions(text, memorial):
     Анализирует упоминания имени мемориала в тексте.
     Возвращает словарь с результатами анализа.
     """
-    logger.info(f"===== ANALYZE NAMES DEBUG =====")
-    logger.info(f"Text: {text[:100]}...")
-    logger.info(f"Memorial: {memorial.first_name} {memorial.last_name}")
+    logger.debug("===== ANALYZE NAMES DEBUG =====")
+    logger.debug("Text: %s...", text[:100])
+    logger.debug("Memorial: %s %s", memorial.first_name, memorial.last_name)
 
+    profile = get_name_profile(memorial)
     text_lower = text.lower()
-    full_name = f"{memorial.first_name} {memorial.last_name}".lower()
-    first_name = memorial.first_name.lower()
-    last_name = memorial.last_name.lower()
+    full_name_mentioned, first_name_mentioned, last_name_mentioned = profile.mentions(text_lower)
     
     results = {
-        'full_name_mentioned': full_name in text_lower,
-        'first_name_mentioned': first_name in text_lower,
-        'last_name_mentioned': last_name in text_lower,
+        'full_name_mentioned': full_name_mentioned,
+        'first_name_mentioned': first_name_mentioned,
+        'last_name_mentioned': last_name_mentioned,
         'other_names_found': [],
         'wrong_first_name_detected': False,
         'wrong_last_name_detected': False,
         'context': 'unknown'
     }
     
-    # СПИСОК АБСТРАКТНЫХ ПОНЯТИЙ - НИКОГДА НЕ СЧИТАТЬ ИМЕНАМИ!
-    abstract_nouns = {
-        'güte', 'weisheit', 'geduld', 'liebe', 'hoffnung',
-        'freude', 'trauer', 'frieden', 'ruhe', 'stärke',
-        'mut', 'kraft', 'würde', 'stolz', 'demut',
-        'freundlichkeit', 'hilfsbereitschaft', 'grosszügigkeit',
-        'mitgefühl', 'anteilnahme', 'beileid', 'kondolenz'
-    }
-    
-    # МЕСТОИМЕНИЯ - НЕ ИМЕНА
-    pronouns = {
-        'sein', 'seine', 'seinem', 'seinen', 'seiner',
-        'ihr', 'ihre', 'ihrem', 'ihren', 'ihrer',
-        'unser', 'unsere', 'unserem', 'unseren', 'unserer',
-        'mein', 'meine', 'meinem', 'meinen', 'meiner',
-        'dein', 'deine', 'deinem', 'deinen', 'deiner',
-        'euer', 'eure', 'eurem', 'euren', 'eurer'
-    }
-    
-    # Паттерны для поиска имен
-    name_patterns = [
-        # Два слова с заглавной буквы (полное имя)
-        r'\b([A-ZÄÖÜ][a-zäöüß]+)\s+([A-ZÄÖÜ][a-zäöüß]+)\b',
-        # Обращения + имя/фамилия
-        r'\b(Herr|Frau|Mr\.|Mrs\.|Ms\.|Dr\.|Prof\.)\s+([A-ZÄÖÜ][a-zäöüß]+(?:\s+[A-ZÄÖÜ][a-zäöüß]+)?)\b',
-        # ОДИНОЧНЫЕ ИМЕНА - ЭТО ВАЖНО!
-        r'\b([A-ZÄÖÜ][a-zäöüß]+)\b',
-    ]
+    # Словари и паттерны собраны один раз при импорте (см. names.py)
+    abstract_nouns = ABSTRACT_NOUNS
+    pronouns = PRONOUNS
+    ignore_words = IGNORE_WORDS
     
     all_name_matches = []
-    for pattern in name_patterns:
-        matches = re.findall(pattern, text)
+    for pattern in NAME_PATTERNS:
+        matches = pattern.findall(text)
         for match in matches:
             if isinstance(match, tuple):
                 if len(match) >= 2:
@@ -158,45 +115,7 @@ def analyze_name_mentions(text, memorial):
                     # Проверяем, не абстрактное ли это понятие
                     if match.lower() not in abstract_nouns:
                         all_name_matches.append(match)
-    logger.info(f"All name matches found: {all_name_matches}")
-    # Игнорируем общие слова
-    ignore_words = abstract_nouns | pronouns | {
-        # Обращения
-        'herr', 'frau', 'mr', 'mrs', 'ms', 'fräulein', 'dr', 'prof',
-        'sir', 'madam', 'monsieur', 'madame', 'signor', 'signora',
-        
-        # Семья/отношения
-        'family', 'familie', 'and', 'und', 'oder', 'or',
-        'vater', 'mutter', 'sohn', 'tochter', 'bruder', 'schwester',
-        'father', 'mother', 'son', 'daughter', 'brother', 'sister',
-        
-        # Артикли/местоимения
-        'der', 'die', 'das', 'den', 'dem', 'des', 'ein', 'eine', 'eines',
-        'sein', 'seine', 'seinem', 'seinen', 'seiner', 'Seine',
-        'ihr', 'ihre', 'ihrem', 'ihren', 'ihrer',
-        'unser', 'unsere', 'unserem', 'unseren', 'unserer',
-        'euer', 'eure', 'eurem', 'euren', 'eurer',
-        'mein', 'meine', 'meinem', 'meinen', 'meiner',
-        'dein', 'deine', 'deinem', 'deinen', 'deiner',
-        
-        # Прилагательные/существительные (часто используемые в текстах)
-        'gute', 'güte', 'weise', 'weisheit', 'ruhe', 'frieden',
-        'friede', 'ruh', 'gedenken', 'erinnerung', 'Möge',
-        'mensch', 'person', 'freund', 'kollege', 'nachbar', 'mitarbeiter',
-        'liebe', 'trauer', 'beileid', 'kondolenz', 'mitgefühl',
-        'dank', 'dankbarkeit', 'respekt', 'ehre', 'Güte'  
-        'herz', 'seele', 'geist', 'leben',
-        
-        # Местоимения
-        'jemand', 'niemand', 'jedermann', 'etwas', 'nichts',
-        'man', 'frau', 'kind', 'kinder',
-        
-        # Дни/время
-        'heute', 'gestern', 'morgen', 'tag', 'zeit', 'stunde',
-        
-        # Общие немецкие слова, которые могут быть с большой буквы
-        'deutschland', 'schweiz', 'österreich', 'europa', 'welt'
-    }
+    logger.debug("All name matches found: %s", all_name_matches)
 
     found_names = set()
     for name in all_name_matches:
@@ -228,20 +147,24 @@ def analyze_name_mentions(text, memorial):
                 found_first = name_words[0]
                 found_last = name_words[1]
                 
+                # Сравниваем с учётом вариантов написания (Müller = Mueller = Muller)
+                is_first = profile.is_first_name(found_first)
+                is_last = profile.is_last_name(found_last)
+                
                 # Если нашли имя мемориала, но с другой фамилией
-                if found_first == first_name and found_last != last_name:
+                if is_first and not is_last:
                     results['wrong_last_name_detected'] = True
                     results['detected_wrong_name'] = name
                     
                 
                 # Если нашли фамилию мемориала, но с другим именем
-                if found_last == last_name and found_first != first_name:
+                if is_last and not is_first:
                     results['wrong_first_name_detected'] = True
                     results['detected_wrong_name'] = name
                     
     
     results['other_names_found'] = list(found_names)
-    logger.info(f"Found names after filtering: {found_names}")
+    logger.debug("Found names after filtering: %s", found_names)
     
     # Определяем контекст для промпта
     if results['wrong_first_name_detected'] and results['wrong_last_name_detected']:
@@ -284,9 +207,9 @@ def analyze_name_mentions(text, memorial):
             results['other_names_found'] = []  # Очищаем если это не имена
     else:
         results['context'] = 'no_name'
-    logger.info(f"Final context: {results['context']}")
-    logger.info(f"Other names found: {results['other_names_found']}")
-    logger.info(f"===== END ANALYZE NAMES DEBUG =====")
+    logger.debug("Final context: %s", results['context'])
+    logger.debug("Other names found: %s", results['other_names_found'])
+    logger.debug("===== END ANALYZE NAMES DEBUG =====")
 
     return results
 
@@ -333,24 +256,20 @@ def prepare_name_analysis_for_prompt(name_analysis, memorial):
     return "\n".join(lines) if lines else "Keine Namensanalyse verfügbar."
 
 
-def build_ai_prompt(text, memorial, name_analysis_text):
-    prompt_template = """<|system|>
-Du bist ein Moderator für Gedenkseiten in der Schweiz. Analysiere den folgenden Nachruf (Tribute).
-
-MEMORIAL KONTEXT:
-- Name der verstorbenen Person: {memorial_name}
-- Memorial-ID: {memorial_code}
+# Версия промпта входит в ключ кэша вердиктов - увеличивать при изменении промпта
+AI_PROMPT_VERSION = 'v2'
 
-NAME-ANALYSE (NUR für Kontext):
-{name_analysis}
+# Статическая часть промпта уходит в поле "system" и одинакова во всех запросах:
+# Ollama переиспользует уже вычисленный префикс и считает только текст трибьюта.
+# Ничего изменяемого (имена, даты, текст) сюда добавлять нельзя.
+AI_SYSTEM_PROMPT = """Du bist ein Moderator für Gedenkseiten in der Schweiz. Du erhältst den Memorial-Kontext, eine Name-Analyse und einen Nachruf (Tribute) und analysierst den Nachruf.
 
 WICHTIG ZU WISSEN:
 1. "Seine Güte", "Ihre Weisheit", "Unser Frieden" sind KEINE Personennamen, sondern abstrakte Begriffe!
 2. Allgemeine Kondolenzen ohne Namensnennung sind ERLAUBT und respektvoll.
 3. Wörter wie "Güte", "Frieden", "Ruhe" sind positive Attribute, keine Personennamen.
-
-TEXT ZU ANALYSIEREN (Deutsch, Französisch, Italienisch oder Englisch):
-"{text}"
+4. Die Name-Analyse dient NUR als Kontext.
+5. Der Text kann Deutsch, Französisch, Italienisch oder Englisch sein.
 
 PRÜFKRITERIEN - SOFORT ABLEHNEN wenn:
 A. EXPLIZITE BELEIDIGUNGEN in JEDER Sprache:
@@ -385,70 +304,113 @@ BEACHTE BEI NAMEN:
 - Fehlende Namensnennung ist bei allgemeinen Kondolenzen OK
 
 GIB NUR DIESES JSON-FORMAT ZURÜCK:
-{{
+{
   "verdict": "approved_ai" | "rejected_ai" | "flag_ai",
   "confidence": 0.0 bis 1.0,
   "reasoning": "Deutsche Begründung",
   "flags": ["liste", "der", "probleme"],
   "rejection_category": "explicit_insult" | "hate_speech" | "vulgarity" | "personal_data" | "spam" | "none"
-}}
+}
+
+Sei STRENG bei Beleidigungen, aber FAIR bei respektvollen Texten!"""
+
+# Короткий вариант для маршрутов с маленькой моделью и коротким текстом
+# (AI_MODERATION_SETTINGS['routing']): те же вердикты и JSON в одну строку
+AI_SYSTEM_PROMPT_COMPACT = """Du bist ein Moderator für Gedenkseiten in der Schweiz. Prüfe den kurzen Nachruf (Deutsch, Französisch, Italienisch oder Englisch).
+
+REJECT bei Beleidigungen, Vulgarität, Hassrede, Drohungen, persönlichen Daten (Telefon, Adresse, E-Mail) oder Werbung und Links.
+APPROVE bei respektvollen Kondolenzen, auch ohne Namensnennung. "Güte", "Frieden", "Ruhe" sind keine Personennamen.
+FLAG wenn unklar.
+
+GIB NUR DIESES JSON IN EINER ZEILE ZURÜCK:
+{"verdict": "approved_ai" | "rejected_ai" | "flag_ai", "confidence": 0.0 bis 1.0, "reasoning": "kurze deutsche Begründung", "flags": [], "rejection_category": "explicit_insult" | "hate_speech" | "vulgarity" | "personal_data" | "spam" | "none"}"""
+
+SYSTEM_PROMPTS = {
+    'full': AI_SYSTEM_PROMPT,
+    'compact': AI_SYSTEM_PROMPT_COMPACT,
+}
+
+
+def prompt_version(prompt_variant):
+    """Версия промпта для ключа кэша вердиктов; у полного варианта - прежняя."""
+    return AI_PROMPT_VERSION if prompt_variant == 'full' else f'{AI_PROMPT_VERSION}-{prompt_variant}'
+
+
+def build_ai_prompt(text, memorial, name_analysis_text, max_text_chars=2000):
+    """
+    Пользовательская часть промпта: только данные конкретного трибьюта.
+    Инструкции - в AI_SYSTEM_PROMPT, шаблон phi3 (<|system|>, <|user|>) применяет Ollama.
+    """
+    prompt_template = """MEMORIAL KONTEXT:
+- Name der verstorbenen Person: {memorial_name}
+- Memorial-ID: {memorial_code}
+
+NAME-ANALYSE (NUR für Kontext):
+{name_analysis}
+
+TEXT ZU ANALYSIEREN:
+"{text}"
+
+Analysiere diesen Nachruf."""
 
-Sei STRENG bei Beleidigungen, aber FAIR bei respektvollen Texten!<|end|>
-<|user|>
-Analysiere diesen Nachruf:<|end|>
-<|assistant|>"""
-    
     return prompt_template.format(
         memorial_name=f"{memorial.first_name} {memorial.last_name}",
         memorial_code=memorial.short_code,
         name_analysis=name_analysis_text,
-        text=text[:2000]
+        text=text[:max_text_chars]
     )
 
 
+def ollama_keep_alive():
+    """Сколько Ollama держит модель в памяти после запроса ("30m", секунды или -1)."""
+    return settings.AI_MODERATION_SETTINGS.get('warmup', {}).get('keep_alive', '30m')
+
+
+def debug_dump_enabled(tribute_id):
+    """
+    Нужен ли подробный дамп (текст, полный ответ ИИ, разбор имён) для трибьюта.
+    Пишется для доли logging.debug_dump_sample_rate трибьютов; выбор зависит
+    только от id, поэтому дампы одного трибьюта либо все есть, либо их нет.
+    """
+    if logger.isEnabledFor(logging.DEBUG):
+        return True
+    rate = settings.AI_MODERATION_SETTINGS.get('logging', {}).get('debug_dump_sample_rate', 1.0)
+    if rate >= 1.0:
+        return True
+    if rate <= 0.0 or tribute_id is None:
+        return False
+    # Мультипликативный хэш Кнута: соседние id распределяются равномерно
+    return (tribute_id * 2654435761) % 2**32 < rate * 2**32
+
+
+def is_complete_verdict(ai_result):
+    """Достроенный из обрезанного ответа объект годится, только если вердикт и confidence целы."""
+    confidence = ai_result.get('confidence')
+    return (ai_result.get('verdict') in VALID_VERDICTS
+            and isinstance(confidence, (int, float)) and not isinstance(confidence, bool))
+
+
 def parse_ai_response(ai_response, tribute_id):
     """
     Парсит ответ от ИИ, извлекает JSON.
     """
-    logger.info(f"Raw AI response for {tribute_id}: {ai_response[:200]}...")
-    
-    # Очистка ответа
-    cleaned_response = ai_response.replace('```json', '').replace('```', '').strip()
-    
-    # Поиск JSON с помощью regex
-    json_match = None
-    json_pattern = r'\{[^{}]*\{[^{}]*\}[^{}]*\}|{[^{}]*\}'
-    matches = re.findall(json_pattern, cleaned_response, re.DOTALL)
-    
-    if matches:
-        json_match = max(matches, key=len)
-        logger.info(f"Found JSON via regex: {json_match[:100]}...")
-    
-    if not json_match:
-        start = cleaned_response.find('{')
-        end = cleaned_response.rfind('}') + 1
-        if start >= 0 and end > start:
-            json_match = cleaned_response[start:end]
-            logger.info(f"Found JSON via start/end: {json_match[:100]}...")
-    
-    # Парсинг JSON
-    if json_match:
-        try:
-            return json.loads(json_match)
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parse error: {e}, trying to fix...")
-            
-            # Попытка почистить JSON
-            json_match_fixed = re.sub(r',\s*}', '}', json_match)
-            json_match_fixed = re.sub(r',\s*]', ']', json_match_fixed)
-            
-            try:
-                return json.loads(json_match_fixed)
-            except json.JSONDecodeError as e2:
-                logger.error(f"Still JSON parse error: {e2}")
+    logger.debug("Raw AI response for %s: %s...", tribute_id, ai_response[:200])
     
+    # Однопроходный разбор: первый JSON-объект с вердиктом,
+    # висячие запятые, типографские кавычки и обрезанный ответ исправляются по ходу
+    ai_result, repaired = scan_json_object(
+        ai_response, required_key='verdict', accept_repaired=is_complete_verdict
+    )
+    if ai_result is not None:
+        if repaired:
+            # Достроенный ответ не кэшируется (см. process_ai_response)
+            logger.warning("Truncated AI response repaired for tribute %s", tribute_id)
+            flags = ai_result.get('flags')
+            ai_result['flags'] = (flags if isinstance(flags, list) else []) + ['truncated_response']
+        return ai_result
+
     # Fallback если JSON не найден
-    logger.warning(f"No valid JSON found in response for tribute {tribute_id}")
+    logger.warning("No valid JSON found in response for tribute %s", tribute_id)
     return {
         "verdict": "flag_ai", 
         "confidence": 0.2,
@@ -534,201 +496,648 @@ def adjust_verdict_based_on_names(ai_result, name_analysis):
     # Добавляем контекст для логов
     ai_result['name_context'] = name_analysis['context']
     
-    logger.info(f"Name adjustment: {name_analysis['context']}, final verdict: {ai_result['verdict']}, confidence: {ai_result['confidence']}")
+    logger.debug(
+        "Name adjustment: %s, final verdict: %s, confidence: %s",
+        name_analysis['context'], ai_result['verdict'], ai_result['confidence']
+    )
     return ai_result
 
 
 def check_explicit_insults(text):
     """Проверка на явные оскорбления перед отправкой в AI"""
-    text_lower = text.lower()
-    
-    # Явные оскорбления на разных языках
-    explicit_insults = {
-        'russian': ['жопа', 'сука', 'пизда', 'блядь', 'ебать', 'хуй', 'идиот', 'дурак', 'шлюха', 'шлюх', 'дура', 'идиотка', 'хуйня', 'блядина'],
-        'german': ['scheisse', 'arsch', 'hurensohn', 'wichser', 'fotze', 'miststück', 'schwanz', 'hass', 'huren', 'hasse', 'schwein', 'hund', 'sau', 'kuh', 'affe', 'ratte', 'käfer', 'dick'],
-        'english': ['shit', 'fuck', 'asshole', 'bitch', 'motherfucker', 'cunt'],
-        'french': ['merde', 'putain', 'connard', 'salope', 'enculé'],
-        'italian': ['merda', 'cazzo', 'stronzo', 'vaffanculo', 'puttana']
-    }
+    hits = scan_keywords(text.lower().strip())
     
+    # Явные оскорбления на разных языках (порядок - как в словаре)
     found_insults = []
-    for language, words in explicit_insults.items():
-        for word in words:
-            if word in text_lower:
-                found_insults.append(f"{word} ({language})")
+    insults = hits.get('insult')
+    if insults:
+        for language, words in EXPLICIT_INSULTS.items():
+            for word in words:
+                if word in insults:
+                    found_insults.append(f"{word} ({language})")
     
     # Проверка животных как оскорблений
-    animal_insults = ['schwein', 'hund', 'sau', 'kuh', 'affe', 'ratte']
     # Но исключаем, если это часть нормального предложения
-    if 'schwein' in text_lower:
+    if 'schwein' in insults:
         # Проверяем контекст: "Du Schwein!" vs "Herr Schwein"
-        if re.search(r'\b(du|sie|er|sie)\s+schwein\b', text_lower, re.IGNORECASE):
+        if SCHWEIN_INSULT_RE.search(text.lower()):
             found_insults.append("schwein (animal_insult)")
 
     # Дополнительная проверка немецких оскорблений
-    additional_german = ['hass', 'hasse', 'hassen', 'idiot', 'depp', 'blöd', 'dumm']
-    for word in additional_german:
-        if word in text_lower:
-            found_insults.append(f"{word} (german_insult)")
+    german_insults = hits.get('german_insult')
+    if german_insults:
+        for word in ADDITIONAL_GERMAN_INSULTS:
+            if word in german_insults:
+                found_insults.append(f"{word} (german_insult)")
 
     return found_insults    
 
-# Основная задача Celery для модерации трибьюта с помощью ИИ
-@shared_task
-def moderate_tribute_with_ai(tribute_id, retry_count=0):
+def run_local_checks(tribute):
     """
-    Фоновая задача для модерации трибьюта с помощью ИИ
+    Локальные проверки ДО отправки в ИИ: пре-модерация, явные оскорбления, анализ имён
+    и локальный классификатор. Возвращает кортеж (сообщение, name_analysis). Если
+    сообщение не None, трибьют уже решён и сохранён - в ИИ его отправлять не нужно.
     """
-    try:
-        tribute = Tribute.objects.get(id=tribute_id)
-
-        # ===== 0. ПРОВЕРКА СТАТУСА =====
-        if tribute.status != 'pending' or tribute.ai_moderated_at:
-            return f"Tribute {tribute_id} already moderated or not pending"
+    tribute_id = tribute.id
 
-        # ===== 1. БЫСТРАЯ ПРЕ-МОДЕРАЦИЯ (ДО AI) =====
+    # ===== 1. БЫСТРАЯ ПРЕ-МОДЕРАЦИЯ (ДО AI) =====
+    with metrics.stage('pre_moderation'):
         pre_mod_reject, reason = check_pre_moderation_red_flags(tribute.text)
-        if pre_mod_reject:
-            logger.warning(f"Pre-moderation reject for tribute {tribute_id}: {reason}")
-            
-            tribute.status = 'rejected'
-            tribute.ai_verdict = 'rejected_ai'
-            tribute.ai_confidence = 0.95
-            tribute.ai_moderation_result = {
-                "verdict": "rejected_ai",
-                "confidence": 0.95,
-                "reasoning": f"Unangemessener Inhalt erkannt: {reason}",
-                "flags": ["pre_moderation_reject", reason],
-                "auto_action": True,
-                "rejection_category": "inappropriate_content"
-            }
-            tribute.save()
-            return f"Pre-moderation rejected: {reason}"
+    if pre_mod_reject:
+        logger.warning("Pre-moderation reject for tribute %s: %s", tribute_id, reason)
+        
+        tribute.status = 'rejected'
+        tribute.ai_verdict = 'rejected_ai'
+        tribute.ai_confidence = 0.95
+        tribute.ai_moderation_result = {
+            "verdict": "rejected_ai",
+            "confidence": 0.95,
+            "reasoning": f"Unangemessener Inhalt erkannt: {reason}",
+            "flags": ["pre_moderation_reject", reason],
+            "auto_action": True,
+            "rejection_category": "inappropriate_content"
+        }
+        tribute.clear_ai_lease()
+        tribute.save()
+        metrics.record_outcome('pre_moderation_reject')
+        return f"Pre-moderation rejected: {reason}", None
 
-        # Проверка на явные оскорбления
+    # Проверка на явные оскорбления
+    with metrics.stage('insult_check'):
         explicit_insults = check_explicit_insults(tribute.text)
 
-        if explicit_insults:
-            logger.warning(f"Explicit insults detected for tribute {tribute_id}: {explicit_insults}")
-            
-            # Автоматически отклоняем если найдены явные оскорбления
-            tribute.status = 'rejected'
-            tribute.ai_verdict = 'rejected_ai'
-            tribute.ai_confidence = 0.95
-            tribute.ai_moderation_result = {
-                "verdict": "rejected_ai",
-                "confidence": 0.95,
-                "reasoning": f"Explizite Beleidigungen gefunden: {', '.join(explicit_insults[:3])}",
-                "flags": ["explicit_insult"] + explicit_insults[:3],
-                "auto_action": True,
-                "rejection_category": "explicit_insult"
-            }
-            tribute.save()
-            return f"Auto-rejected for explicit insults: {explicit_insults[:2]}"
+    if explicit_insults:
+        logger.warning("Explicit insults detected for tribute %s: %s", tribute_id, explicit_insults)
+        
+        # Автоматически отклоняем если найдены явные оскорбления
+        tribute.status = 'rejected'
+        tribute.ai_verdict = 'rejected_ai'
+        tribute.ai_confidence = 0.95
+        tribute.ai_moderation_result = {
+            "verdict": "rejected_ai",
+            "confidence": 0.95,
+            "reasoning": f"Explizite Beleidigungen gefunden: {', '.join(explicit_insults[:3])}",
+            "flags": ["explicit_insult"] + explicit_insults[:3],
+            "auto_action": True,
+            "rejection_category": "explicit_insult"
+        }
+        tribute.clear_ai_lease()
+        tribute.save()
+        metrics.record_outcome('insult_reject')
+        return f"Auto-rejected for explicit insults: {explicit_insults[:2]}", None
 
-        # ===== 1. АНАЛИЗ ИМЁН =====        
-        memorial = tribute.memorial
+    # ===== 2. АНАЛИЗ ИМЁН =====        
+    memorial = tribute.memorial
+    with metrics.stage('name_analysis'):
         name_analysis = analyze_name_mentions(tribute.text, memorial)
-        logger.info(f"Name analysis for tribute {tribute_id}: {name_analysis['context']}")
+    logger.debug("Name analysis for tribute %s: %s", tribute_id, name_analysis['context'])
 
-        # Если найдено чужое имя - сразу отклоняем, не отправляя в ИИ!
-        if name_analysis['context'] in ['wrong_both_names', 'wrong_first_name', 'wrong_last_name', 'different_name']:
-            logger.warning(f"Wrong name detected for tribute {tribute_id}: {name_analysis['context']} - {name_analysis.get('other_names_found', [])}")
-            
-            tribute.status = 'rejected'
-            tribute.ai_verdict = 'rejected_ai'
-            tribute.ai_confidence = 0.95
-            tribute.ai_moderation_result = {
-                "verdict": "rejected_ai",
-                "confidence": 0.95,
-                "reasoning": f"Falscher Name erkannt: {name_analysis['context']} - {name_analysis.get('other_names_found', [])}",
-                "flags": ["wrong_name_detected"] + name_analysis.get('other_names_found', [])[:3],
-                "auto_action": True,
-                "rejection_category": "wrong_person"
-            }
-            tribute.ai_moderated_at = timezone.now()
-            tribute.save()
-            return f"Rejected: wrong name detected ({name_analysis['context']})"
+    # Если найдено чужое имя - сразу отклоняем, не отправляя в ИИ!
+    if name_analysis['context'] in ['wrong_both_names', 'wrong_first_name', 'wrong_last_name', 'different_name']:
+        logger.warning(
+            "Wrong name detected for tribute %s: %s - %s",
+            tribute_id, name_analysis['context'], name_analysis.get('other_names_found', [])
+        )
+        
+        tribute.status = 'rejected'
+        tribute.ai_verdict = 'rejected_ai'
+        tribute.ai_confidence = 0.95
+        tribute.ai_moderation_result = {
+            "verdict": "rejected_ai",
+            "confidence": 0.95,
+            "reasoning": f"Falscher Name erkannt: {name_analysis['context']} - {name_analysis.get('other_names_found', [])}",
+            "flags": ["wrong_name_detected"] + name_analysis.get('other_names_found', [])[:3],
+            "auto_action": True,
+            "rejection_category": "wrong_person"
+        }
+        tribute.ai_moderated_at = timezone.now()
+        tribute.clear_ai_lease()
+        tribute.save()
+        metrics.record_outcome('wrong_name')
+        return f"Rejected: wrong name detected ({name_analysis['context']})", None
 
-        # ===== 2. ПОСТРОЕНИЕ ПРОМПТА С КОНТЕКСТОМ =====
+    # ===== 3. ЛОКАЛЬНЫЙ КЛАССИФИКАТОР =====
+    # Шаблонные соболезнования решаются без ИИ; пороги и проверка имён те же, что для ответа модели
+    with metrics.stage('preclassifier'):
+        local_verdict = preclassify(tribute.text)
+    if local_verdict is not None:
+        verdict, confidence = local_verdict
+        logger.info("Preclassifier decided tribute %s: %s (%.3f)", tribute_id, verdict, confidence)
+        ai_result = {
+            "verdict": verdict,
+            "confidence": round(confidence, 3),
+            "reasoning": VERDICT_REASONING[verdict],
+            "flags": ["preclassifier"],
+            "rejection_category": "none" if verdict == 'approved_ai' else "preclassifier",
+            "decided_by": "preclassifier",
+        }
+        action = finalize_ai_result(ai_result, tribute, name_analysis, outcome='preclassifier_verdict')
+        return f"Decided by preclassifier: {action}", None
+
+    return None, name_analysis
+
+
+def build_ollama_payload(tribute, name_analysis):
+    """
+    Строит промпт с контекстом имён и тело запроса к Ollama. Модель, вариант
+    промпта и бюджет генерации выбирает маршрут (см. tributes.routing).
+    """
+    memorial = tribute.memorial
+    with metrics.stage('prompt_build'):
+        route = select_route(tribute.text, name_analysis)
         name_analysis_text = prepare_name_analysis_for_prompt(name_analysis, memorial)
-        prompt = build_ai_prompt(tribute.text, memorial, name_analysis_text)
-        
-        # ===== 3. ОТПРАВКА В ИИ =====
-        ollama_url = getattr(settings, 'OLLAMA_API_URL', 'http://localhost:11434/api/generate')
-        model_name = getattr(settings, 'OLLAMA_MODEL', 'phi3:latest')
-        
-        payload = {
-            "model": model_name,
-            "prompt": prompt,
-            "stream": False,
-            "options": {
-                "temperature": 0.1,
-                "top_p": 0.9,
-                "num_predict": 600,  
-                "stop": ["<|end|>", "\n\n"]
-            }
+        prompt = build_ai_prompt(tribute.text, memorial, name_analysis_text, route.max_text_chars)
+
+    return {
+        "model": route.model,
+        "system": SYSTEM_PROMPTS[route.prompt_variant],
+        "prompt": prompt,
+        "stream": settings.AI_MODERATION_SETTINGS.get('stream_responses', False),
+        "keep_alive": ollama_keep_alive(),
+        "options": {
+            "temperature": 0.1,
+            "top_p": 0.9,
+            "num_predict": route.num_predict,
+            "stop": ["<|end|>", "\n\n"]
         }
+    }
+
+
+def call_ollama(payload):
+    """
+    Отправляет запрос в Ollama и возвращает кортеж (текст ответа модели, статистика).
+    Ошибки подключения пробрасываются как requests.exceptions.RequestException.
+    """
+    breaker = get_ollama_breaker()
+    if breaker is not None and not breaker.allow_request():
+        raise OllamaUnavailable("Ollama circuit breaker is open")
+
+    try:
+        with metrics.stage('ollama_roundtrip'):
+            if payload.get('stream'):
+                result = call_ollama_streaming(payload)
+            else:
+                result = call_ollama_blocking(payload)
+    except (OllamaBusy, OllamaUnavailable):
+        # Запрос не отправлялся - это не ошибка Ollama для предохранителя
+        raise
+    except requests.exceptions.RequestException:
+        if breaker is not None:
+            breaker.record_failure()
+        raise
+
+    if breaker is not None:
+        breaker.record_success()
+    return result
+
+
+def call_ollama_blocking(payload):
+    started = time.monotonic()
+    return blocking_reply(get_ollama_client().generate(payload), started)
+
+
+def call_ollama_streaming(payload):
+    """
+    Читает поток токенов Ollama и прекращает чтение, как только модель
+    выдала закрытый JSON-объект с вердиктом - остальной текст не нужен.
+    """
+    reply = StreamReply(time.monotonic())
+    with closing(get_ollama_client().generate_stream(payload)) as chunks:
+        for chunk in chunks:
+            if reply.feed(chunk):
+                break
+    return reply.result()
+
+
+def lookup_cached_verdict(tribute, name_analysis, payload):
+    """
+    Ищет готовый вердикт в кэше. Возвращает (ключ кэша, результат или None);
+    ключ равен None, если кэш вердиктов выключен.
+    """
+    verdict_cache = get_verdict_cache()
+    if verdict_cache is None:
+        return None, None
+
+    route = select_route(tribute.text, name_analysis)
+    cache_key = verdict_cache_key(
+        tribute.text, name_analysis['context'], payload['model'], prompt_version(route.prompt_variant)
+    )
+    cached_result = verdict_cache.get(cache_key)
+    if cached_result is not None:
+        logger.info("Verdict cache hit for tribute %s: %s", tribute.id, cached_result.get('verdict'))
+        cached_result['cache_hit'] = True
+        metrics.record_outcome('verdict_cache_hit')
+    return cache_key, cached_result
+
+
+def process_ai_response(tribute, ai_response, llm_stats, cache_key):
+    """
+    Разбирает ответ модели и сохраняет вердикт в кэш.
+    """
+    tribute_id = tribute.id
+    if debug_dump_enabled(tribute_id):
+        logger.info("AI raw response for tribute %s: %s...", tribute_id, ai_response[:200])
+        logger.info("LLM stats for tribute %s: %s", tribute_id, llm_stats)
+    metrics.record_llm_timings(llm_stats)
+
+    # ===== 4. ПАРСИНГ ОТВЕТА =====
+    with metrics.stage('parse'):
+        ai_result = parse_ai_response(ai_response, tribute_id)
+
+    # Кэшируем только нормальные ответы модели: не fallback при ошибке формата
+    # и не объект, достроенный из обрезанного ответа
+    flags = ai_result.get('flags') or []
+    if (cache_key and ai_result.get('verdict') in VALID_VERDICTS
+            and 'invalid_format' not in flags and 'truncated_response' not in flags):
+        get_verdict_cache().set(cache_key, ai_result)
+
+    ai_result['llm_stats'] = llm_stats
+    return ai_result
+
+
+def request_ai_result(tribute, name_analysis, payload):
+    """
+    Возвращает разобранный результат ИИ для трибьюта. Сначала проверяется кэш
+    вердиктов (одинаковые тексты вроде "Mein herzliches Beileid" не отправляются
+    в Ollama повторно), при промахе - запрос к Ollama и сохранение результата.
+    """
+    cache_key, cached_result = lookup_cached_verdict(tribute, name_analysis, payload)
+    if cached_result is not None:
+        return cached_result
+
+    # ===== 3. ОТПРАВКА В ИИ =====
+    ai_response, llm_stats = call_ollama(payload)
+    return process_ai_response(tribute, ai_response, llm_stats, cache_key)
+
+
+def prepare_ai_result(ai_result, tribute, name_analysis):
+    """
+    Корректирует вердикт ИИ по именам и добавляет контекст имён для логов.
+    """
+    tribute_id = tribute.id
+
+    # ===== 5. КОРРЕКЦИЯ НА ОСНОВЕ ИМЁН =====
+    with metrics.stage('name_adjustment'):
+        ai_result = adjust_verdict_based_on_names(ai_result, name_analysis)
+
+    # ===== ОТЛАДОЧНЫЙ ДАМП (для доли трибьютов, см. debug_dump_enabled) =====
+    if debug_dump_enabled(tribute_id):
+        logger.info("=== DEBUG AI MODERATION ===")
+        logger.info("Tribute ID: %s", tribute_id)
+        logger.info("Text preview: %s...", tribute.text[:100])
+        logger.info("Parsed AI result: %s", ai_result)
+        logger.info("Name analysis: %s", name_analysis)
+        logger.info("=== END DEBUG ===")
+    
+    # ===== 6. ДОБАВЛЕНИЕ КОНТЕКСТА ДЛЯ ЛОГОВ =====
+    ai_result['name_context'] = name_analysis['context']
+    if ai_result.get('decided_by', 'llm') == 'llm':
+        route = select_route(tribute.text, name_analysis)
+        ai_result['route'] = route.name
+        metrics.record_route(route.name, ai_result, cache_hit=ai_result.get('cache_hit', False))
+    if name_analysis['other_names_found']:
+        ai_result['other_names'] = name_analysis['other_names_found'][:3]
+    return ai_result
+
+
+def finalize_ai_result(ai_result, tribute, name_analysis, outcome='llm_verdict'):
+    """
+    Корректирует вердикт ИИ по именам и применяет его к трибьюту.
+    """
+    ai_result = prepare_ai_result(ai_result, tribute, name_analysis)
+
+    # ===== 7. ПРИМЕНЕНИЕ РЕЗУЛЬТАТА =====
+    action = tribute.apply_ai_verdict(ai_result)
+    metrics.record_outcome(outcome)
+    log_moderation_result(tribute, ai_result, action, outcome)
+    return action
+
+
+def log_moderation_result(tribute, ai_result, action, outcome):
+    """
+    Одна краткая запись на трибьют. Те же поля передаются в extra['moderation']
+    для структурированных обработчиков (JSON-форматтер, сбор логов).
+    """
+    llm_stats = ai_result.get('llm_stats') or {}
+    record = {
+        'tribute_id': tribute.id,
+        'outcome': outcome,
+        'action': action.get('action'),
+        'verdict': action.get('verdict'),
+        'confidence': action.get('confidence'),
+        'name_context': ai_result.get('name_context'),
+        'cache_hit': ai_result.get('cache_hit', False),
+        'route': ai_result.get('route'),
+        'llm_mode': llm_stats.get('mode'),
+        'time_to_verdict_ms': llm_stats.get('time_to_verdict_ms'),
+    }
+    logger.info(
+        "Moderated tribute %s: %s %s (%s, confidence %s, names %s, %s ms)",
+        record['tribute_id'], record['outcome'], record['action'], record['verdict'],
+        record['confidence'], record['name_context'], record['time_to_verdict_ms'],
+        extra={'moderation': record},
+    )
+
+
+# Основная задача Celery для модерации трибьюта с помощью ИИ
+@shared_task
+def moderate_tribute_with_ai(tribute_id, retry_count=0, lease_token=None):
+    """
+    Фоновая задача для модерации трибьюта с помощью ИИ.
+    lease_token - токен аренды, полученный при постановке в очередь;
+    без него задача сначала сама арендует трибьют.
+    """
+    try:
+        tribute = Tribute.objects.select_related('memorial').get(id=tribute_id)
+
+        # ===== 0. ПРОВЕРКА СТАТУСА =====
+        if tribute.status != 'pending' or tribute.ai_moderated_at:
+            return f"Tribute {tribute_id} already moderated or not pending"
+
+        # ===== 0.1 АРЕНДА: один трибьют - одна модерация =====
+        if lease_token is None:
+            if tribute.claim_ai_lease() is None:
+                return f"Tribute {tribute_id} is already being moderated"
+        elif tribute.ai_lease_token != lease_token:
+            return f"Tribute {tribute_id} lease is held by another worker, skipping"
+
+        # ===== 1. ЛОКАЛЬНЫЕ ПРОВЕРКИ (ДО AI) =====
+        message, name_analysis = run_local_checks(tribute)
+        if message:
+            return message
+
+        # ===== 2-4. ПРОМПТ, КЭШ ВЕРДИКТОВ / ОТПРАВКА В ИИ =====
+        payload = build_ollama_payload(tribute, name_analysis)
         
         try:
-            response = requests.post(ollama_url, json=payload, timeout=60)
-            response.raise_for_status()
-            
-            result = response.json()
-            ai_response = result.get('response', '').strip()
-            
-            # ===== 4. ПАРСИНГ ОТВЕТА =====
-            ai_result = parse_ai_response(ai_response, tribute_id)
-            
-            # ===== 5. КОРРЕКЦИЯ НА ОСНОВЕ ИМЁН =====
-            ai_result = adjust_verdict_based_on_names(ai_result, name_analysis)
-
-            # ===== ДОБАВЛЕННЫЙ ОТЛАДОЧНЫЙ ЛОГ =====
-            logger.info(f"=== DEBUG AI MODERATION ===")
-            logger.info(f"Tribute ID: {tribute_id}")
-            logger.info(f"Text preview: {tribute.text[:100]}...")
-            logger.info(f"AI raw response: {ai_response[:200]}...")
-            logger.info(f"Parsed AI result: {ai_result}")
-            logger.info(f"AI verdict: {ai_result.get('verdict')}")
-            logger.info(f"AI confidence: {ai_result.get('confidence')}")
-            logger.info(f"Name context: {name_analysis['context']}")
-            logger.info(f"Explicit insults found earlier: {explicit_insults}")
-            logger.info(f"=== END DEBUG ===")
-            
-            # ===== 6. ДОБАВЛЕНИЕ КОНТЕКСТА ДЛЯ ЛОГОВ =====
-            ai_result['name_context'] = name_analysis['context']
-            if name_analysis['other_names_found']:
-                ai_result['other_names'] = name_analysis['other_names_found'][:3]
-
-            # ===== ДОБАВЛЕННЫЙ ЛОГ ПЕРЕД ВЫЗОВОМ =====
-            logger.info(f"Calling apply_ai_verdict with: {ai_result}")
-            # ===== 7. ПРИМЕНЕНИЕ РЕЗУЛЬТАТА =====
-            action = tribute.apply_ai_verdict(ai_result)
-            
-            # Логируем успех
-            logger.info(f"ИИ отмодерировал трибьют {tribute_id}: {action}")
-            logger.info(f"Name context: {name_analysis['context']}")
+            ai_result = request_ai_result(tribute, name_analysis, payload)
+            action = finalize_ai_result(ai_result, tribute, name_analysis)
             return f"AI moderation completed for {tribute_id}: {action} (name context: {name_analysis['context']})"
             
         except requests.exceptions.RequestException as e:
-            logger.error(f"Ошибка подключения к Ollama: {e}")
+            logger.error("Ошибка подключения к Ollama: %s", e)
             return handle_ollama_error(e, tribute, tribute_id, retry_count)
             
     except Tribute.DoesNotExist:
-        logger.error(f"Трибьют {tribute_id} не найден")
+        logger.error("Трибьют %s не найден", tribute_id)
         return f"Tribute {tribute_id} not found"
     except Exception as e:
-        logger.exception(f"Неожиданная ошибка в moderate_tribute_with_ai: {e}")
+        logger.exception("Неожиданная ошибка в moderate_tribute_with_ai: %s", e)
         return f"Unexpected error: {str(e)}"
 
 
+# Пакетная модерация: одна задача обрабатывает N трибьютов,
+# запросы к Ollama выполняются параллельно
+@shared_task
+def moderate_tributes_batch(tribute_ids, lease_token=None):
+    """
+    Модерирует пакет трибьютов. Локальные проверки выполняются для каждого
+    трибьюта отдельно, оставшиеся тексты отправляются в Ollama одновременно
+    (не более max_concurrency запросов), вердикты применяются одним
+    Tribute.apply_ai_verdicts - запросов к БД на запись столько же, сколько для одного трибьюта.
+    Обрабатываются только трибьюты, арендованные с lease_token; без токена
+    задача сначала арендует переданные трибьюты сама.
+    """
+    batch_settings = settings.AI_MODERATION_SETTINGS.get('batch', {})
+    max_concurrency = batch_settings.get('max_concurrency', 4)
+
+    if lease_token is None:
+        lease_token, _ = Tribute.claim_ai_batch(
+            len(tribute_ids),
+            queryset=Tribute.objects.filter(id__in=tribute_ids)
+        )
+
+    tributes = Tribute.objects.select_related('memorial').filter(
+        id__in=tribute_ids,
+        status='pending',
+        ai_moderated_at__isnull=True,
+        ai_lease_token=lease_token
+    )
+
+    summary = {'local': 0, 'ai': 0, 'errors': 0}
+    pending_ai = []
+    for tribute in tributes:
+        try:
+            message, name_analysis = run_local_checks(tribute)
+        except Exception as e:
+            logger.exception("Ошибка локальных проверок для трибьюта %s: %s", tribute.id, e)
+            summary['errors'] += 1
+            continue
+        if message:
+            summary['local'] += 1
+            continue
+        pending_ai.append((tribute, name_analysis, build_ollama_payload(tribute, name_analysis)))
+
+    if not pending_ai:
+        return f"Batch of {len(tribute_ids)} tributes moderated: {summary}"
+
+    # Ollama вызывается из потоков, а работа с БД остаётся в потоке задачи
+    with ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(pending_ai)))) as executor:
+        futures = [
+            (tribute, name_analysis, executor.submit(request_ai_result, tribute, name_analysis, payload))
+            for tribute, name_analysis, payload in pending_ai
+        ]
+
+        verdicts = []
+        for tribute, name_analysis, future in futures:
+            try:
+                ai_result = future.result()
+                verdicts.append((tribute, prepare_ai_result(ai_result, tribute, name_analysis)))
+            except requests.exceptions.RequestException as e:
+                logger.error("Ошибка подключения к Ollama для трибьюта %s: %s", tribute.id, e)
+                handle_ollama_error(e, tribute, tribute.id, 0)
+                summary['errors'] += 1
+            except Exception as e:
+                logger.exception("Неожиданная ошибка пакетной модерации для трибьюта %s: %s", tribute.id, e)
+                summary['errors'] += 1
+
+    # ===== 7. ПРИМЕНЕНИЕ РЕЗУЛЬТАТОВ ПАКЕТОМ =====
+    if verdicts:
+        try:
+            actions = Tribute.apply_ai_verdicts(verdicts)
+        except Exception as e:
+            # Транзакция откатилась: аренда не снята и истечёт, трибьюты будут взяты снова
+            logger.exception("Не удалось применить вердикты пакета из %s трибьютов: %s", len(verdicts), e)
+            summary['errors'] += len(verdicts)
+        else:
+            for (tribute, ai_result), action in zip(verdicts, actions):
+                metrics.record_outcome('llm_verdict')
+                log_moderation_result(tribute, ai_result, action, 'llm_verdict')
+            summary['ai'] += len(verdicts)
+
+    logger.info("Batch moderation finished for %s tributes: %s", len(tribute_ids), summary)
+    return f"Batch of {len(tribute_ids)} tributes moderated: {summary}"
+
+
+@shared_task
+def flush_moderation_batch():
+    """
+    Периодическая задача (Celery beat): собирает до batch.size ожидающих
+    трибьютов и модерирует их одним пакетом.
+    """
+    batch_settings = settings.AI_MODERATION_SETTINGS.get('batch', {})
+    if not batch_settings.get('enabled', False):
+        return "Batch moderation disabled"
+
+    breaker = get_ollama_breaker()
+    if breaker is not None and breaker.state()['state'] == 'open':
+        return "Ollama circuit open, batch postponed"
+
+    # Аренда гарантирует, что параллельные воркеры не возьмут одни и те же трибьюты
+    if fair_share_settings().get('enabled', False):
+        scheduler = get_fair_share_scheduler()
+        lease_token, tribute_ids = Tribute.claim_ai_fair(batch_settings.get('size', 20), scheduler)
+        save_fair_share_scheduler(scheduler)
+    else:
+        lease_token, tribute_ids = Tribute.claim_ai_batch(batch_settings.get('size', 20))
+
+    if not tribute_ids:
+        return "No pending tributes"
+
+    return moderate_tributes_batch(tribute_ids, lease_token=lease_token)
+
+
+@shared_task
+def dispatch_fair_share():
+    """
+    Периодическая задача (Celery beat): ставит ожидающие трибьюты в очередь
+    moderation по справедливой доле партнёров. В очереди и в работе держится
+    не больше fair_share.max_in_flight трибьютов, поэтому порядок модерации
+    определяет планировщик, а не FIFO брокера: всплеск у одного партнёра
+    не задерживает остальных дольше одного интервала диспетчера.
+    """
+    fair_share = fair_share_settings()
+    if not fair_share.get('enabled', False):
+        return "Fair-share dispatch disabled"
+    if settings.AI_MODERATION_SETTINGS.get('batch', {}).get('enabled', False):
+        return "Batch moderation enabled, fair share applied by flush_moderation_batch"
+
+    breaker = get_ollama_breaker()
+    if breaker is not None and breaker.state()['state'] == 'open':
+        return "Ollama circuit open, dispatch postponed"
+
+    in_flight = Tribute.objects.filter(
+        status='pending', ai_moderated_at__isnull=True, ai_lease_expires_at__gt=timezone.now()
+    ).count()
+    slots = fair_share.get('max_in_flight', 32) - in_flight
+    if slots <= 0:
+        return f"{in_flight} tributes in flight, nothing dispatched"
+
+    scheduler = get_fair_share_scheduler()
+    lease_token, tribute_ids = Tribute.claim_ai_fair(slots, scheduler)
+    save_fair_share_scheduler(scheduler)
+
+    for position, tribute_id in enumerate(tribute_ids):
+        try:
+            moderate_tribute_with_ai.delay(tribute_id, lease_token=lease_token)
+        except Exception:
+            # Брокер недоступен: неотправленные трибьюты возвращаются в очередь
+            Tribute.objects.filter(id__in=tribute_ids[position:], ai_lease_token=lease_token).update(
+                ai_lease_token=None, ai_lease_expires_at=None
+            )
+            raise
+
+    if tribute_ids:
+        logger.info("Fair-share dispatch: %s tributes, %s already in flight", len(tribute_ids), in_flight)
+    return f"Dispatched {len(tribute_ids)} tributes"
+
+
+@shared_task
+def drain_parked_moderation():
+    """
+    Периодическая задача (Celery beat): отправляет отложенные трибьюты
+    в очередь, когда Ollama снова доступна. За один запуск - не больше
+    drain_batch_size, в полуоткрытом состоянии - один трибьют-проба.
+    """
+    breaker = get_ollama_breaker()
+    breaker_state = breaker.state()['state'] if breaker is not None else 'closed'
+    if breaker_state == 'open':
+        return "Ollama circuit open, backlog stays parked"
+
+    breaker_settings = settings.AI_MODERATION_SETTINGS.get('circuit_breaker', {})
+    limit = 1 if breaker_state == 'half_open' else breaker_settings.get('drain_batch_size', 10)
+
+    lease_token, tribute_ids = Tribute.claim_ai_batch(
+        limit,
+        queryset=Tribute.objects.filter(ai_lease_token=AI_LEASE_PARKED)
+    )
+    for tribute_id in tribute_ids:
+        moderate_tribute_with_ai.delay(tribute_id, lease_token=lease_token)
+
+    if tribute_ids:
+        logger.info("Drained %s parked tributes (circuit %s)", len(tribute_ids), breaker_state)
+    return f"Drained {len(tribute_ids)} parked tributes"
+
+
+@shared_task
+def record_moderation_backlog():
+    """
+    Периодическая задача (Celery beat): обновляет gauge очереди ИИ-модерации.
+    """
+    pending = Tribute.objects.filter(status='pending', ai_verdict='pending_ai', ai_moderated_at__isnull=True)
+    waiting = pending.count()
+    parked = pending.filter(ai_lease_token=AI_LEASE_PARKED).count()
+
+    metrics.set_backlog('pending_ai', waiting)
+    metrics.set_backlog('parked', parked)
+    return f"Backlog: {waiting} pending, {parked} parked"
+
+
+@shared_task
+def warm_up_ollama():
+    """
+    Прогрев Ollama: при старте воркера (сигнал worker_ready) и периодически
+    из Celery beat. Запрос с тем же system-промптом загружает модель, продлевает
+    keep_alive и заново вычисляет статический префикс, так что следующий трибьют
+    не платит ни за загрузку модели, ни за инструкции. При маршрутизации
+    прогреваются все модели и варианты промпта из маршрутов.
+    """
+    breaker = get_ollama_breaker()
+    if breaker is not None and not breaker.is_closed():
+        return "Ollama circuit not closed, warmup skipped"
+
+    targets = []
+    for route in configured_routes():
+        if (route.model, route.prompt_variant) not in targets:
+            targets.append((route.model, route.prompt_variant))
+
+    results = {}
+    for model, prompt_variant in targets:
+        payload = {
+            "model": model,
+            "system": SYSTEM_PROMPTS[prompt_variant],
+            "prompt": "Analysiere diesen Nachruf.",
+            "stream": False,
+            "keep_alive": ollama_keep_alive(),
+            "options": {"temperature": 0.1, "top_p": 0.9, "num_predict": 1},
+        }
+
+        started = time.monotonic()
+        try:
+            result = get_ollama_client().generate(payload)
+        except requests.exceptions.RequestException as e:
+            logger.warning("Ollama warmup of %s failed: %s", model, e)
+            results[f'{model}/{prompt_variant}'] = f"failed: {e}"
+            continue
+
+        timings = response_timings(result)
+        metrics.record_llm_timings(timings)
+        logger.info(
+            "Ollama warmup of %s (%s prompt): %sms, load=%sms, prompt_eval=%sms/%s tokens",
+            model, prompt_variant, round((time.monotonic() - started) * 1000), timings['load_ms'],
+            timings['prompt_eval_ms'], timings['prompt_eval_count']
+        )
+        results[f'{model}/{prompt_variant}'] = timings
+    return results
+
+
 def handle_ollama_error(error, tribute, tribute_id, retry_count):
     """
     Обрабатывает ошибки подключения к Ollama.
     """
     # Fallback на флаг, если подключение не удалось
     if settings.DEBUG:
-        logger.info(f"DEBUG: Using fallback for tribute {tribute_id}")
+        logger.info("DEBUG: Using fallback for tribute %s", tribute_id)
         
         # Упрощённая логика fallback с учётом имён
         text_lower = tribute.text.lower()
@@ -771,21 +1180,50 @@ def handle_ollama_error(error, tribute, tribute_id, retry_count):
             }
         
         action = tribute.apply_ai_verdict(ai_result)
+        metrics.record_outcome('fallback')
         return f"DEBUG fallback used for {tribute_id}: {action}"
     
-    # Повторная попытка
+    # Ollama недоступна (предохранитель открыт) - не копим повторные попытки,
+    # трибьют ждёт восстановления и будет отправлен drain_parked_moderation
+    breaker = get_ollama_breaker()
+    if isinstance(error, OllamaUnavailable) or (breaker is not None and not breaker.is_closed()):
+        tribute.park_ai_moderation(tribute.ai_lease_token)
+        metrics.record_outcome('parked')
+        logger.warning("Ollama unavailable, tribute %s parked", tribute_id)
+        return f"Ollama unavailable, tribute {tribute_id} parked"
+
+    # Повторная попытка: аренда продлевается на время ожидания.
+    # OllamaBusy (все серверы заняты весь таймаут) - тоже сюда: серверы исправны,
+    # откладывать до восстановления нечего, нужна только пауза
+    if isinstance(error, OllamaBusy):
+        logger.warning("Ollama endpoints saturated, tribute %s will be retried", tribute_id)
     if retry_count < 3:
+        countdown = 30 * (retry_count + 1)
+        lease_token = tribute.ai_lease_token
+        if lease_token:
+            tribute.renew_ai_lease(
+                lease_token,
+                seconds=countdown + settings.AI_MODERATION_SETTINGS.get('lease_seconds', 300)
+            )
         moderate_tribute_with_ai.apply_async(
             args=[tribute_id, retry_count + 1],
-            countdown=30 * (retry_count + 1)
+            kwargs={'lease_token': lease_token},
+            countdown=countdown
         )
+        metrics.record_outcome('retry_scheduled')
         return f"Retry scheduled for {tribute_id}"
     
     # Если все попытки исчерпаны
-    logger.error(f"Failed after retries for tribute {tribute_id}: {error}")
+    logger.error("Failed after retries for tribute %s: %s", tribute_id, error)
+    mark_ai_error(tribute, error)
     
+    return f"Failed after retries for {tribute_id}"
+
+
+def mark_ai_error(tribute, error):
+    """Помечает трибьют как error_ai, когда попытки обращения к Ollama исчерпаны."""
     tribute.ai_verdict = 'error_ai'
     tribute.ai_moderation_result = {"error": str(error)}
+    tribute.clear_ai_lease()
     tribute.save()
-    
-    return f"Failed after retries for {tribute_id}"
\ No newline at end of file
+    metrics.record_outcome('error_ai')
\ No newline at end of file
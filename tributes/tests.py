@@ -0,0 +1,1056 @@
+import asyncio
+import json
+import logging
+import random
+import os
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from io import StringIO
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.core.cache.backends.locmem import LocMemCache
+from prometheus_client import REGISTRY
+from rest_framework.test import APIClient
+from everest import log_queue
+from .async_runner import AsyncModerationRunner
+from .breaker import CircuitBreaker, STATE_CLOSED, STATE_OPEN, check_state_cache, state_cache
+from .json_scan import JsonObjectDetector, extract_json_object, scan_json_object
+from .models import Tribute
+from .preclassifier import CharNgramNaiveBayes, preclassify
+from .response_corpus import PHI3_RESPONSES, mutate_response
+from .routing import ModerationRoute, detect_language, select_route
+from .ollama import OllamaBusy, OllamaClient, OllamaEndpointPool, OllamaUnavailable
+from .scheduler import FairShareScheduler, get_fair_share_scheduler, save_fair_share_scheduler
+from .verdict_cache import VerdictCache, verdict_cache_key
+from .tasks import SYSTEM_PROMPTS, analyze_name_mentions, build_ollama_payload, run_local_checks, moderate_tribute_with_ai, call_ollama, call_ollama_blocking, call_ollama_streaming, handle_ollama_error, is_complete_verdict, parse_ai_response, process_ai_response
+from memorials.models import Memorial
+from partners.models import Partner, PartnerUser
+
+
+def make_memorial(number=1, partner=None):
+    if partner is None:
+        partner = Partner.objects.create(
+            name=f'Partner {number}', legal_name=f'Partner {number}', billing_email=f'partner-{number}@example.invalid',
+        )
+    return Memorial.objects.create(
+        partner=partner, first_name='Anna', last_name='Muster', slug=f'anna-muster-{number}',
+        short_code=f'am{number}', family_contact_email=f'family-{number}@example.invalid',
+    )
+
+
+def make_tributes(memorial, count, text='In liebevoller Erinnerung an Anna Muster'):
+    # bulk_create без post_save: ИИ-модерация не ставится в очередь
+    return Tribute.objects.bulk_create([
+        Tribute(memorial=memorial, author_name=f'Author {i}', text=text) for i in range(count)
+    ])
+
+
+class ExtractJsonObjectTests(SimpleTestCase):
+    """Разбор ответов phi3: обёртки, висячие запятые, обрезанный ответ."""
+
+    def test_clean_object(self):
+        text = '{"verdict": "approved_ai", "confidence": 0.92, "flags": []}'
+        self.assertEqual(scan_json_object(text, required_key='verdict'),
+                         ({'verdict': 'approved_ai', 'confidence': 0.92, 'flags': []}, False))
+
+    def test_fenced_object(self):
+        text = ('```json\n{"verdict": "approved_ai", "confidence": 0.88, "flags": ["correct_first_name_only"]}\n```'
+                '\n\nExplanation: the text is respectful {see above}.')
+        self.assertEqual(extract_json_object(text, required_key='verdict'),
+                         {'verdict': 'approved_ai', 'confidence': 0.88, 'flags': ['correct_first_name_only']})
+
+    def test_prose_wrapped_object_after_example(self):
+        text = ('Let me analyze this tribute. Here is the format {"example": true}. My answer:\n'
+                '{"verdict": "rejected_ai", "confidence": 0.2, "flags": ["spam"]} I hope this helps.')
+        self.assertEqual(extract_json_object(text, required_key='verdict'),
+                         {'verdict': 'rejected_ai', 'confidence': 0.2, 'flags': ['spam']})
+
+    def test_trailing_commas(self):
+        text = '{"verdict": "rejected_ai", "confidence": 0.15, "flags": ["insult", "offensive",],}'
+        self.assertEqual(scan_json_object(text, required_key='verdict'),
+                         ({'verdict': 'rejected_ai', 'confidence': 0.15, 'flags': ['insult', 'offensive']}, False))
+
+    def test_typographic_quotes(self):
+        text = '{“verdict”: “flag_ai”, “confidence”: 0.5, “reasoning”: “Zitat: "Ruhe in Frieden"”}'
+        self.assertEqual(extract_json_object(text, required_key='verdict'),
+                         {'verdict': 'flag_ai', 'confidence': 0.5, 'reasoning': 'Zitat: "Ruhe in Frieden"'})
+
+    def test_braces_inside_strings(self):
+        text = '{"verdict": "approved_ai", "confidence": 0.9, "reasoning": "Template {name} }"}'
+        self.assertEqual(extract_json_object(text, required_key='verdict')['reasoning'], 'Template {name} }')
+
+    def test_truncated_string_is_closed(self):
+        text = '{"verdict": "approved_ai", "confidence": 0.85, "reasoning": "Sehr persönliche Erinnerung an'
+        value, repaired = scan_json_object(text, required_key='verdict', accept_repaired=is_complete_verdict)
+        self.assertTrue(repaired)
+        self.assertEqual(value['verdict'], 'approved_ai')
+        self.assertEqual(value['confidence'], 0.85)
+
+    def test_truncated_list_falls_back_to_last_comma(self):
+        text = '{"verdict": "rejected_ai", "confidence": 0.3, "flags": ["wrong_first_name", "name_mis'
+        value, repaired = scan_json_object(text, required_key='verdict', accept_repaired=is_complete_verdict)
+        self.assertTrue(repaired)
+        self.assertEqual(value['verdict'], 'rejected_ai')
+
+    def test_truncated_verdict_value_is_rejected(self):
+        text = '{"verdict": "approved'
+        self.assertEqual(scan_json_object(text, required_key='verdict', accept_repaired=is_complete_verdict),
+                         (None, False))
+
+    def test_truncated_before_confidence_is_rejected(self):
+        text = '{"verdict": "flag_ai", "reasoning": "trunc'
+        self.assertEqual(scan_json_object(text, required_key='verdict', accept_repaired=is_complete_verdict),
+                         (None, False))
+
+    def test_no_json(self):
+        self.assertEqual(scan_json_object('I cannot evaluate this text.', required_key='verdict'), (None, False))
+
+
+class ResponseCorpusTests(SimpleTestCase):
+    """Корпус ответов phi3 (tributes/response_corpus.py): вердикт и устойчивость к порче."""
+
+    def test_corpus_verdicts(self):
+        for text, expected in PHI3_RESPONSES:
+            with self.subTest(text=text[:60]):
+                value = scan_json_object(text, required_key='verdict', accept_repaired=is_complete_verdict)[0]
+                self.assertEqual(value and value['verdict'], expected)
+                self.assertEqual(parse_ai_response(text, 1)['verdict'], expected or 'flag_ai')
+
+    def test_corrupted_responses_never_raise(self):
+        rng = random.Random(0)
+        for _ in range(2000):
+            text = mutate_response(rng.choice(PHI3_RESPONSES)[0], rng)
+            self.assertIn('verdict', parse_ai_response(text, 1), text)
+
+    def test_bench_command(self):
+        out = StringIO()
+        call_command('bench_ai_parser', rounds=1, fuzz=100, stdout=out)
+        self.assertIn(f"scanner {len(PHI3_RESPONSES)}/{len(PHI3_RESPONSES)}", out.getvalue())
+        self.assertIn("0 exceptions", out.getvalue())
+
+
+PROSE_EXAMPLE_REPLY = (
+    'Let me analyze this tribute. Here is the format {"example": true}. My answer:\n'
+    '{"verdict": "rejected_ai", "confidence": 0.2, "flags": ["spam"]} I hope this helps.'
+)
+
+
+def stream_chunks(text, size=7):
+    """Чанки потока Ollama: текст ответа кусками по size символов."""
+    for start in range(0, len(text), size):
+        yield {'response': text[start:start + size], 'done': False}
+    yield {'response': '', 'done': True, 'eval_count': len(text) // size + 1}
+
+
+def fake_ollama_client(text):
+    client = mock.Mock()
+    client.generate.return_value = {'response': text, 'eval_count': 10}
+    client.generate_stream.side_effect = lambda payload: stream_chunks(text)
+    return client
+
+
+class JsonObjectDetectorTests(SimpleTestCase):
+
+    def test_stops_at_first_object(self):
+        detector = JsonObjectDetector()
+        self.assertFalse(detector.feed('Answer: {"verdict": "approved_ai", '))
+        self.assertTrue(detector.feed('"confidence": 0.9} trailing'))
+        self.assertEqual(detector.text, '{"verdict": "approved_ai", "confidence": 0.9}')
+
+    def test_skips_objects_without_required_key(self):
+        detector = JsonObjectDetector(required_key='verdict')
+        self.assertFalse(detector.feed('Format {"example": true}. My answer: '))
+        self.assertFalse(detector.complete)
+        self.assertTrue(detector.feed('{"verdict": "rejected_ai", "confidence": 0.2}'))
+        self.assertEqual(detector.text, '{"verdict": "rejected_ai", "confidence": 0.2}')
+
+
+class StreamingMatchesBlockingTests(SimpleTestCase):
+
+    def test_prose_example_before_answer(self):
+        verdicts = {}
+        for name, call in (('blocking', call_ollama_blocking), ('stream', call_ollama_streaming)):
+            with mock.patch('tributes.tasks.get_ollama_client', return_value=fake_ollama_client(PROSE_EXAMPLE_REPLY)):
+                text, llm_stats = call({'prompt': 'x'})
+            verdicts[name] = parse_ai_response(text, 1)['verdict']
+        self.assertEqual(verdicts, {'blocking': 'rejected_ai', 'stream': 'rejected_ai'})
+        self.assertTrue(llm_stats['early_stop'])
+
+
+class ParseAiResponseTests(SimpleTestCase):
+
+    def test_repaired_response_is_flagged(self):
+        result = parse_ai_response('{"verdict": "approved_ai", "confidence": 0.9, "reasoning": "Sehr', 1)
+        self.assertEqual(result['verdict'], 'approved_ai')
+        self.assertIn('truncated_response', result['flags'])
+
+    def test_invalid_truncated_verdict_falls_back_to_flag(self):
+        result = parse_ai_response('{"verdict": "approved', 1)
+        self.assertEqual(result['verdict'], 'flag_ai')
+        self.assertIn('invalid_format', result['flags'])
+
+    def test_repaired_response_is_not_cached(self):
+        cache = mock.Mock()
+        with mock.patch('tributes.tasks.get_verdict_cache', return_value=cache):
+            process_ai_response(SimpleNamespace(id=1), '{"verdict": "approved_ai", "confidence": 0.9, "reas', {}, 'key')
+            cache.set.assert_not_called()
+            process_ai_response(SimpleNamespace(id=1), '{"verdict": "approved_ai", "confidence": 0.9}', {}, 'key')
+            cache.set.assert_called_once()
+
+
+class VerdictCacheTests(SimpleTestCase):
+    """Ключ кэша вердиктов, TTL и счётчики everest_ai_verdict_cache_events."""
+
+    def key(self, text, name_context='full_name', model='phi3', version='v1'):
+        return verdict_cache_key(text, name_context, model, version)
+
+    def events(self, event):
+        return REGISTRY.get_sample_value('everest_ai_verdict_cache_events_total', {'event': event}) or 0
+
+    def test_equivalent_texts_share_key(self):
+        key = self.key('Mein Beileid')
+        self.assertEqual(self.key('  MEIN   beileid! 🙏'), key)
+        self.assertEqual(self.key('Ｍｅｉｎ Ｂｅｉｌｅｉｄ'), key)  # полноширинные символы - NFKC
+        self.assertEqual(self.key('Ruhe in Frieden, Straße'), self.key('RUHE IN FRIEDEN, STRASSE'))  # casefold
+        self.assertNotEqual(self.key('Mein Beileid, Anna'), key)
+
+    def test_key_changes_with_model_prompt_and_name_context(self):
+        key = self.key('Mein Beileid')
+        self.assertNotEqual(self.key('Mein Beileid', model='phi3:mini'), key)
+        self.assertNotEqual(self.key('Mein Beileid', version='v2'), key)
+        self.assertNotEqual(self.key('Mein Beileid', name_context='wrong_name'), key)
+
+    def test_entries_expire_after_ttl(self):
+        cache = VerdictCache(ttl_seconds=60, use_django_cache=False)
+        with mock.patch('tributes.verdict_cache.time') as fake_time:
+            fake_time.monotonic.return_value = 1000.0
+            cache.set('k', {'verdict': 'approved_ai'})
+            fake_time.monotonic.return_value = 1059.0
+            self.assertEqual(cache.get('k'), {'verdict': 'approved_ai'})
+            expired = self.events('expired')
+            fake_time.monotonic.return_value = 1061.0
+            self.assertIsNone(cache.get('k'))
+        self.assertEqual(self.events('expired'), expired + 1)
+
+    def test_lookups_are_counted(self):
+        shared = LocMemCache(self.id(), {})
+        before = {event: self.events(event) for event in ('hit', 'shared_hit', 'miss', 'store', 'eviction')}
+        with mock.patch('tributes.verdict_cache.cache', shared):
+            cache = VerdictCache(max_entries=1)
+            self.assertIsNone(cache.get('a'))
+            cache.set('a', {'verdict': 'approved_ai'})
+            cache.set('b', {'verdict': 'rejected_ai'})  # вытесняет 'a' из памяти процесса
+            self.assertEqual(cache.get('b'), {'verdict': 'rejected_ai'})
+            self.assertEqual(cache.get('a'), {'verdict': 'approved_ai'})  # из общего кэша
+        after = {event: self.events(event) - count for event, count in before.items()}
+        # Возврат 'a' из общего кэша снова вытесняет 'b'
+        self.assertEqual(after, {'hit': 1, 'shared_hit': 1, 'miss': 1, 'store': 2, 'eviction': 2})
+
+    def test_get_returns_copy(self):
+        cache = VerdictCache(use_django_cache=False)
+        cache.set('k', {'verdict': 'approved_ai', 'flags': []})
+        cache.get('k')['flags'].append('cache_hit')
+        self.assertEqual(cache.get('k'), {'verdict': 'approved_ai', 'flags': []})
+
+
+PRECLASSIFIER_CORPUS = [
+    ('Mein herzliches Beileid', 'approved'),
+    ('In stiller Trauer, herzliches Beileid an die Familie', 'approved'),
+    ('Ruhe in Frieden, wir werden dich nie vergessen', 'approved'),
+    ('In liebevoller Erinnerung und stiller Trauer', 'approved'),
+    ('Billige Kredite sofort, klicken Sie hier www.kredit.example', 'rejected'),
+    ('Jetzt kaufen, nur heute billig, klicken Sie hier', 'rejected'),
+]
+
+
+class PreclassifierTests(SimpleTestCase):
+    """Локальный классификатор: обучение, файл модели и пороги preclassify."""
+
+    def setUp(self):
+        self.model = CharNgramNaiveBayes().fit(*zip(*PRECLASSIFIER_CORPUS), min_count=1)
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.model_path = os.path.join(self.tmp_dir, 'preclassifier.json')
+        self.model.save(self.model_path)
+
+    def preclassify(self, text, **overrides):
+        options = dict({'enabled': True, 'model_path': self.model_path, 'min_confidence': 0.9,
+                        'decide_labels': ['approved', 'rejected'], 'max_text_length': 400}, **overrides)
+        with mock.patch.dict(settings.AI_MODERATION_SETTINGS, preclassifier=options):
+            return preclassify(text)
+
+    def test_fit_and_predict(self):
+        self.assertEqual(sorted(self.model.labels), ['approved', 'rejected'])
+        label, probability = self.model.predict('Herzliches Beileid und stille Trauer')
+        self.assertEqual(label, 'approved')
+        self.assertGreater(probability, 0.5)
+        self.assertEqual(self.model.predict('Billig kaufen, klicken Sie hier')[0], 'rejected')
+        self.assertAlmostEqual(sum(self.model.predict_proba('Beileid').values()), 1.0)
+
+    def test_save_load_round_trip(self):
+        loaded = CharNgramNaiveBayes.load(self.model_path)
+        self.assertEqual(loaded.doc_counts, self.model.doc_counts)
+        for text, _label in PRECLASSIFIER_CORPUS:
+            for label, probability in self.model.predict_proba(text).items():
+                self.assertAlmostEqual(loaded.predict_proba(text)[label], probability)
+
+    def test_unknown_artifact_version_is_rejected(self):
+        with self.assertRaises(ValueError):
+            CharNgramNaiveBayes.from_dict(dict(self.model.to_dict(), version=0))
+
+    def test_confident_prediction_is_a_verdict(self):
+        verdict, confidence = self.preclassify('Mein herzliches Beileid')
+        self.assertEqual(verdict, 'approved_ai')
+        self.assertGreaterEqual(confidence, 0.9)
+
+    def test_below_min_confidence_goes_to_ai(self):
+        _label, probability = self.model.predict('Mein herzliches Beileid')
+        self.assertIsNone(self.preclassify('Mein herzliches Beileid', min_confidence=probability + 0.001))
+
+    def test_long_text_goes_to_ai(self):
+        self.assertIsNone(self.preclassify('Mein herzliches Beileid', max_text_length=10))
+
+    def test_label_outside_decide_labels_goes_to_ai(self):
+        text = 'Jetzt billig kaufen, klicken Sie hier'
+        self.assertEqual(self.preclassify(text)[0], 'rejected_ai')
+        self.assertIsNone(self.preclassify(text, decide_labels=['approved']))
+
+    def test_disabled_or_missing_model(self):
+        self.assertIsNone(self.preclassify('Mein herzliches Beileid', enabled=False))
+        self.assertIsNone(self.preclassify('Mein herzliches Beileid',
+                                           model_path=os.path.join(self.tmp_dir, 'missing.json')))
+
+
+class PreclassifierVerdictTests(TestCase):
+    """Обоснование локального решения соответствует вердикту."""
+
+    def test_reasoning_follows_verdict(self):
+        memorial = make_memorial()
+        for verdict in ('approved_ai', 'rejected_ai'):
+            tribute, = make_tributes(memorial, 1, text='Mein herzliches Beileid')
+            with mock.patch('tributes.tasks.preclassify', return_value=(verdict, 0.99)):
+                message, _name_analysis = run_local_checks(tribute)
+            self.assertIn('preclassifier', message)
+            result = Tribute.objects.get(pk=tribute.pk).ai_moderation_result
+            self.assertEqual(result['decided_by'], 'preclassifier')
+            if verdict == 'approved_ai':
+                self.assertIn('typische Kondolenz', result['reasoning'])
+            else:
+                self.assertNotIn('Kondolenz', result['reasoning'])
+
+
+def remoderated(ids, lease_token=None):
+    """Подмена moderate_tributes_batch: модель снова отправила трибьюты на ручную проверку."""
+    Tribute.objects.filter(id__in=ids, ai_lease_token=lease_token).update(
+        ai_verdict='flag_ai', ai_moderated_at=timezone.now(), ai_lease_token=None, ai_lease_expires_at=None
+    )
+    return SimpleNamespace(id='task')
+
+
+class RemoderateCommandTests(TestCase):
+    """manage.py remoderate: фильтры, --dry-run и контрольная точка."""
+
+    def setUp(self):
+        self.memorial = make_memorial()
+        self.other_memorial = make_memorial(2)
+        self.flagged = make_tributes(self.memorial, 5)
+        self.errors = make_tributes(self.memorial, 1)
+        self.other = make_tributes(self.other_memorial, 1)
+        self.approved = make_tributes(self.memorial, 1)
+        for tributes, verdict in ((self.flagged + self.other, 'flag_ai'), (self.errors, 'error_ai')):
+            Tribute.objects.filter(id__in=[t.id for t in tributes]).update(ai_verdict=verdict)
+        Tribute.objects.filter(id=self.approved[0].id).update(status='approved', ai_verdict='approved_ai')
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.checkpoint = os.path.join(tmp_dir, 'remoderate.json')
+
+    def remoderate(self, *args, delay=remoderated):
+        out = StringIO()
+        with mock.patch('tributes.management.commands.remoderate.moderate_tributes_batch') as task:
+            task.delay.side_effect = delay
+            call_command('remoderate', *args, stdout=out)
+        return out.getvalue(), [call.args[0] for call in task.delay.call_args_list]
+
+    def read_checkpoint(self):
+        with open(self.checkpoint, encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_filters(self):
+        cases = [
+            ((), 7),
+            (('--partner', str(self.other_memorial.partner_id)), 1),
+            (('--memorial', self.memorial.short_code), 6),
+            (('--memorial', str(self.other_memorial.id)), 1),
+            (('--verdict', 'error_ai'), 1),
+            (('--since', f'{timezone.now():%Y-%m-%d}'), 7),
+            (('--until', f'{timezone.now() - timedelta(days=1):%Y-%m-%d}'), 0),
+        ]
+        for args, count in cases:
+            with self.subTest(args=args):
+                out, _batches = self.remoderate('--dry-run', *args)
+                self.assertIn(f"{count} tributes to re-moderate", out)
+
+    def test_invalid_filters(self):
+        with self.assertRaises(CommandError):
+            self.remoderate('--memorial', 'missing')
+        with self.assertRaises(CommandError):
+            self.remoderate('--since', '2024-13-01')
+        with self.assertRaises(CommandError):
+            self.remoderate('--resume')
+
+    def test_dry_run_changes_nothing(self):
+        out, batches = self.remoderate('--dry-run')
+        self.assertEqual(batches, [])
+        self.assertIn("'flag_ai': 6", out)
+        self.assertFalse(Tribute.objects.filter(ai_lease_token__isnull=False).exists())
+
+    def test_batches_by_chunk_size(self):
+        _out, batches = self.remoderate('--chunk-size', '3', '--partner', str(self.memorial.partner_id))
+        ids = sorted(t.id for t in self.flagged + self.errors)
+        self.assertEqual(batches, [ids[:3], ids[3:]])
+
+    def test_checkpoint_stops_at_last_sent_batch_and_resume_continues(self):
+        ids = sorted(t.id for t in self.flagged + self.errors + self.other)
+        sent = []
+
+        def broker_fails_on_second_batch(batch, lease_token=None):
+            if sent:
+                raise ConnectionError('broker down')
+            sent.append(batch)
+            return remoderated(batch, lease_token)
+
+        with self.assertRaises(ConnectionError):
+            self.remoderate('--chunk-size', '3', '--checkpoint', self.checkpoint, delay=broker_fails_on_second_batch)
+        self.assertEqual(self.read_checkpoint()['last_id'], ids[2])
+        self.assertEqual(self.read_checkpoint()['processed'], 3)
+        # Аренда неотправленного пакета снята, трибьюты ждут обычной очереди ИИ
+        self.assertFalse(Tribute.objects.filter(id__in=ids[3:6], ai_lease_token__isnull=False).exists())
+
+        Tribute.objects.filter(id__in=ids[3:6]).update(ai_verdict='flag_ai')
+        _out, batches = self.remoderate('--chunk-size', '3', '--checkpoint', self.checkpoint, '--resume')
+        self.assertEqual(batches, [ids[3:6], ids[6:]])
+        self.assertEqual(self.read_checkpoint()['last_id'], ids[-1])
+        self.assertEqual(self.read_checkpoint()['processed'], 7)
+
+    def test_resume_with_other_filters_is_refused(self):
+        self.remoderate('--limit', '2', '--checkpoint', self.checkpoint)
+        with self.assertRaises(CommandError):
+            self.remoderate('--verdict', 'error_ai', '--checkpoint', self.checkpoint, '--resume')
+
+
+class RemoderateLocalModeTests(TransactionTestCase):
+    """Локальный режим: контрольная точка - только непрерывный префикс завершённых пакетов."""
+
+    def test_checkpoint_skips_batches_finished_out_of_order(self):
+        memorial = make_memorial()
+        tributes = make_tributes(memorial, 4)
+        ids = [t.id for t in tributes]
+        Tribute.objects.filter(id__in=ids).update(ai_verdict='flag_ai')
+        second_done = threading.Event()
+
+        def moderate(batch, lease_token=None):
+            if batch == ids[:2]:
+                # Первый пакет падает уже после того, как второй завершился
+                second_done.wait(5)
+                raise RuntimeError('ollama down')
+            remoderated(batch, lease_token)
+            second_done.set()
+
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        checkpoint = os.path.join(tmp_dir, 'remoderate.json')
+        with mock.patch('tributes.management.commands.remoderate.moderate_tributes_batch', side_effect=moderate):
+            with self.assertRaises(RuntimeError):
+                call_command('remoderate', '--mode', 'local', '--workers', '2', '--chunk-size', '2',
+                             '--checkpoint', checkpoint, stdout=StringIO())
+        self.assertTrue(second_done.is_set())
+        self.assertFalse(os.path.exists(checkpoint))
+
+
+TEST_ROUTING = {
+    'enabled': True,
+    'routes': [
+        {'name': 'tiny', 'max_chars': 20, 'model': 'tiny-model', 'prompt_variant': 'compact', 'num_predict': 80},
+        {'name': 'short_de', 'max_chars': 200, 'languages': ['de'], 'name_contexts': ['correct_name', 'no_name'],
+         'model': 'small-model', 'prompt_variant': 'compact', 'num_predict': 160, 'max_text_chars': 60},
+        {'name': 'unknown_language', 'min_chars': 50, 'languages': ['unknown'], 'model': 'multilingual-model'},
+    ],
+    'default': {'name': 'default', 'model': 'large-model', 'num_predict': 600, 'max_text_chars': 2000},
+}
+
+GERMAN_TRIBUTE = 'Liebe Anna Muster, ruhe in frieden, wir werden dich immer in unseren herzen tragen und nie vergessen'
+
+
+class RoutingTests(SimpleTestCase):
+    """Выбор маршрута: порядок маршрутов, длина, язык и контекст имён."""
+
+    def route(self, text, name_context='no_name', **routing):
+        with mock.patch.dict(settings.AI_MODERATION_SETTINGS, routing=dict(TEST_ROUTING, **routing)):
+            return select_route(text, {'context': name_context})
+
+    def test_detect_language(self):
+        self.assertEqual(detect_language('Herzliches Beileid und Ruhe in Frieden'), 'de')
+        self.assertEqual(detect_language('Sincères condoléances à toute la famille'), 'fr')
+        self.assertEqual(detect_language('Le più sentite condoglianze'), 'it')
+        self.assertEqual(detect_language('Deepest condolences to the family'), 'en')
+        self.assertIsNone(detect_language('Xyzzy plugh'))
+        self.assertIsNone(detect_language('la'))  # fr и it поровну
+
+    def test_detect_language_only_configured_languages(self):
+        with mock.patch.dict(settings.AI_MODERATION_SETTINGS, languages=['de']):
+            self.assertIsNone(detect_language('Deepest condolences to the family'))
+
+    def test_first_matching_route_wins(self):
+        # 'Mein Beileid' подходит и под short_de, но tiny стоит первым
+        self.assertEqual(self.route('Mein Beileid').name, 'tiny')
+        self.assertEqual(self.route(GERMAN_TRIBUTE).name, 'short_de')
+
+    def test_max_chars(self):
+        self.assertEqual(self.route(GERMAN_TRIBUTE * 3).name, 'default')
+
+    def test_name_contexts(self):
+        self.assertEqual(self.route(GERMAN_TRIBUTE, name_context='wrong_name').name, 'default')
+
+    def test_unknown_language_and_min_chars(self):
+        text = 'Xyzzy plugh qwerty asdfgh zxcvbn, lorem ipsum dolor sit amet'
+        self.assertEqual(self.route(text).name, 'unknown_language')
+        self.assertEqual(self.route(text[:30]).name, 'default')
+
+    def test_disabled_routing_uses_default(self):
+        route = self.route('Mein Beileid', enabled=False)
+        self.assertEqual((route.name, route.model, route.num_predict), ('default', 'large-model', 600))
+
+    def test_unknown_prompt_variant(self):
+        with self.assertRaises(ValueError):
+            ModerationRoute('broken', prompt_variant='verbose')
+
+
+class RoutePayloadTests(TestCase):
+    """Тело запроса к Ollama берёт модель и бюджеты из выбранного маршрута."""
+
+    def test_payload_follows_route(self):
+        tribute, = make_tributes(make_memorial(), 1, text=GERMAN_TRIBUTE)
+        name_analysis = analyze_name_mentions(tribute.text, tribute.memorial)
+        self.assertEqual(name_analysis['context'], 'correct_name')
+        with mock.patch.dict(settings.AI_MODERATION_SETTINGS, routing=TEST_ROUTING):
+            payload = build_ollama_payload(tribute, name_analysis)
+        self.assertEqual(payload['model'], 'small-model')
+        self.assertEqual(payload['system'], SYSTEM_PROMPTS['compact'])
+        self.assertEqual(payload['options']['num_predict'], 160)
+        self.assertIn(f'"{GERMAN_TRIBUTE[:60]}"', payload['prompt'])
+
+
+class CollectingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class QueueLoggingTests(SimpleTestCase):
+    """everest.log_queue: обработчики логгеров переносятся в фоновый поток."""
+
+    def setUp(self):
+        # Логирование процесса уже переключено в TributesConfig.ready(): тесты ставят своё
+        for target, value in (('_installed', False), ('_listeners', []), ('_queue_handlers', [])):
+            patcher = mock.patch.object(log_queue, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for target in ('atexit.register', 'os.register_at_fork'):
+            patcher = mock.patch(f'everest.log_queue.{target}')
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(log_queue.stop_queue_logging)
+
+        self.shared = CollectingHandler()
+        self.own = CollectingHandler()
+        self.loggers = {}
+        for name, handler in (('first', self.shared), ('second', self.shared), ('third', self.own), ('bare', None)):
+            logger = logging.getLogger(f'tests.log_queue.{name}')
+            logger.propagate = False
+            if handler is not None:
+                logger.addHandler(handler)
+            self.addCleanup(logger.handlers.clear)
+            self.loggers[name] = logger
+
+    def install(self, *names):
+        log_queue.install_queue_logging([f'tests.log_queue.{name}' for name in names])
+
+    def test_handlers_are_replaced(self):
+        self.install('first', 'second', 'third', 'bare')
+        handlers = {name: logger.handlers for name, logger in self.loggers.items()}
+        self.assertIsInstance(handlers['first'][0], log_queue.LocalQueueHandler)
+        self.assertEqual(len(handlers['first']), 1)
+        # Один слушатель на набор обработчиков: first и second пишут в одну очередь
+        self.assertIs(handlers['first'][0], handlers['second'][0])
+        self.assertIsNot(handlers['first'][0], handlers['third'][0])
+        self.assertEqual(handlers['bare'], [])
+        self.assertEqual(len(log_queue._listeners), 2)
+
+    def test_records_reach_original_handler_formatted(self):
+        self.install('first', 'third')
+        value = ['before']
+        self.loggers['first'].warning("value %s", value)
+        value[0] = 'after'  # запись уже в очереди: сообщение не меняется
+        self.loggers['third'].error("other %d", 3)
+        log_queue.stop_queue_logging()
+
+        record, = self.shared.records
+        self.assertEqual(record.getMessage(), "value ['before']")
+        self.assertIsNone(record.args)
+        self.assertEqual(record.levelno, logging.WARNING)
+        self.assertEqual([r.getMessage() for r in self.own.records], ['other 3'])
+
+    def test_second_call_does_nothing(self):
+        self.install('first')
+        self.install('third')
+        self.assertEqual(self.loggers['third'].handlers, [self.own])
+        self.assertEqual(len(log_queue._listeners), 1)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def make_breaker(self, **kwargs):
+        return CircuitBreaker('test', cache=LocMemCache(self.id(), {}), **kwargs)
+
+    def test_opens_after_threshold_and_closes_after_probe(self):
+        breaker = self.make_breaker(failure_threshold=3, reset_timeout=60)
+        for _ in range(2):
+            breaker.record_failure()
+        self.assertTrue(breaker.allow_request())
+        breaker.record_failure()
+        self.assertEqual(breaker.state()['state'], STATE_OPEN)
+        self.assertFalse(breaker.allow_request())
+
+        with mock.patch('tributes.breaker.time.time', return_value=breaker.state()['retry_at'] + 1):
+            self.assertTrue(breaker.allow_request())    # проба
+            self.assertFalse(breaker.allow_request())   # остальные ждут пробу
+            breaker.record_success()
+        self.assertEqual(breaker.state()['state'], STATE_CLOSED)
+
+    def test_dummy_cache_falls_back_to_process_memory(self):
+        # Настройки DEBUG: DummyCache - состояние всё равно должно сохраняться
+        self.assertIsInstance(state_cache(), LocMemCache)
+        breaker = CircuitBreaker('dummy-fallback', failure_threshold=1)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow_request())
+        breaker.cache.clear()
+        self.assertEqual([warning.id for warning in check_state_cache()], ['tributes.W001'])
+
+
+class AsyncRunnerRetryTests(TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('tributes.async_runner.get_ollama_breaker', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.runner = AsyncModerationRunner(max_attempts=3, retry_backoff=30)
+        self.addCleanup(self.runner._db_pool.shutdown)
+        self.tribute = make_tributes(make_memorial(), 1)[0]
+        self.tribute.claim_ai_lease()
+
+    def test_retry_waits_for_backoff_before_reclaim(self):
+        self.assertEqual(self.runner._handle_ollama_error(self.tribute, OSError('timeout')), 'released')
+        self.assertEqual(self.runner._attempts, {self.tribute.id: 1})
+        self.tribute.refresh_from_db()
+        self.assertGreater(self.tribute.ai_lease_expires_at, timezone.now() + timedelta(seconds=25))
+        self.assertEqual(Tribute.claim_ai_batch(10)[1], [])
+
+    def test_attempts_are_forgotten_after_error_ai(self):
+        for _ in range(2):
+            self.runner._handle_ollama_error(self.tribute, OSError('timeout'))
+        self.assertEqual(self.runner._handle_ollama_error(self.tribute, OSError('timeout')), 'errors')
+        self.assertEqual(self.runner._attempts, {})
+        self.tribute.refresh_from_db()
+        self.assertEqual(self.tribute.ai_verdict, 'error_ai')
+
+    def test_saturation_is_retried_not_parked(self):
+        self.assertEqual(self.runner._handle_ollama_error(self.tribute, OllamaBusy('busy')), 'released')
+        self.assertEqual(self.runner._attempts, {self.tribute.id: 1})
+
+    def test_waiting_for_busy_endpoints_is_bounded(self):
+        import httpx
+
+        self.runner.timeout = httpx.Timeout(0.05)
+        for _ in range(self.runner.endpoints.endpoints[0].max_in_flight):
+            self.runner.endpoints.acquire()
+        call = mock.AsyncMock()
+        with self.assertRaises(OllamaBusy):
+            asyncio.run(self.runner._call_endpoints(call, {}))
+        call.assert_not_called()
+
+    def test_attempts_are_forgotten_when_parked(self):
+        self.runner._handle_ollama_error(self.tribute, OSError('timeout'))
+        self.assertEqual(self.runner._handle_ollama_error(self.tribute, OllamaUnavailable('down')), 'parked')
+        self.assertEqual(self.runner._attempts, {})
+
+
+class AiLeaseTests(TestCase):
+    """Аренда трибьютов: одна задача на трибьют, пакеты не пересекаются."""
+
+    def setUp(self):
+        self.memorial = make_memorial()
+        user = get_user_model().objects.create_user('partner', email='staff@example.invalid', password='x')
+        PartnerUser.objects.create(partner=self.memorial.partner, email=user.email, password_hash='x', role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_second_claim_is_refused(self):
+        tribute, = make_tributes(self.memorial, 1)
+        self.assertIsNotNone(tribute.claim_ai_lease())
+        self.assertIsNone(Tribute.objects.get(pk=tribute.pk).claim_ai_lease())
+
+    def test_expired_lease_can_be_reclaimed(self):
+        tribute, = make_tributes(self.memorial, 1)
+        token = tribute.claim_ai_lease()
+        Tribute.objects.filter(pk=tribute.pk).update(ai_lease_expires_at=timezone.now() - timedelta(seconds=1))
+        new_token = Tribute.objects.get(pk=tribute.pk).claim_ai_lease()
+        self.assertIsNotNone(new_token)
+        self.assertNotEqual(new_token, token)
+        # Старый владелец больше не может продлить аренду
+        self.assertFalse(tribute.renew_ai_lease(token))
+
+    def test_batches_never_share_rows(self):
+        tributes = make_tributes(self.memorial, 5)
+        _token, first = Tribute.claim_ai_batch(3)
+        _token, second = Tribute.claim_ai_batch(3)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(sorted(first + second), sorted(t.id for t in tributes))
+        self.assertEqual(Tribute.claim_ai_batch(3)[1], [])
+
+    def test_second_post_is_already_queued(self):
+        tribute, = make_tributes(self.memorial, 1)
+        url = reverse('ai_moderate_tribute', args=[tribute.id])
+        with mock.patch('tributes.api.moderate_tribute_with_ai') as task:
+            task.delay.return_value = SimpleNamespace(id='task-1')
+            first = self.client.post(url)
+            second = self.client.post(url)
+        self.assertEqual(first.data['status'], 'moderation_started')
+        self.assertEqual(second.data['status'], 'already_queued')
+        task.delay.assert_called_once()
+
+    def test_batch_releases_leases_of_unsent_tasks(self):
+        tributes = make_tributes(self.memorial, 3)
+        with mock.patch('tributes.api.moderate_tribute_with_ai') as task:
+            task.delay.side_effect = [SimpleNamespace(id='task-1'), ConnectionError('broker down'),
+                                      SimpleNamespace(id='task-3')]
+            response = self.client.post(reverse('ai_moderate_batch'))
+        self.assertEqual(response.data['tasks_started'], 2)
+        unsent_id = task.delay.call_args_list[1].args[0]
+        leased = dict(Tribute.objects.filter(id__in=[t.id for t in tributes]).values_list('id', 'ai_lease_token'))
+        self.assertIsNone(leased.pop(unsent_id))
+        self.assertTrue(all(leased.values()))
+        # Неотправленный трибьют сразу доступен следующему пакету
+        self.assertEqual(Tribute.claim_ai_batch(10)[1], [unsent_id])
+
+
+class AiAuditScopeTests(TestCase):
+
+    def test_partner_is_filled_without_loading_memorial(self):
+        from audits.models import AuditLog
+
+        memorial = make_memorial()
+        tribute = Tribute.objects.get(id=make_tributes(memorial, 1)[0].id)
+        with self.captureOnCommitCallbacks(execute=True):
+            tribute.apply_ai_verdict({'verdict': 'flag_ai', 'confidence': 0.5, 'flags': []})
+        self.assertFalse(Tribute.memorial.is_cached(tribute))
+        entry = AuditLog.objects.get(actor_type='ai_moderator', target_id=tribute.id)
+        self.assertEqual((entry.partner_id, entry.memorial_id), (memorial.partner_id, memorial.id))
+
+
+class ApplyAiVerdictsQueryTests(TestCase):
+    """Пакетное применение вердиктов: число запросов не зависит от размера пакета."""
+
+    VERDICTS = [
+        {'verdict': 'approved_ai', 'confidence': 0.95, 'flags': []},                     # pending -> approved
+        {'verdict': 'flag_ai', 'confidence': 0.5, 'flags': ['possible_personal_data']},  # остаётся pending
+        {'verdict': 'rejected_ai', 'confidence': 0.9, 'flags': ['insult']},              # pending -> rejected
+        {'verdict': 'approved_ai', 'confidence': 0.4, 'flags': []},                      # низкая уверенность
+    ]
+
+    def setUp(self):
+        from partners.models import PartnerUser
+
+        self.memorials = [make_memorial(number) for number in range(1, 4)]
+        self.moderator = PartnerUser.objects.create(
+            partner=self.memorials[0].partner, email='moderator@example.invalid', password_hash='!', role='admin',
+        )
+
+    def results(self, count):
+        tributes = []
+        for number in range(count):
+            tributes += make_tributes(self.memorials[number % len(self.memorials)], 1)
+        # Часть трибьютов уже трогал модератор: запись о смене статуса не должна грузить его
+        Tribute.objects.filter(id__in=[t.id for t in tributes[::3]]).update(moderated_by_user=self.moderator)
+        tributes = list(Tribute.objects.filter(id__in=[t.id for t in tributes]).order_by('id'))
+        return [(tribute, self.VERDICTS[i % len(self.VERDICTS)]) for i, tribute in enumerate(tributes)]
+
+    def apply(self, results):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Tribute.apply_ai_verdicts(results)
+
+    def test_query_count_does_not_grow_with_batch(self):
+        from audits.models import AuditLog
+
+        small, large = self.results(8), self.results(16)
+        # Мемориалы пакета, SAVEPOINT, один UPDATE, RELEASE, один INSERT в AuditLog
+        with self.assertNumQueries(5):
+            self.apply(small)
+        with self.assertNumQueries(5):
+            actions = self.apply(large)
+
+        self.assertEqual(len(actions), 16)
+        statuses = Tribute.objects.filter(id__in=[t.id for t, _ in large]).values_list('status', flat=True)
+        self.assertEqual(sorted(set(statuses)), ['approved', 'pending', 'rejected'])
+        # Запись решения ИИ на каждый трибьют плюс запись о каждой смене статуса
+        changed = sum(1 for status in statuses if status != 'pending')
+        self.assertEqual(
+            AuditLog.objects.filter(target_type='tribute', target_id__in=[t.id for t, _ in large]).count(),
+            16 + changed,
+        )
+
+
+class FairShareSchedulerTests(SimpleTestCase):
+
+    def test_shares_follow_weights(self):
+        scheduler = FairShareScheduler(weights={1: 3, 2: 1})
+        self.assertEqual(Counter(scheduler.schedule({1: 100, 2: 100}, {}, 40)), {1: 30, 2: 10})
+
+    def test_fractional_weight_is_carried_between_runs(self):
+        state = None
+        served = Counter()
+        for _ in range(30):
+            scheduler = FairShareScheduler(weights={1: 1, 2: 0.5}).load_state(state)
+            served.update(scheduler.schedule({1: 100, 2: 100}, {}, 1))
+            state = scheduler.to_state()
+        self.assertEqual(served, {1: 20, 2: 10})
+
+        # Без состояния дробный дефицит теряется и партнёр 2 не получает ничего
+        served = Counter()
+        for _ in range(30):
+            served.update(FairShareScheduler(weights={1: 1, 2: 0.5}).schedule({1: 100, 2: 100}, {}, 1))
+        self.assertEqual(served, {1: 30})
+
+    def test_max_in_flight_caps_partner(self):
+        scheduler = FairShareScheduler(max_in_flight={1: 2})
+        sequence = scheduler.schedule({1: 10, 2: 10}, {1: 1}, 10)
+        self.assertEqual(Counter(sequence), {1: 1, 2: 9})
+        self.assertEqual(scheduler.schedule({1: 10}, {1: 2}, 10), [])
+
+    def test_default_max_in_flight(self):
+        scheduler = FairShareScheduler(default_max_in_flight=3)
+        self.assertEqual(Counter(scheduler.schedule({1: 10, 2: 10}, {2: 1}, 10)), {1: 3, 2: 2})
+
+    def test_empty_queue_resets_deficit(self):
+        scheduler = FairShareScheduler(weights={1: 1, 2: 0.5})
+        scheduler.schedule({1: 5, 2: 5}, {}, 1)
+        scheduler.schedule({1: 5, 2: 5}, {}, 1)
+        self.assertEqual(scheduler.deficits.get(2), 0.5)
+
+        scheduler.schedule({1: 5}, {}, 1)
+        self.assertNotIn(2, scheduler.deficits)
+        # Вернувшийся партнёр начинает с нуля, а не с накопленного кредита
+        self.assertEqual(scheduler.schedule({1: 5, 2: 5}, {}, 1), [1])
+
+    def test_state_survives_dummy_cache(self):
+        # В DEBUG кэш - DummyCache: состояние хранится в памяти процесса
+        scheduler = get_fair_share_scheduler()
+        scheduler.deficits, scheduler.cursor = {2: 0.5}, 1
+        save_fair_share_scheduler(scheduler)
+        self.addCleanup(state_cache().clear)
+        restored = get_fair_share_scheduler()
+        self.assertEqual((restored.deficits, restored.cursor), ({2: 0.5}, 1))
+
+
+class OllamaSaturationTests(TestCase):
+
+    def make_client(self, **pool_kwargs):
+        pool = OllamaEndpointPool(['http://ollama-a/api/generate'], max_in_flight_per_endpoint=1, **pool_kwargs)
+        client = OllamaClient(pool.endpoints[0].url, read_timeout=0.05, endpoints=pool)
+        self.addCleanup(client.close)
+        client.session.post = mock.Mock()
+        pool.acquire()  # единственный слот занят другим запросом
+        return client
+
+    def test_busy_endpoints_raise_ollama_busy(self):
+        client = self.make_client()
+        with self.assertRaises(OllamaBusy):
+            client._send({'prompt': 'x'})
+        client.session.post.assert_not_called()
+
+    def test_all_endpoints_down_raise_ollama_unavailable(self):
+        client = self.make_client(failure_threshold=1)
+        client.endpoints.endpoints[0].down_until = float('inf')
+        with self.assertRaises(OllamaUnavailable):
+            client._send({'prompt': 'x'})
+
+    def test_busy_is_not_a_breaker_failure(self):
+        breaker = mock.Mock(allow_request=mock.Mock(return_value=True))
+        with mock.patch('tributes.tasks.get_ollama_breaker', return_value=breaker), \
+                mock.patch('tributes.tasks.call_ollama_blocking', side_effect=OllamaBusy('busy')):
+            with self.assertRaises(OllamaBusy):
+                call_ollama({'prompt': 'x'})
+        breaker.record_failure.assert_not_called()
+
+    def test_busy_takes_retry_path(self):
+        tribute = make_tributes(make_memorial(), 1)[0]
+        lease_token = tribute.claim_ai_lease()
+        with mock.patch('tributes.tasks.get_ollama_breaker', return_value=None), \
+                mock.patch('tributes.tasks.moderate_tribute_with_ai.apply_async') as apply_async:
+            handle_ollama_error(OllamaBusy('busy'), tribute, tribute.id, 0)
+        apply_async.assert_called_once_with(args=[tribute.id, 1], kwargs={'lease_token': lease_token}, countdown=30)
+        tribute.refresh_from_db()
+        self.assertEqual(tribute.ai_lease_token, lease_token)
+
+
+class OllamaEndpointPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch('tributes.ollama.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_pool(self, **kwargs):
+        kwargs.setdefault('max_in_flight_per_endpoint', 4)
+        pool = OllamaEndpointPool(['http://ollama-a', 'http://ollama-b'], **kwargs)
+        return pool, pool.endpoints[0], pool.endpoints[1]
+
+    def serve(self, pool, endpoint, latency_ms):
+        self.assertIs(pool.acquire(exclude=[e for e in pool.endpoints if e is not endpoint], timeout=0), endpoint)
+        pool.release(endpoint, latency_ms=latency_ms)
+
+    def test_prefers_lowest_latency_times_load(self):
+        pool, fast, slow = self.make_pool()
+        self.serve(pool, fast, 100)
+        self.serve(pool, slow, 300)
+
+        # 100 * 1 < 300, затем 100 * 2 < 300, затем 100 * 3 == 300 - выигрывает менее загруженный
+        self.assertEqual([pool.acquire(timeout=0) for _ in range(3)], [fast, fast, slow])
+
+    def test_max_in_flight_per_endpoint(self):
+        pool, first, second = self.make_pool(max_in_flight_per_endpoint=1)
+        self.assertEqual({pool.acquire(timeout=0), pool.acquire(timeout=0)}, {first, second})
+        self.assertIsNone(pool.acquire(timeout=0))
+        pool.release(first, latency_ms=50)
+        self.assertIs(pool.acquire(timeout=0), first)
+
+    def test_failure_threshold_marks_endpoint_down(self):
+        pool, flaky, spare = self.make_pool(failure_threshold=2, down_seconds=30)
+        self.serve(pool, flaky, 100)
+        self.serve(pool, spare, 500)
+
+        pool.acquire(timeout=0)
+        pool.release(flaky, failed=True)
+        self.assertIs(pool.acquire(timeout=0), flaky)  # одной ошибки мало
+        pool.release(flaky, failed=True)
+        self.assertEqual(flaky.down_until, self.now + 30)
+        self.assertIs(pool.acquire(timeout=0), spare)
+
+    def test_success_resets_consecutive_failures(self):
+        pool, flaky, _ = self.make_pool(failure_threshold=2)
+        for failed in (True, False, True):
+            pool.acquire(exclude=[pool.endpoints[1]], timeout=0)
+            pool.release(flaky, latency_ms=100, failed=failed)
+        self.assertEqual((flaky.consecutive_failures, flaky.down_until), (1, 0.0))
+
+    def test_down_endpoint_returns_after_down_seconds(self):
+        pool, flaky, spare = self.make_pool(failure_threshold=1, down_seconds=30)
+        self.serve(pool, flaky, 100)
+        self.serve(pool, spare, 500)
+        pool.acquire(timeout=0)
+        pool.release(flaky, failed=True)
+
+        self.now += 29
+        self.assertIs(pool.acquire(timeout=0), spare)
+        self.now += 2
+        self.assertIs(pool.acquire(timeout=0), flaky)
+
+    def test_all_down_falls_back_to_earliest(self):
+        pool, first, second = self.make_pool(failure_threshold=1, down_seconds=30)
+        for endpoint in (first, second):
+            self.assertIs(pool.acquire(exclude=[e for e in pool.endpoints if e is not endpoint], timeout=0), endpoint)
+            pool.release(endpoint, failed=True)
+            self.now += 5
+        self.assertTrue(pool.all_down())
+        self.assertIs(pool.acquire(timeout=0), first)
+
+    def test_idle_endpoint_is_probed_again(self):
+        pool, fast, slow = self.make_pool(probe_interval_seconds=60)
+        self.serve(pool, fast, 100)
+        self.serve(pool, slow, 5000)
+        self.assertIs(pool.acquire(timeout=0), fast)
+        pool.release(fast, latency_ms=100)
+
+        # Медленный сервер давно не получал запросов - его оценка устарела
+        self.now += 61
+        self.serve(pool, fast, 100)
+        self.assertIs(pool.acquire(timeout=0), slow)
+
+
+class CeleryAndAsyncVerdictParityTests(TransactionTestCase):
+    """
+    Celery-задача и AsyncModerationRunner сохраняют одинаковый вердикт для одного
+    ответа Ollama. TransactionTestCase: раннер работает с БД из своего пула потоков.
+    """
+
+    REPLY = 'Format {"example": true}. {"verdict": "approved_ai", "confidence": 0.93, "flags": [], "reasoning": "ok"}'
+
+    def setUp(self):
+        for target in ('tributes.tasks.get_verdict_cache', 'tributes.tasks.get_ollama_breaker',
+                       'tributes.async_runner.get_ollama_breaker'):
+            patcher = mock.patch(target, return_value=None)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.memorial = make_memorial()
+
+    def moderate_with_celery(self, tribute):
+        with mock.patch('tributes.tasks.get_ollama_client', return_value=fake_ollama_client(self.REPLY)):
+            moderate_tribute_with_ai(tribute.id)
+
+    def moderate_with_runner(self, tribute):
+        import httpx
+
+        def handler(request):
+            if json.loads(request.content).get('stream'):
+                body = ''.join(json.dumps(chunk) + '\n' for chunk in stream_chunks(self.REPLY))
+                return httpx.Response(200, content=body.encode())
+            return httpx.Response(200, json={'response': self.REPLY, 'eval_count': 10})
+
+        runner = AsyncModerationRunner(db_threads=1)
+        self.addCleanup(runner._db_pool.shutdown)
+
+        async def moderate():
+            async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+                runner._client = client
+                await runner._moderate(tribute.id, lease_token)
+
+        lease_token = tribute.claim_ai_lease()
+        asyncio.run(moderate())
+
+    def saved_verdict(self, tribute):
+        tribute.refresh_from_db()
+        result = dict(tribute.ai_moderation_result)
+        result.pop('llm_stats', None)
+        return tribute.status, tribute.ai_verdict, tribute.ai_confidence, result
+
+    def test_same_verdict(self):
+        for stream in (True, False):
+            with self.subTest(stream=stream), mock.patch.dict(settings.AI_MODERATION_SETTINGS, stream_responses=stream):
+                celery_tribute, runner_tribute = make_tributes(self.memorial, 2)
+                self.moderate_with_celery(celery_tribute)
+                self.moderate_with_runner(runner_tribute)
+                self.assertEqual(self.saved_verdict(celery_tribute)[1], 'approved_ai')
+                self.assertEqual(self.saved_verdict(celery_tribute), self.saved_verdict(runner_tribute))
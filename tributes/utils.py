@@ -1,9 +1,9 @@
 import json
-import requests
 import re
 from django.conf import settings
 from django.utils import timezone
 from .models import Tribute
+from .ollama import get_ollama_client
 import logging
 
 logger = logging.getLogger(__name__)
@@ -32,13 +32,9 @@ Analyze: "{tribute.text[:1500]}"<|end|>
             "options": {"temperature": 0.1, "num_predict": 250}
         }
         
-        response = requests.post(
-            getattr(settings, 'OLLAMA_API_URL', 'http://localhost:11434/api/generate'),
-            json=data,
-            timeout=60
-        )
+        result = get_ollama_client().generate(data)
         
-        ai_response = response.json().get('response', '').strip()
+        ai_response = result.get('response', '').strip()
         logger.info(f"AI response for {tribute_id}: {ai_response[:200]}...")
         
         # Парсинг
@@ -78,8 +74,8 @@ Analyze: "{tribute.text[:1500]}"<|end|>
         tribute.save()
         
         # Логируем
-        from audits.models import AuditLog
-        AuditLog.objects.create(
+        from audits import sink
+        sink.log(
             actor_type='ai_moderator',
             action=action,
             target_type='tribute',
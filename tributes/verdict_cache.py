@@ -0,0 +1,123 @@
+import copy
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+import logging
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE_RE = re.compile(r'\s+')
+# Пунктуация и эмодзи по краям не влияют на вердикт: "Mein Beileid!" = "mein beileid"
+_EDGE_PUNCTUATION = ' .,;:!?…-–—"\'«»„“”()[]🙏❤️🕯️🌹'
+
+
+def normalize_tribute_text(text):
+    """Нормализует текст для ключа кэша: NFKC, регистр, пробелы, пунктуация по краям."""
+    normalized = unicodedata.normalize('NFKC', text).casefold()
+    normalized = _WHITESPACE_RE.sub(' ', normalized)
+    return normalized.strip(_EDGE_PUNCTUATION)
+
+
+def verdict_cache_key(text, name_context, model, prompt_version):
+    """
+    Ключ кэша: хэш нормализованного текста + контекст анализа имён + модель и версия промпта.
+    При смене модели или промпта старые записи просто перестают находиться.
+    """
+    raw = json.dumps(
+        [normalize_tribute_text(text), name_context, model, prompt_version],
+        ensure_ascii=False
+    )
+    return 'ai_verdict:' + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class VerdictCache:
+    """
+    Кэш результатов ИИ-модерации: LRU в памяти процесса с TTL
+    и, опционально, общий кэш Django (Redis в продакшене) вторым уровнем.
+    Попадания и промахи - метрика everest_ai_verdict_cache_events в /metrics.
+    """
+
+    def __init__(self, max_entries=10000, ttl_seconds=86400, use_django_cache=True):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.use_django_cache = use_django_cache
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Возвращает копию сохранённого результата или None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    metrics.record_verdict_cache('hit')
+                    return copy.deepcopy(value)
+                del self._entries[key]
+                metrics.record_verdict_cache('expired')
+
+        if self.use_django_cache:
+            value = cache.get(key)
+            if value is not None:
+                self._store_local(key, value)
+                metrics.record_verdict_cache('shared_hit')
+                return copy.deepcopy(value)
+
+        metrics.record_verdict_cache('miss')
+        return None
+
+    def set(self, key, value):
+        value = copy.deepcopy(value)
+        self._store_local(key, value)
+        if self.use_django_cache:
+            cache.set(key, value, timeout=self.ttl_seconds)
+        metrics.record_verdict_cache('store')
+
+    def _store_local(self, key, value):
+        evicted = 0
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            metrics.record_verdict_cache('eviction', evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_verdict_cache = None
+_verdict_cache_lock = threading.Lock()
+
+
+def get_verdict_cache():
+    """
+    Возвращает кэш вердиктов процесса или None, если кэш выключен в настройках.
+    """
+    global _verdict_cache
+
+    cache_settings = settings.AI_MODERATION_SETTINGS.get('verdict_cache', {})
+    if not cache_settings.get('enabled', False):
+        return None
+
+    if _verdict_cache is None:
+        with _verdict_cache_lock:
+            if _verdict_cache is None:
+                _verdict_cache = VerdictCache(
+                    max_entries=cache_settings.get('max_entries', 10000),
+                    ttl_seconds=cache_settings.get('ttl_seconds', 86400),
+                    use_django_cache=cache_settings.get('use_django_cache', True),
+                )
+    return _verdict_cache
@@ -3,7 +3,7 @@ from django.utils import timezone
 from memorials.models import FamilyInvite, Memorial
 from .models import Tribute
 from assets.models import MediaAsset
-from audits.models import AuditLog
+from audits import sink
 from django.utils import translation
 
 def family_full_view(request, short_code):
@@ -49,7 +49,7 @@ def family_full_view(request, short_code):
                 }
             
                 # Логируем модерацию
-                AuditLog.objects.create(
+                sink.log(
                     actor_type='family',
                     actor_id=None,
                     action='moderate_tribute',
@@ -62,7 +62,9 @@ def family_full_view(request, short_code):
                         'family_invite_id': invite.id,
                         'family_email': invite.email,
                         'token_preview': f"{token[:8]}...",
-                    }
+                    },
+                    partner_id=memorial.partner_id,
+                    memorial_id=memorial.id,
                 )
                 
                 tribute.save()
@@ -71,7 +73,7 @@ def family_full_view(request, short_code):
                 return redirect(f'{request.path}?token={token}')
         
         # Логируем доступ
-        AuditLog.objects.create(
+        sink.log(
             actor_type='family',
             actor_id=None,
             action='access_family_interface',
@@ -81,7 +83,9 @@ def family_full_view(request, short_code):
                 'family_invite_id': invite.id,
                 'family_email': invite.email,
                 'token_preview': f"{token[:8]}...",
-            }
+            },
+            partner_id=memorial.partner_id,
+            memorial_id=memorial.id,
         )
         
         # Получаем медиа-файлы мемориала